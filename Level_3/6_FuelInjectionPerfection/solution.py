@@ -1,5 +1,10 @@
+import collections
+import os
 import unittest
 
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
 
 def reduce_to_one(n):
     """
@@ -20,7 +25,7 @@ def reduce_to_one(n):
             # Divide the entire group of fuel pellets by 2 (due to the destructive energy released when a quantum
             # antimatter pellet is cut in half, the safety controls will only allow this to happen if there is an even
             # number of pellets)
-            n = n / 2
+            n = n // 2
             operations_sequence.append("DIVIDE")
 
         # Use bitwise "and" to make it easier to work out when we need to remove a pellet
@@ -39,6 +44,190 @@ def reduce_to_one(n):
     return operation_count, path, operations_sequence
 
 
+# Operation codes used by the compact path encoding. Each code fits in 2 bits, so four operations pack into one byte.
+DIVIDE = 0
+REMOVE = 1
+ADD = 2
+OPERATION_NAMES = ("DIVIDE", "REMOVE", "ADD")
+
+
+def next_operation(n):
+    """
+    Choose the next operation on the way from 'n' to `1`. This is the same rule used by reduce_to_one().
+
+    :param n: an integer value greater than 1
+    :return: one of DIVIDE, REMOVE, or ADD
+    """
+    if n & 1 == 0:
+        return DIVIDE
+
+    if (n == 3) or (n & (n + 1)) > ((n - 2) & (n - 1)):
+        return REMOVE
+
+    return ADD
+
+
+def apply_operation(n, operation):
+    """
+    Apply a single operation code to a pellet count.
+
+    :param n: an integer value
+    :param operation: one of DIVIDE, REMOVE, or ADD
+    :return: the pellet count after applying the operation
+    """
+    if operation == DIVIDE:
+        return n >> 1
+
+    if operation == REMOVE:
+        return n - 1
+
+    return n + 1
+
+
+class ReductionPath(object):
+    """
+    A compact representation of the path from 'n' to `1`.
+
+    Instead of keeping a list of operation names and a list of every intermediate big integer, only the starting value
+    and the operations are stored. Operations are packed 2 bits each into a bytearray (four per byte), and the
+    intermediate values are regenerated on request by replaying the operations from the starting value.
+    """
+    __slots__ = ("start", "length", "packed")
+
+    def __init__(self, start, length, packed):
+        """
+        :param start: the starting pellet count
+        :param length: the number of operations in the path
+        :param packed: the operations, packed 2 bits each, least significant bits first
+        """
+        self.start = start
+        self.length = length
+        self.packed = bytearray(packed)
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        if not isinstance(other, ReductionPath):
+            return NotImplemented
+
+        return (self.start, self.length, self.packed) == (other.start, other.length, other.packed)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return "ReductionPath(start=%d, length=%d)" % (self.start, self.length)
+
+    def operation(self, i):
+        """
+        Return the operation code at position 'i' without decoding the rest of the path.
+        """
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError("operation index out of range")
+
+        return (self.packed[i >> 2] >> ((i & 3) << 1)) & 3
+
+    def operations(self):
+        """
+        Generate the operation codes in order.
+        """
+        remaining = self.length
+        for byte in self.packed:
+            for _ in range(min(4, remaining)):
+                yield byte & 3
+                byte >>= 2
+            remaining -= 4
+
+    def operation_names(self):
+        """
+        Generate the operation names ('DIVIDE', 'REMOVE', 'ADD') in order.
+        """
+        for operation in self.operations():
+            yield OPERATION_NAMES[operation]
+
+    def values(self):
+        """
+        Lazily replay the path, generating the starting value followed by every intermediate value down to `1`.
+        """
+        n = self.start
+        yield n
+
+        for operation in self.operations():
+            n = apply_operation(n, operation)
+            yield n
+
+    def value_at(self, i):
+        """
+        Return the value after the first 'i' operations, replaying only as much of the path as needed.
+        """
+        if i < 0 or i > self.length:
+            raise IndexError("value index out of range")
+
+        n = self.start
+        for position, operation in enumerate(self.operations()):
+            if position == i:
+                break
+            n = apply_operation(n, operation)
+
+        return n
+
+    def decode(self):
+        """
+        Expand the path into the same (operation count, path, operations sequence) triple returned by reduce_to_one().
+        """
+        return self.length, list(self.values()), list(self.operation_names())
+
+    def to_bytes(self):
+        """
+        Return the packed operations as immutable bytes, e.g., for storing on disk alongside the starting value.
+        """
+        return bytes(self.packed)
+
+    @classmethod
+    def from_bytes(cls, start, length, data):
+        """
+        Rebuild a path from a starting value, an operation count, and the bytes returned by to_bytes().
+        """
+        if len(data) != (length + 3) >> 2:
+            raise ValueError("expected %d packed bytes for %d operations" % ((length + 3) >> 2, length))
+
+        return cls(start, length, data)
+
+
+def encode_reduction_path(n):
+    """
+    Return the path from 'n' to `1` as a compact ReductionPath. This makes the same choices as reduce_to_one(), but
+    does not keep the intermediate values.
+
+    :param n: a positive integer value
+    :return: a ReductionPath
+    """
+    start = n
+    packed = bytearray()
+    current_byte = 0
+    length = 0
+
+    while n > 1:
+        operation = next_operation(n)
+        n = apply_operation(n, operation)
+
+        current_byte |= operation << ((length & 3) << 1)
+        length += 1
+
+        if length & 3 == 0:
+            packed.append(current_byte)
+            current_byte = 0
+
+    if length & 3:
+        packed.append(current_byte)
+
+    return ReductionPath(start, length, packed)
+
+
 def solution(n):
     """
     Minions dump pellets in bulk into the fuel intake. This function figures out the most efficient way to sort and
@@ -48,22 +237,182 @@ def solution(n):
     :param n: a positive integer as a string representing the number of pellets dumped in bulk
     :return: the minimum number of operations needed to transform the number of pellets to 1
     """
+    n = parse_pellet_count(n)
+
+    if not n:
+        return 0
+
+    count, _, _ = reduce_to_one(n)
+
+    return count
+
+
+def parse_pellet_count(n):
+    """
+    Convert the string given to solution() into a pellet count.
+
+    :param n: a positive integer as a string representing the number of pellets dumped in bulk
+    :return: the pellet count as an integer, or None if the string is not a valid pellet count
+    """
     try:
         if len(n) > 309:
-            return 0
+            return None
 
-        n = int(n)
+        return int(n)
     except ValueError:
-        return 0
+        return None
     except TypeError:
-        return 0
+        return None
 
-    if n == 0:
-        return 0
 
-    count, _, _ = reduce_to_one(n)
+def count_operations(n):
+    """
+    Return the minimum number of operations to reduce 'n' to `1`, without recording the path.
 
-    return count
+    :param n: a positive integer value
+    :return: the minimum number of operations
+    """
+    operation_count = 0
+
+    while n > 1:
+        n = apply_operation(n, next_operation(n))
+        operation_count += 1
+
+    return operation_count
+
+
+def count_operations_chunk(pellet_counts):
+    """
+    Worker function for solution_batch(): count the operations for each pellet count in a chunk.
+    """
+    return [count_operations(n) for n in pellet_counts]
+
+
+SMALL_TABLE_SIZE = 1 << 20
+
+_operation_count_tables = {}
+
+
+def operation_count_table(size=SMALL_TABLE_SIZE):
+    """
+    Return a table of the minimum number of operations for every pellet count below 'size'.
+
+    The table is filled by dynamic programming rather than by the greedy rule in next_operation(), so it doubles as a
+    check on that rule. An even count is always halved, and an odd count 2k+1 goes to either 2k or 2k+2 and is then
+    halved, so:
+
+        ops(2k)   = ops(k) + 1
+        ops(2k+1) = min(ops(k), ops(k+1)) + 2
+
+    Tables are built once per size and kept for every later call in the process. Each entry is a single byte, so the
+    default table of 2^20 entries takes 1 MB.
+
+    :param size: one more than the largest pellet count in the table
+    :return: an array of operation counts indexed by pellet count
+    """
+    table = _operation_count_tables.get(size)
+
+    if table is None:
+        table = array('B', [0]) * max(size, 2)
+
+        for n in range(2, size):
+            half = n >> 1
+            if n & 1:
+                table[n] = min(table[half], table[half + 1]) + 2
+            else:
+                table[n] = table[half] + 1
+
+        _operation_count_tables[size] = table
+
+    return table
+
+
+def solution_batch(pellet_counts, max_workers=None, chunk_size=4096, table_size=SMALL_TABLE_SIZE):
+    """
+    Solve a large batch of inputs, yielding the same values solution() would return, in input order.
+
+    Each chunk of input strings is parsed once, in this process. Pellet counts below 'table_size' are answered here from
+    operation_count_table(); only the larger counts are sent, as ints, to a process pool, which is started once the
+    first large count is seen. At most two chunks per worker are in flight at any time, so the input can be an
+    arbitrarily long iterator.
+
+    :param pellet_counts: an iterable of positive integers as strings, as accepted by solution()
+    :param max_workers: the number of worker processes; defaults to the number of CPUs
+    :param chunk_size: the number of inputs handled together
+    :param table_size: one more than the largest pellet count answered from the table
+    :return: a generator of operation counts
+    """
+    table = operation_count_table(table_size)
+    executor = None
+    pending = collections.deque()
+    max_pending = 2 * (max_workers or os.cpu_count() or 1)
+
+    try:
+        chunk = []
+        for pellet_count in pellet_counts:
+            chunk.append(pellet_count)
+
+            if len(chunk) == chunk_size:
+                counts = [parse_pellet_count(pellet_count) for pellet_count in chunk]
+                if executor is None and _needs_pool(counts, table_size):
+                    executor = ProcessPoolExecutor(max_workers)
+                pending.append(_submit_chunk(executor, counts, table))
+                chunk = []
+
+                while len(pending) > max_pending:
+                    for result in _finish_chunk(pending.popleft()):
+                        yield result
+
+        if chunk:
+            counts = [parse_pellet_count(pellet_count) for pellet_count in chunk]
+            if executor is None and _needs_pool(counts, table_size):
+                executor = ProcessPoolExecutor(max_workers)
+            pending.append(_submit_chunk(executor, counts, table))
+
+        while pending:
+            for result in _finish_chunk(pending.popleft()):
+                yield result
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _needs_pool(counts, table_size):
+    for n in counts:
+        if n is not None and n >= table_size:
+            return True
+
+    return False
+
+
+def _submit_chunk(executor, counts, table):
+    results = []
+    large_positions = []
+    large_counts = []
+
+    for n in counts:
+        if n is None or n < 1:
+            results.append(0)
+        elif n < len(table):
+            results.append(table[n])
+        else:
+            results.append(None)
+            large_positions.append(len(results) - 1)
+            large_counts.append(n)
+
+    future = executor.submit(count_operations_chunk, large_counts) if large_counts else None
+
+    return results, large_positions, future
+
+
+def _finish_chunk(submitted_chunk):
+    results, large_positions, future = submitted_chunk
+
+    if future is not None:
+        for position, count in zip(large_positions, future.result()):
+            results[position] = count
+
+    return results
 
 
 def list_to_string(s):
@@ -205,3 +554,65 @@ class SequenceOfOperationsTests(unittest.TestCase):
 
         _, _, operations = reduce_to_one(fuel_pellets)
         self.assertEqual(expected_operations, operations)
+
+
+class ReductionPathTests(unittest.TestCase):
+
+    def test_15_pellets_compact_path(self):
+        path = encode_reduction_path(15)
+
+        self.assertEqual(5, len(path))
+        self.assertEqual([15, 16, 8, 4, 2, 1], list(path.values()))
+        self.assertEqual(['ADD', 'DIVIDE', 'DIVIDE', 'DIVIDE', 'DIVIDE'], list(path.operation_names()))
+        self.assertEqual(2, len(path.to_bytes()))
+
+    def test_1_pellet_compact_path(self):
+        path = encode_reduction_path(1)
+
+        self.assertEqual(0, len(path))
+        self.assertEqual([1], list(path.values()))
+        self.assertEqual(b'', path.to_bytes())
+
+    def test_decode_matches_reduce_to_one(self):
+        for fuel_pellets in [2, 3, 4, 15, 157, 881442566340248816440069375573, int('9' * 309)]:
+            self.assertEqual(reduce_to_one(fuel_pellets), encode_reduction_path(fuel_pellets).decode())
+
+    def test_random_access(self):
+        path = encode_reduction_path(157)
+        expected_path = [157, 156, 78, 39, 40, 20, 10, 5, 4, 2, 1]
+
+        self.assertEqual(ADD, path.operation(3))
+        self.assertEqual(DIVIDE, path.operation(-1))
+        self.assertEqual(expected_path[7], path.value_at(7))
+        self.assertEqual(1, path.value_at(len(path)))
+        self.assertRaises(IndexError, path.operation, len(path))
+
+    def test_bytes_round_trip(self):
+        path = encode_reduction_path(881442566340248816440069375573)
+        restored = ReductionPath.from_bytes(path.start, len(path), path.to_bytes())
+
+        self.assertEqual(path, restored)
+        self.assertEqual(137, len(restored))
+        self.assertRaises(ValueError, ReductionPath.from_bytes, path.start, len(path) + 4, path.to_bytes())
+
+
+class BatchTests(unittest.TestCase):
+
+    def test_table_matches_greedy_rule(self):
+        table = operation_count_table(1 << 12)
+
+        for n in range(1, 1 << 12):
+            self.assertEqual(count_operations(n), table[n])
+
+    def test_small_batch_uses_table(self):
+        fuel_pellets = ['15', '4', '0', '157', 'eleventy-six', None]
+        expected = [5, 2, 0, 10, 0, 0]
+
+        self.assertEqual(expected, list(solution_batch(fuel_pellets, chunk_size=4, table_size=1 << 10)))
+
+    def test_large_batch_matches_solution(self):
+        fuel_pellets = ['881442566340248816440069375573', '15', '9' * 309, '4', '9' * 310, str(1 << 40), '157']
+        expected = [solution(n) for n in fuel_pellets]
+
+        results = solution_batch(fuel_pellets, max_workers=2, chunk_size=3, table_size=1 << 10)
+        self.assertEqual(expected, list(results))
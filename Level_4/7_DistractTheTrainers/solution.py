@@ -1,5 +1,14 @@
+import collections
+import functools
+import itertools
+import math
+import operator
+import random
+import time
 import unittest
 
+from itertools import repeat
+
 
 def is_power_of_two(n):
     """
@@ -147,7 +156,1446 @@ def distract_the_trainers(graph):
     return distracted_trainers
 
 
-def solution(banana_list):
+def popcount(n):
+    """
+    Count the bits set to 1 in a non-negative integer.
+    """
+    return bin(n).count("1")
+
+
+def lowest_bit_index(n):
+    """
+    Return the index of the lowest bit set to 1 in a positive integer.
+    """
+    return (n & -n).bit_length() - 1
+
+
+def iter_bits(n):
+    """
+    Generate the indexes of the bits set to 1 in a non-negative integer, lowest first.
+
+    Searching the binary string skips runs of zero bits at C speed, so the cost is proportional to the number of bits
+    set rather than to the width of the integer.
+    """
+    bits = bin(n)[:1:-1]  # least significant bit first
+    i = bits.find("1")
+
+    while i >= 0:
+        yield i
+        i = bits.find("1", i + 1)
+
+
+class BitsetGraph(object):
+    """
+    An undirected graph where each row of the adjacency matrix is stored as a Python integer. Bit j of rows[i] is set
+    when nodes i and j are connected. Compared to the adjacency list used by create_wrestling_tournament(), a row costs
+    one bit per node, and neighbourhoods can be intersected with a single '&'.
+    """
+
+    def __init__(self, rows):
+        """
+        :param rows: a list of integer bitsets, one per node
+        """
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __eq__(self, other):
+        if not isinstance(other, BitsetGraph):
+            return NotImplemented
+
+        return self.rows == other.rows
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def degree(self, node):
+        return popcount(self.rows[node])
+
+    def neighbors(self, node):
+        return list(iter_bits(self.rows[node]))
+
+    def to_adjacency_list(self):
+        """
+        Convert to the adjacency list representation returned by create_wrestling_tournament().
+        """
+        return {node: self.neighbors(node) for node in range(len(self.rows))}
+
+    @classmethod
+    def from_adjacency_list(cls, graph):
+        rows = [0] * len(graph)
+
+        for node, neighbors in graph.items():
+            for neighbor in neighbors:
+                rows[node] |= 1 << neighbor
+
+        return cls(rows)
+
+
+def create_bitset_tournament(banana_list):
+    """
+    Create the same wrestling tournament graph as create_wrestling_tournament(), stored as a BitsetGraph.
+
+    Most pairs of trainers loop, so rather than testing every pair, each row starts from every trainer and takes away
+    the few who don't loop with that trainer, as found by non_looping_counts(). A row is worked out once per distinct
+    banana count and shared by every trainer holding it, so building the graph costs about one pass over the bits of
+    each distinct row. Banana counts of NON_LOOPING_MAX_COUNT or more can't be factored that way, and are tested pair
+    by pair with pairwise_tournament_rows() instead.
+
+    :param banana_list: specifies how many bananas each trainer has
+    :return: a BitsetGraph representing the simultaneous wrestling matches
+    """
+    if not _counts_can_be_factored(banana_list):
+        return BitsetGraph(pairwise_tournament_rows(banana_list))
+
+    rows = _TournamentRows(banana_list)
+
+    return BitsetGraph([rows.row(banana_count) for banana_count in banana_list])
+
+
+def pairwise_tournament_rows(banana_list):
+    """
+    Build the rows of the create_bitset_tournament() graph by testing every pair of trainers.
+
+    Rather than testing each pair in a Python loop, each row is computed against all later trainers at once by
+    chaining built-in map() calls, so the per-pair work runs in C. The gcd is avoided altogether: with s = a + b, the
+    result s / gcd(a, b) is a power of 2 exactly when the odd part of s divides a (and therefore b too). The rows of
+    flags for the upper triangle are then transposed with zip() to fill in the lower triangle, and each full row is
+    turned into an integer bitset with a single int() call.
+
+    :param banana_list: specifies how many bananas each trainer has
+    :return: a list of integer bitsets, one per trainer
+    """
+    upper_flags = []
+
+    for i, banana_count in enumerate(banana_list):
+        later_counts = banana_list[i + 1:]
+        sums = list(map(operator.add, repeat(banana_count, len(later_counts)), later_counts))
+        lowest_set_bits = map(operator.and_, sums, map(operator.neg, sums))
+        odd_parts = map(operator.floordiv, sums, lowest_set_bits)
+
+        # 1 where the pair loops, i.e., where the odd part of the sum does NOT divide the banana count
+        loops = map(bool, map(operator.mod, repeat(banana_count, len(later_counts)), odd_parts))
+        upper_flags.append(bytes(i + 1) + bytes(loops))
+
+    rows = []
+    for i, lower_flags in enumerate(zip(*upper_flags)):
+        flags = bytes(map(operator.or_, lower_flags, upper_flags[i]))
+        rows.append(int(flags.translate(_BINARY_DIGITS)[::-1], 2))
+
+    return rows
+
+
+# Maps flag bytes to binary digits, so that a row of flags can be parsed with int(digits, 2)
+_BINARY_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+
+
+def tournament_rows(banana_list):
+    """
+    Generate the rows of the create_bitset_tournament() graph one at a time, each as an integer bitset.
+
+    Each row is worked out the first time a trainer with its banana count comes up, so the caller can stop at any row
+    and only pays for the distinct counts before it. A trainer never loops with themself (2a / gcd(a, a) = 2), so no
+    bit is set on the diagonal.
+
+    :param banana_list: specifies how many bananas each trainer has
+    :return: a generator of integer bitsets, one per trainer
+    """
+    rows = _TournamentRows(banana_list, batch=False)
+
+    for banana_count in banana_list:
+        yield rows.row(banana_count)
+
+
+# Primes below this are found by gcd with their product, so any banana count below its square is fully factored
+SMALL_PRIME_LIMIT = 1 << 15
+
+# non_looping_counts() handles banana counts below this, which includes every count solution() accepts
+NON_LOOPING_MAX_COUNT = SMALL_PRIME_LIMIT * SMALL_PRIME_LIMIT
+
+# The numbers small_prime_gcds() divides the product of the small primes by at once
+SMALL_PRIME_GCD_BATCH = 64
+
+
+def _counts_can_be_factored(banana_list):
+    return all(0 < banana_count < NON_LOOPING_MAX_COUNT for banana_count in banana_list)
+
+
+@functools.lru_cache(maxsize=None)
+def _small_prime_tables():
+    """
+    :return: the smallest prime factor of each number below SMALL_PRIME_LIMIT, and a product tree of the odd primes
+             below it: the primes, then the products of pairs of them, of pairs of those products, and so on up to a
+             single product of them all, as a list of levels
+    """
+    smallest_factor = list(range(SMALL_PRIME_LIMIT))
+    for candidate in range(3, math.isqrt(SMALL_PRIME_LIMIT) + 1, 2):
+        if smallest_factor[candidate] == candidate:
+            for multiple in range(candidate * candidate, SMALL_PRIME_LIMIT, 2 * candidate):
+                if smallest_factor[multiple] == multiple:
+                    smallest_factor[multiple] = candidate
+
+    levels = [[candidate for candidate in range(3, SMALL_PRIME_LIMIT, 2) if smallest_factor[candidate] == candidate]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([functools.reduce(operator.mul, level[i:i + 2]) for i in range(0, len(level), 2)])
+
+    return smallest_factor, levels
+
+
+def small_prime_gcds(numbers):
+    """
+    Find the gcd of each number with the product of the odd primes below SMALL_PRIME_LIMIT, which has about 47,000
+    bits. Dividing it by one short number at a time costs as much as dividing it by the product of dozens of them, so
+    the numbers are taken SMALL_PRIME_GCD_BATCH at a time, and each gcd is found from the remainder by their product.
+
+    :param numbers: positive integers
+    :return: a list of the gcds, in the same order
+    """
+    primes_product = _small_prime_tables()[1][-1][0]
+    gcds = []
+
+    for start in range(0, len(numbers), SMALL_PRIME_GCD_BATCH):
+        batch = numbers[start:start + SMALL_PRIME_GCD_BATCH]
+        remainder = primes_product % math.prod(batch)
+        gcds += [math.gcd(remainder % number, number) for number in batch]
+
+    return gcds
+
+
+def odd_divisors(n, small_prime_gcd=None):
+    """
+    Find the odd divisors of a positive integer below NON_LOOPING_MAX_COUNT.
+
+    The gcd of n with the product of the odd primes below SMALL_PRIME_LIMIT is the product of the small primes that
+    divide n. While that is too large to split with a table of smallest prime factors, it is narrowed down a product
+    tree of the primes, following only the products that share a factor with n. What is left of n once the small
+    primes are divided out has no factor below SMALL_PRIME_LIMIT and is less than its square, so it is 1 or a prime.
+
+    :param n: a positive integer below NON_LOOPING_MAX_COUNT
+    :param small_prime_gcd: the gcd of n with the product of the odd primes below SMALL_PRIME_LIMIT, if it is already
+                            known from small_prime_gcds()
+    :return: the odd divisors of n, in no particular order
+    """
+    rest = n // (n & -n)
+    smallest_factor, levels = _small_prime_tables()
+    if small_prime_gcd is None:
+        small_prime_gcd = math.gcd(levels[-1][0], rest)
+    primes = []
+    stack = [(len(levels) - 1, 0, small_prime_gcd)]
+
+    while stack:
+        level, index, common = stack.pop()
+        if common < SMALL_PRIME_LIMIT:
+            while common > 1:  # each prime divides it once
+                primes.append(smallest_factor[common])
+                common //= smallest_factor[common]
+            continue
+        for child in range(2 * index, min(2 * index + 2, len(levels[level - 1]))):
+            stack.append((level - 1, child, math.gcd(levels[level - 1][child], common)))
+
+    divisors = [1]
+    for prime in primes:
+        powers = []
+        while rest % prime == 0:
+            rest //= prime
+            powers.append(prime ** (len(powers) + 1))
+        divisors += [divisor * power for divisor in divisors for power in powers]
+
+    if rest > 1:
+        divisors += [divisor * rest for divisor in divisors]
+
+    return divisors
+
+
+def non_looping_counts(banana_count, max_count, small_prime_gcd=None):
+    """
+    Find the banana counts up to max_count that banana_count does not loop with, other than itself.
+
+    Two trainers stop wrestling when (a + b) / gcd(a, b) is a power of 2. With g = gcd(a, b), a = g * x and
+    b = g * y, that means x + y = 2^k, where x and y are odd since they have no common factor. So every opponent b
+    that stops comes from an odd divisor x of a and a power of two 2^k > x, as b = (a / x) * (2^k - x), and there are
+    only a few dozen of them however many trainers there are.
+
+    :param banana_count: a positive integer below NON_LOOPING_MAX_COUNT
+    :param max_count: the largest banana count to return
+    :param small_prime_gcd: passed on to odd_divisors()
+    :return: a list of banana counts, in no particular order
+    """
+    counts = []
+
+    for x in odd_divisors(banana_count, small_prime_gcd):
+        scale = banana_count // x
+        power = 1 << x.bit_length()
+        while scale * (power - x) <= max_count:
+            if power - x != x:
+                counts.append(scale * (power - x))
+            power <<= 1
+
+    return counts
+
+
+class _TournamentRows(object):
+    """
+    The rows of the tournament graph, each worked out the first time it is asked for and shared by every trainer with
+    the same banana count: every trainer, less the ones holding a count from non_looping_counts() or the same count.
+    Banana counts of NON_LOOPING_MAX_COUNT or more are tested against every trainer with the same chained map() calls
+    as pairwise_tournament_rows() instead.
+    """
+
+    def __init__(self, banana_list, batch=True):
+        """
+        :param banana_list: specifies how many bananas each trainer has
+        :param batch: whether to find small_prime_gcds() for every distinct count up front, which is cheaper when most
+                      rows will be asked for
+        """
+        self.banana_list = banana_list
+        self.everyone = (1 << len(banana_list)) - 1
+        self.max_count = max(banana_list, default=0)
+        self.factored = _counts_can_be_factored(banana_list)
+        self.members = {}  # banana count -> the trainers holding it
+        self.holders = {}  # banana count -> the same trainers as a bitset, once needed
+        self.small_prime_gcds = {}
+        self.rows = {}
+
+        for trainer, banana_count in enumerate(banana_list):
+            self.members.setdefault(banana_count, []).append(trainer)
+
+        if self.factored and batch:
+            counts = list(self.members)
+            self.small_prime_gcds = dict(zip(counts, small_prime_gcds([count // (count & -count) for count in counts])))
+
+    def row(self, banana_count):
+        row = self.rows.get(banana_count)
+
+        if row is None:
+            if self.factored:
+                stopping = self._holders(banana_count)
+                small_prime_gcd = self.small_prime_gcds.get(banana_count)
+                for other_count in non_looping_counts(banana_count, self.max_count, small_prime_gcd):
+                    if other_count in self.members:
+                        stopping |= self._holders(other_count)
+                row = self.everyone & ~stopping
+            else:
+                trainer_count = len(self.banana_list)
+                sums = list(map(operator.add, repeat(banana_count, trainer_count), self.banana_list))
+                lowest_set_bits = map(operator.and_, sums, map(operator.neg, sums))
+                odd_parts = map(operator.floordiv, sums, lowest_set_bits)
+                loops = bytes(map(bool, map(operator.mod, repeat(banana_count, trainer_count), odd_parts)))
+                row = int(loops.translate(_BINARY_DIGITS)[::-1], 2)
+            self.rows[banana_count] = row
+
+        return row
+
+    def _holders(self, banana_count):
+        holders = self.holders.get(banana_count)
+
+        if holders is None:
+            holders = self.holders[banana_count] = sum(1 << trainer for trainer in self.members[banana_count])
+
+        return holders
+
+
+class DegreeBuckets(object):
+    """
+    Track the degree of every remaining node of a BitsetGraph, with nodes grouped into buckets by degree so that a
+    node of minimum degree (lowest index first) can be found without scanning the whole graph.
+
+    Each bucket is itself a bitset of nodes. Degrees are stored relative to a shared offset: removing a node lowers the
+    degree of each of its neighbours by one, which is done either by updating every neighbour, or by lowering the
+    offset and raising every non-neighbour back up, whichever touches fewer nodes. Dense tournament graphs therefore
+    cost about as little to update as sparse ones.
+    """
+
+    def __init__(self, graph):
+        self.rows = graph.rows
+        self.alive = (1 << len(self.rows)) - 1
+        self.alive_count = len(self.rows)
+        self.offset = 0
+        self.keys = [popcount(row) for row in self.rows]
+        self.buckets = {}
+
+        for node, key in enumerate(self.keys):
+            self.buckets[key] = self.buckets.get(key, 0) | (1 << node)
+
+        self.min_key = min(self.keys) if self.keys else 0
+
+    def __len__(self):
+        return self.alive_count
+
+    def degree(self, node):
+        return self.keys[node] + self.offset
+
+    def neighbors(self, node):
+        """
+        Return the remaining neighbours of a node as a bitset.
+        """
+        return self.rows[node] & self.alive
+
+    def min_degree_node(self):
+        """
+        Return the lowest-index remaining node of minimum degree.
+        """
+        while not self.buckets.get(self.min_key):
+            self.min_key += 1
+
+        return lowest_bit_index(self.buckets[self.min_key])
+
+    def min_degree_node_in(self, nodes):
+        """
+        Return the lowest-index node of minimum degree from a non-empty bitset of remaining nodes.
+        """
+        key = self.min_key
+        while True:
+            candidates = self.buckets.get(key, 0) & nodes
+            if candidates:
+                return lowest_bit_index(candidates)
+            key += 1
+
+    def _move(self, node, key):
+        bit = 1 << node
+        self.buckets[self.keys[node]] ^= bit
+        self.buckets[key] = self.buckets.get(key, 0) | bit
+        self.keys[node] = key
+
+    def remove(self, node):
+        """
+        Remove a node, updating the degrees of the remaining nodes.
+        """
+        bit = 1 << node
+        self.alive ^= bit
+        self.alive_count -= 1
+        self.buckets[self.keys[node]] ^= bit
+
+        neighbors = self.rows[node] & self.alive
+        neighbor_count = popcount(neighbors)
+
+        if neighbor_count <= self.alive_count - neighbor_count:
+            for neighbor in iter_bits(neighbors):
+                self._move(neighbor, self.keys[neighbor] - 1)
+                if self.keys[neighbor] < self.min_key:
+                    self.min_key = self.keys[neighbor]
+        else:
+            self.offset -= 1
+            for non_neighbor in iter_bits(self.alive & ~neighbors):
+                self._move(non_neighbor, self.keys[non_neighbor] + 1)
+
+
+def greedy_matching_bitset(graph, deadline=None, clock=time.monotonic):
+    """
+    Pair up the nodes of a BitsetGraph greedily: repeatedly match the node with the fewest connections to its
+    neighbour with the fewest connections, lowest index first.
+
+    :param graph: a BitsetGraph, which is not modified
+    :param deadline: when to stop pairing, in the units of 'clock', or None to run to the end; the pairs made up to
+                     the deadline are returned
+    :param clock: a function returning the current time; defaults to time.monotonic()
+    :return: a list where element i is the node matched to node i, or -1 if node i is unmatched
+    """
+    mate = [-1] * len(graph)
+    remaining = DegreeBuckets(graph)
+
+    while len(remaining) > 1:
+        if deadline is not None and clock() >= deadline:
+            break
+
+        node = remaining.min_degree_node()
+
+        if remaining.degree(node) < 1:
+            remaining.remove(node)
+        else:
+            partner = remaining.min_degree_node_in(remaining.neighbors(node))
+            remaining.remove(node)
+            remaining.remove(partner)
+            mate[node] = partner
+            mate[partner] = node
+
+    return mate
+
+
+def distract_the_trainers_bitset(graph):
+    """
+    Pair up the trainers the same way as distract_the_trainers(), using a BitsetGraph and DegreeBuckets.
+
+    distract_the_trainers() scans every node to find the one with the fewest connections and removes nodes by
+    searching lists, which is O(n^3) on dense graphs. Here, the minimum-degree node and its minimum-degree neighbour
+    come straight from the degree buckets, and removing a node only touches its neighbours (or its non-neighbours, if
+    there are fewer of them). Ties are broken by lowest node index, so both functions pair the same trainers.
+
+    The graph is not modified.
+
+    :param graph: a BitsetGraph
+    :return: the number of trainers that have gone into an infinite thumb wrestling loop and are now distracted
+    """
+    return matched_count(greedy_matching_bitset(graph))
+
+
+def matched_count(mate):
+    """
+    Count the matched nodes in a list of mates, as returned by greedy_matching_bitset() or maximum_matching().
+    """
+    return len(mate) - mate.count(-1)
+
+
+# Node labels used by the blossom algorithm
+UNLABELED = 0
+EVEN = 1  # at an even distance from the root of the alternating tree, i.e., an outer node
+ODD = 2  # at an odd distance from the root of the alternating tree, i.e., an inner node
+
+
+def maximum_matching(adjacency, mate=None):
+    """
+    Find a maximum matching in a general graph using Edmonds' blossom algorithm.
+
+    An alternating tree is grown by breadth-first search from each unmatched node. When the search finds an edge
+    between two even nodes of the tree, the odd cycle ("blossom") they close is contracted into its base node. Instead
+    of rewriting the graph, contraction merges the blossom's nodes into one set of a union-find structure whose
+    representative is the base, and links the tree parents across the blossom so the augmenting path can be expanded
+    later. When the search reaches an unmatched node, the matching is flipped along the path back to the root.
+
+    Each search is O(V + E) apart from the near-constant union-find operations, and there is one search per unmatched
+    node, so the whole algorithm runs in O(V^3). All labels are kept in flat lists indexed by node.
+
+    https://en.wikipedia.org/wiki/Blossom_algorithm
+
+    :param adjacency: a list where element i is a list of the neighbours of node i
+    :param mate: an optional initial matching to improve, in the same form as the result; a good starting matching
+                 (e.g., from greedy_matching_bitset()) leaves fewer searches to do
+    :return: a list where element i is the node matched to node i, or -1 if node i is unmatched
+    """
+    node_count = len(adjacency)
+    mate = list(mate) if mate is not None else [-1] * node_count
+    matcher = _BlossomSearch(adjacency, mate)
+
+    for root in range(node_count):
+        if mate[root] == -1:
+            matcher.augment_from(root)
+
+    return mate
+
+
+class _BlossomSearch(object):
+    """
+    The working state for maximum_matching(): tree labels, tree parents, and the union-find forest of blossom bases.
+    The lists are allocated once and reused by every search.
+    """
+
+    def __init__(self, adjacency, mate):
+        node_count = len(adjacency)
+        self.adjacency = adjacency
+        self.mate = mate
+        self.label = [UNLABELED] * node_count
+        self.parent = [-1] * node_count
+        self.base = list(range(node_count))
+        self.visited = [0] * node_count
+        self.stamp = 0
+        self.queue = []
+        self.touched = []
+
+    def add_node(self):
+        """
+        Make room for one more node at the end of the graph.
+        """
+        self.label.append(UNLABELED)
+        self.parent.append(-1)
+        self.base.append(len(self.base))
+        self.visited.append(0)
+
+    def find_base(self, node):
+        base = self.base
+        root = node
+
+        while base[root] != root:
+            root = base[root]
+
+        while base[node] != root:  # path compression
+            base[node], node = root, base[node]
+
+        return root
+
+    def augment_from(self, root, max_steps=None):
+        """
+        Search for an augmenting path starting at an unmatched node, and flip the matching along it if one is found.
+
+        :param root: an unmatched node
+        :param max_steps: the most even nodes to expand before giving up, or None to search until done
+        :return: True if the matching grew, False if there is no augmenting path from the root, or None if the search
+                 gave up after max_steps (the matching is unchanged)
+        """
+        self._reset()
+        self._label_even(root)
+        label, parent, mate = self.label, self.parent, self.mate
+        queue = self.queue
+        head = 0
+
+        while head < len(queue):
+            if max_steps is not None and head >= max_steps:
+                return None
+
+            node = queue[head]
+            head += 1
+
+            for neighbor in self.adjacency[node]:
+                if label[neighbor] == ODD or self.find_base(node) == self.find_base(neighbor):
+                    continue
+
+                if label[neighbor] == UNLABELED:
+                    self.touched.append(neighbor)
+                    label[neighbor] = ODD
+                    parent[neighbor] = node
+
+                    if mate[neighbor] == -1:
+                        self._flip_path(neighbor)
+                        return True
+
+                    self._label_even(mate[neighbor])
+                else:
+                    base = self._lowest_common_base(node, neighbor)
+                    self._contract(node, neighbor, base)
+                    self._contract(neighbor, node, base)
+
+        return False
+
+    def _reset(self):
+        for node in self.touched:
+            self.label[node] = UNLABELED
+            self.parent[node] = -1
+            self.base[node] = node
+
+        del self.touched[:]
+        del self.queue[:]
+
+    def _label_even(self, node):
+        self.label[node] = EVEN
+        self.touched.append(node)
+        self.queue.append(node)
+
+    def _flip_path(self, node):
+        mate, parent = self.mate, self.parent
+
+        while node != -1:
+            previous = parent[node]
+            next_node = mate[previous]
+            mate[node] = previous
+            mate[previous] = node
+            node = next_node
+
+    def _lowest_common_base(self, a, b):
+        """
+        Walk up the alternating tree from two even nodes, alternately, until a base seen from the other side is found.
+        """
+        self.stamp += 1
+        stamp, visited, mate, parent = self.stamp, self.visited, self.mate, self.parent
+
+        while True:
+            if a != -1:
+                a = self.find_base(a)
+                if visited[a] == stamp:
+                    return a
+                visited[a] = stamp
+                a = parent[mate[a]] if mate[a] != -1 else -1
+            a, b = b, a
+
+    def _contract(self, node, neighbor, base):
+        """
+        Merge the half of the blossom from 'node' up to 'base' into the base's set, relabelling odd nodes as even so
+        the search continues from them, and pointing tree parents back across the closing edge.
+        """
+        label, parent, mate = self.label, self.parent, self.mate
+
+        while self.find_base(node) != base:
+            parent[node] = neighbor
+            neighbor = mate[node]
+
+            if label[neighbor] == ODD:
+                self._label_even(neighbor)
+            if self.find_base(node) == node:
+                self.base[node] = base
+            if self.find_base(neighbor) == neighbor:
+                self.base[neighbor] = base
+
+            node = parent[neighbor]
+
+
+def distract_the_trainers_exact(graph):
+    """
+    Pair up as many trainers as possible. Unlike distract_the_trainers(), which is a greedy heuristic, this finds a
+    maximum matching with the blossom algorithm, starting from the greedy pairing.
+
+    The greedy pairing is often already the best possible, so the blossom searches only run when it could still be
+    improved: when it leaves some trainers unpaired, and more of them than the lower bound from odd_set_deficiency(),
+    with trainers grouped by identical rows (trainers with the same row never loop with each other). The searches
+    look up neighbours through a BitsetAdjacency, so only the rows they reach are turned into lists.
+
+    :param graph: a BitsetGraph, which is not modified
+    :return: the number of trainers that have gone into an infinite thumb wrestling loop and are now distracted
+    """
+    mate = greedy_matching_bitset(graph)
+    unpaired_count = len(graph) - matched_count(mate)
+
+    if unpaired_count:
+        members_by_row = {}
+        for node, row in enumerate(graph.rows):
+            members_by_row.setdefault(row, []).append(node)
+
+        if unpaired_count > odd_set_deficiency(graph, list(members_by_row.values())):
+            mate = maximum_matching(BitsetAdjacency(graph.rows), mate)
+
+    return matched_count(mate)
+
+
+LOOP_CACHE_SIZE = 1 << 16
+
+
+@functools.lru_cache(maxsize=LOOP_CACHE_SIZE)
+def _reduced_pair_loops(smaller_part, larger_part):
+    return not is_power_of_two(smaller_part + larger_part)
+
+
+def cached_results_in_infinite_loop(banana_count_a, banana_count_b):
+    """
+    Same as results_in_infinite_loop(), with verdicts cached in a bounded LRU cache shared by every call.
+
+    The verdict only depends on the ratio of the two counts: with g = gcd(a, b), the pair loops unless a/g + b/g is a
+    power of 2. So the cache is keyed on the reduced pair (a/g, b/g), smallest first, and (3, 5), (5, 3) and (6, 10)
+    all share one entry.
+
+    :param banana_count_a: the amount of bananas held by trainer a
+    :param banana_count_b: the amount of bananas held by trainer b
+    :return: True if the two trainers will enter an infinite loop based on their banana count, otherwise return False
+    """
+    common = math.gcd(banana_count_a, banana_count_b)
+    part_a, part_b = banana_count_a // common, banana_count_b // common
+
+    if part_a > part_b:
+        return _reduced_pair_loops(part_b, part_a)
+
+    return _reduced_pair_loops(part_a, part_b)
+
+
+def group_trainers(banana_list):
+    """
+    Group the trainers by their banana count. Trainers with the same count have exactly the same opponents, so the
+    tournament graph only needs one node per distinct count.
+
+    :param banana_list: specifies how many bananas each trainer has
+    :return: the distinct banana counts in order of first appearance, and for each one, the list of trainers holding
+             that many bananas
+    """
+    members_by_count = {}
+
+    for trainer, banana_count in enumerate(banana_list):
+        members_by_count.setdefault(banana_count, []).append(trainer)
+
+    return list(members_by_count), list(members_by_count.values())
+
+
+def create_class_tournament(banana_counts):
+    """
+    Create the wrestling tournament graph over distinct banana counts. Node i is the class of trainers holding
+    banana_counts[i] bananas. There are no edges inside a class, since trainers with the same count never loop.
+
+    The rows come from the same builder as create_bitset_tournament(), from the few pairs that don't loop, and are
+    then turned into lists. Banana counts too large for non_looping_counts() get their verdicts from
+    cached_results_in_infinite_loop() instead, one pair at a time.
+
+    :param banana_counts: distinct banana counts, as returned by group_trainers()
+    :return: a list where element i is the list of classes whose trainers loop with the trainers of class i, in
+             ascending order
+    """
+    if not _counts_can_be_factored(banana_counts):
+        return [[j for j, other_count in enumerate(banana_counts)
+                 if cached_results_in_infinite_loop(count, other_count)]
+                for count in banana_counts]
+
+    rows = _TournamentRows(banana_counts)
+
+    return [list(iter_bits(rows.row(banana_count))) for banana_count in banana_counts]
+
+
+def greedy_matching_classes(adjacency, sizes):
+    """
+    Pair up trainers class by class. This is the same min-degree heuristic as distract_the_trainers(), where the degree
+    of a class is the number of remaining trainers it can be paired with: the class with the smallest degree is paired
+    with its neighbouring class of smallest degree (lowest index first), as many trainers at a time as the smaller of
+    the two has left. Every step uses up at least one class, so there are at most as many steps as classes.
+
+    :param adjacency: the class graph, as returned by create_class_tournament()
+    :param sizes: the number of trainers in each class
+    :return: a list of (class, class, number of pairs) tuples
+    """
+    remaining = list(sizes)
+    degree = [sum(remaining[neighbor] for neighbor in neighbors) for neighbors in adjacency]
+    active = set(node for node, size in enumerate(remaining) if size)
+    pairings = []
+
+    while True:
+        candidates = [node for node in active if degree[node] > 0]
+        if not candidates:
+            break
+
+        node = min(candidates, key=lambda c: (degree[c], c))
+        partner = min((c for c in adjacency[node] if remaining[c]), key=lambda c: (degree[c], c))
+        pair_count = min(remaining[node], remaining[partner])
+        pairings.append((node, partner, pair_count))
+
+        for matched in (node, partner):
+            remaining[matched] -= pair_count
+            for neighbor in adjacency[matched]:
+                degree[neighbor] -= pair_count
+            if not remaining[matched]:
+                active.discard(matched)
+
+    return pairings
+
+
+def expand_class_pairings(members, pairings, trainer_count):
+    """
+    Turn class pairings into trainer pairings.
+
+    :param members: for each class, the list of its trainers
+    :param pairings: (class, class, number of pairs) tuples, as returned by greedy_matching_classes()
+    :param trainer_count: the total number of trainers
+    :return: a list where element i is the trainer paired with trainer i, or -1 if trainer i is not paired
+    """
+    mate = [-1] * trainer_count
+    unpaired = [iter(class_members) for class_members in members]
+
+    for class_a, class_b, pair_count in pairings:
+        for _ in range(pair_count):
+            trainer_a = next(unpaired[class_a])
+            trainer_b = next(unpaired[class_b])
+            mate[trainer_a] = trainer_b
+            mate[trainer_b] = trainer_a
+
+    return mate
+
+
+class ExpandedClassAdjacency(object):
+    """
+    An adjacency list over trainers, backed by the class graph: element i is the list of trainers that trainer i loops
+    with. All trainers of a class share one neighbour list, and each list is only built the first time one of the
+    class's trainers is looked up, so searches that stay within a few classes never pay for the rest.
+    """
+
+    def __init__(self, members, class_adjacency, trainer_count):
+        """
+        :param members: for each class, the list of its trainers
+        :param class_adjacency: the class graph, as returned by create_class_tournament()
+        :param trainer_count: the total number of trainers
+        """
+        self.members = members
+        self.class_adjacency = class_adjacency
+        self.class_of = [0] * trainer_count
+        self.neighbor_lists = [None] * len(members)
+
+        for class_index, class_members in enumerate(members):
+            for trainer in class_members:
+                self.class_of[trainer] = class_index
+
+    def __len__(self):
+        return len(self.class_of)
+
+    def __getitem__(self, trainer):
+        class_index = self.class_of[trainer]
+        neighbors = self.neighbor_lists[class_index]
+
+        if neighbors is None:
+            neighbors = [neighbor for neighbor_class in self.class_adjacency[class_index]
+                         for neighbor in self.members[neighbor_class]]
+            self.neighbor_lists[class_index] = neighbors
+
+        return neighbors
+
+
+def augment_class_pairings(adjacency, sizes, pairings):
+    """
+    Improve class pairings with augmenting walks on the class graph, many pairs at a time, without expanding it into
+    trainers.
+
+    The pairings give each edge of the class graph a multiplicity, the number of pairs between its two classes. A walk
+    starts at a class with trainers to spare and alternates between any edge, whose multiplicity goes up, and an edge
+    with pairs on it, whose multiplicity goes down, until it reaches a class with trainers to spare. Every class in
+    between keeps its number of pairs, and the two ends gain one each, so the walk adds a pair; it is applied as many
+    times at once as the multiplicities and the spare trainers allow. Walks are found by breadth-first search over
+    (class, parity of the step) from every class with trainers to spare at once.
+
+    Any augmenting path between trainers maps onto such a walk, so when the search can't reach a class with trainers
+    to spare at an odd step, no trainer pairing has more pairs. A walk may use one edge both ways, or start and end at
+    a class with just one trainer to spare, and then it can't be applied. If the search only finds walks like that,
+    the pairings may or may not be the best possible.
+
+    :param adjacency: the class graph, as returned by create_class_tournament()
+    :param sizes: the number of trainers in each class
+    :param pairings: (class, class, number of pairs) tuples, as returned by greedy_matching_classes()
+    :return: the improved pairings, as (class, class, number of pairs) tuples, and True if no trainer pairing has more
+             pairs, or False if that is not known
+    """
+    pair_counts = [{} for _ in sizes]  # for each class, the number of pairs with each class it is paired with
+    load = [0] * len(sizes)
+
+    for class_a, class_b, pair_count in pairings:
+        for first, second in ((class_a, class_b), (class_b, class_a)):
+            pair_counts[first][second] = pair_counts[first].get(second, 0) + pair_count
+            load[first] += pair_count
+
+    while True:
+        walk = _find_class_walk(adjacency, sizes, pair_counts, load)
+        if walk is None:
+            complete = True
+            break
+        if not walk:
+            complete = False
+            break
+
+        changes, times = walk
+        for (class_a, class_b), change in changes.items():
+            for first, second in ((class_a, class_b), (class_b, class_a)):
+                pair_count = pair_counts[first].get(second, 0) + change * times
+                if pair_count:
+                    pair_counts[first][second] = pair_count
+                else:
+                    del pair_counts[first][second]
+                load[first] += change * times
+
+    improved = [(class_a, class_b, pair_count) for class_a, partners in enumerate(pair_counts)
+                for class_b, pair_count in partners.items() if class_a < class_b]
+
+    return improved, complete
+
+
+def _find_class_walk(adjacency, sizes, pair_counts, load):
+    """
+    Search for an augmenting walk for augment_class_pairings().
+
+    :return: None if no class with trainers to spare can be reached at an odd step; otherwise the change in
+             multiplicity of each edge of a walk that can be applied, keyed by (smaller class, larger class), and how
+             many times it can be applied at once; or an empty tuple if only walks that can't be applied were found
+    """
+    parent = {}
+    queue = []
+
+    for class_index, size in enumerate(sizes):
+        if load[class_index] < size:
+            parent[2 * class_index] = -1
+            queue.append(2 * class_index)
+
+    found_any = False
+
+    for state in queue:
+        class_index, odd = state >> 1, state & 1
+        following = adjacency[class_index] if not odd else pair_counts[class_index]
+
+        for next_class in following:
+            next_state = 2 * next_class + (not odd)
+            if next_state in parent:
+                continue
+            parent[next_state] = state
+            queue.append(next_state)
+
+            if not odd and load[next_class] < sizes[next_class]:
+                found_any = True
+                walk = _class_walk(next_state, parent, sizes, pair_counts, load)
+                if walk:
+                    return walk
+
+    return () if found_any else None
+
+
+def _class_walk(end_state, parent, sizes, pair_counts, load):
+    changes = {}
+    state = end_state
+
+    while parent[state] != -1:
+        previous = parent[state]
+        edge = (min(state, previous) >> 1, max(state, previous) >> 1)
+        changes[edge] = changes.get(edge, 0) + (1 if state & 1 else -1)
+        state = previous
+
+    start, end = state >> 1, end_state >> 1
+    if start != end:
+        times = min(sizes[start] - load[start], sizes[end] - load[end])
+    else:
+        times = (sizes[start] - load[start]) // 2
+
+    for (class_a, class_b), change in changes.items():
+        if change < 0:
+            times = min(times, pair_counts[class_a].get(class_b, 0) // -change)
+
+    return (changes, times) if times > 0 else ()
+
+
+def class_deficiency(adjacency, sizes):
+    """
+    The same lower bound on unpaired trainers as odd_set_deficiency(), worked out on the class graph: components of
+    the class graph with an odd number of trainers, and classes with more trainers than all of their opponents.
+
+    :param adjacency: the class graph, as returned by create_class_tournament()
+    :param sizes: the number of trainers in each class
+    :return: the lower bound on unpaired trainers
+    """
+    component_of = [-1] * len(sizes)
+    odd_components = 0
+
+    for root in range(len(sizes)):
+        if component_of[root] != -1:
+            continue
+        component_of[root] = root
+        stack = [root]
+        trainers = 0
+        while stack:
+            class_index = stack.pop()
+            trainers += sizes[class_index]
+            for neighbor in adjacency[class_index]:
+                if component_of[neighbor] == -1:
+                    component_of[neighbor] = root
+                    stack.append(neighbor)
+        odd_components += trainers & 1
+
+    star_deficiency = max([size - sum(sizes[neighbor] for neighbor in adjacency[class_index])
+                           for class_index, size in enumerate(sizes)], default=0)
+
+    return max(odd_components, star_deficiency)
+
+
+def compressed_matching(banana_list):
+    """
+    Pair up as many trainers as possible, working on the graph of distinct banana counts rather than on every trainer.
+    When many trainers hold the same number of bananas, this shrinks both building the graph and matching from the
+    number of trainers to the number of distinct counts.
+
+    The class pairings from greedy_matching_classes() are improved with augment_class_pairings(), which works on the
+    class graph with the number of pairs on each edge, and only then expanded into trainer pairings. That is the best
+    pairing when the walks run out, or when it leaves no more trainers unpaired than class_deficiency(). Otherwise it
+    is completed with the blossom algorithm on the trainers; trainers of the same class are interchangeable, so once a
+    search from one unpaired trainer fails, the searches from the rest of its class would fail too and are skipped.
+
+    :param banana_list: specifies how many bananas each trainer has
+    :return: a list where element i is the trainer paired with trainer i, or -1 if trainer i is not paired
+    """
+    banana_counts, members = group_trainers(banana_list)
+    class_adjacency = create_class_tournament(banana_counts)
+    sizes = [len(class_members) for class_members in members]
+    pairings, complete = augment_class_pairings(class_adjacency, sizes,
+                                                greedy_matching_classes(class_adjacency, sizes))
+
+    mate = expand_class_pairings(members, pairings, len(banana_list))
+    if complete or len(mate) - matched_count(mate) <= class_deficiency(class_adjacency, sizes):
+        return mate
+
+    search = _BlossomSearch(ExpandedClassAdjacency(members, class_adjacency, len(banana_list)), mate)
+
+    for class_members in members:
+        for trainer in class_members:
+            if mate[trainer] == -1 and not search.augment_from(trainer):
+                break
+
+    return mate
+
+
+def odd_set_deficiency(graph, members):
+    """
+    Find a lower bound on how many trainers must be left unpaired, from the Tutte-Berge formula: for any set U of
+    trainers, at least odd(G - U) - |U| trainers are unpaired, where odd(G - U) is the number of components with an
+    odd number of trainers once U is removed. Two cheap choices of U are tried:
+    * U empty: every connected component with an odd number of trainers leaves one trainer unpaired;
+    * U = the opponents of a group of trainers with the same opponents, such as the trainers holding some banana
+      count: those trainers never loop with each other, so each is then a component on their own, and at least
+      (their number) - |U| of them are unpaired.
+
+    Components are found with bitset operations, a whole frontier of the search at a time.
+
+    :param graph: the tournament graph over trainers, as a BitsetGraph
+    :param members: lists of trainers with the same row of the graph, such as the trainers holding each distinct banana
+                    count, as returned by group_trainers()
+    :return: the lower bound on unpaired trainers
+    """
+    rows = graph.rows
+    unvisited = (1 << len(rows)) - 1
+    odd_components = 0
+
+    while unvisited:
+        component = frontier = unvisited & -unvisited
+        while frontier:
+            reached = 0
+            for node in iter_bits(frontier):
+                reached |= rows[node]
+            frontier = reached & ~component
+            component |= frontier
+
+        odd_components += popcount(component) & 1
+        unvisited &= ~component
+
+    star_deficiency = max(
+        [len(class_members) - popcount(rows[class_members[0]]) for class_members in members], default=0)
+
+    return max(odd_components, star_deficiency)
+
+
+class BitsetAdjacency(object):
+    """
+    An adjacency list over the rows of a BitsetGraph: element i is the list of neighbours of node i. Each list is only
+    built the first time it is looked up, so searches that stay within part of a large graph never pay for the rest.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.neighbor_lists = [None] * len(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, node):
+        neighbors = self.neighbor_lists[node]
+
+        if neighbors is None:
+            neighbors = self.neighbor_lists[node] = list(iter_bits(self.rows[node]))
+
+        return neighbors
+
+
+def _pair_first_fit(mate, rows, unpaired, nodes):
+    """
+    Pair each of 'nodes' that is still unpaired with the lowest unpaired node they are connected to.
+
+    :param mate: the pairing to extend, changed in place
+    :param rows: the rows of the graph, as integer bitsets
+    :param unpaired: the unpaired nodes, as a bitset
+    :param nodes: the nodes to pair, in order
+    :return: the nodes left unpaired, as a bitset
+    """
+    for node in nodes:
+        if unpaired >> node & 1:
+            candidates = rows[node] & unpaired
+            if candidates:
+                partner = lowest_bit_index(candidates)
+                mate[node] = partner
+                mate[partner] = node
+                unpaired ^= (1 << node) | (1 << partner)
+
+    return unpaired
+
+
+# anytime_matching() only builds the whole graph for the greedy pairing up to this many trainers, about 50 MB of rows
+ANYTIME_GREEDY_MAX_TRAINERS = 20000
+
+
+def _latched_clock(clock, deadline):
+    """
+    :param clock: a function returning the current time
+    :param deadline: a time in the units of 'clock'
+    :return: a function returning the same as 'clock' until a reading reaches the deadline, and that reading from then
+             on, without reading 'clock' again, so that each stage after the one the deadline stopped stops at once
+    """
+    reading = [None]
+
+    def latched():
+        if reading[0] is None:
+            now = clock()
+            if now < deadline:
+                return now
+            reading[0] = now
+        return reading[0]
+
+    return latched
+
+
+def _pair_by_count(mate, banana_list, deadline, clock):
+    """
+    Pair each trainer in turn with an unpaired trainer they loop with, if there is one, without building the graph.
+
+    The unpaired trainers are kept in a pool for each banana count, and a trainer is paired with one from the first
+    pool whose count they loop with. Only a few counts don't loop with a given count (see non_looping_counts()), so
+    that is nearly always the first pool tried. Every trainer left unpaired has only unpaired trainers they don't loop
+    with, so the pairing can't be extended by another pair.
+
+    :param mate: the pairing to fill in, with every trainer unpaired; changed in place
+    :return: True if every trainer was reached before the deadline
+    """
+    pools = {}
+
+    for trainer, banana_count in enumerate(banana_list):
+        if clock() >= deadline:
+            return False
+
+        for other_count in pools:
+            total = banana_count + other_count
+            if banana_count % (total // (total & -total)):  # the odd part of the sum doesn't divide it, so they loop
+                partner = pools[other_count].pop()
+                if not pools[other_count]:
+                    del pools[other_count]
+                mate[trainer] = partner
+                mate[partner] = trainer
+                break
+        else:
+            pools.setdefault(banana_count, []).append(trainer)
+
+    return True
+
+
+class _LazyRowAdjacency(object):
+    """
+    An adjacency list over trainers for _BlossomSearch, backed by a _TournamentRows: element i iterates over the
+    trainers that trainer i loops with. A row is only built when a search reaches a trainer holding its count, and is
+    read bit by bit, so a search that finds its path early never turns the whole row into a list.
+    """
+
+    def __init__(self, rows, banana_list):
+        self.rows = rows
+        self.banana_list = banana_list
+
+    def __len__(self):
+        return len(self.banana_list)
+
+    def __getitem__(self, trainer):
+        return iter_bits(self.rows.row(self.banana_list[trainer]))
+
+
+def anytime_matching(banana_list, deadline, initial_steps=1024, clock=time.monotonic,
+                     greedy_max_trainers=ANYTIME_GREEDY_MAX_TRAINERS):
+    """
+    Pair up the trainers as well as possible before a deadline, and report how far from the best pairing the result
+    might be. This is meant for rosters too large to match exactly within a latency target. Every stage checks the
+    clock, so the call returns soon after the deadline however large the roster is, with a valid pairing that gets
+    steadily better the more time it has:
+    * Each trainer in turn is paired with an unpaired trainer from the first pool of unpaired trainers, by banana
+      count, that they loop with. This needs no rows of the graph, and pairs as many trainers as it can: no two
+      trainers it leaves unpaired loop with each other. If it leaves at most one trainer unpaired, that is the best
+      possible pairing, and it is returned straight away.
+    * Up to greedy_max_trainers trainers, the graph is then built one row at a time, and greedy_matching_bitset()
+      finds the pairing distract_the_trainers() would. If the deadline comes first, the pools' pairing is kept; if it
+      cuts the greedy pairing short, the trainers it didn't reach are paired first-come. The larger of the two
+      pairings is kept. Larger rosters keep the pools' pairing, since the whole graph would not fit in memory.
+    * The pairing is improved with blossom searches from unpaired trainers until the deadline. The rows a search
+      reaches are built when it first needs them. Each search gives up after expanding 'initial_steps' nodes, and a
+      search that gave up is retried later with twice the budget, so one hard search cannot use up all the time.
+      Trainers holding the same number of bananas are interchangeable, so once a search from one of them fails, the
+      rest are skipped.
+
+    Until the searches start, the upper bound is just the number of trainers. After that it is the smallest of:
+    * the trainers not known to be unpairable: a trainer with no augmenting path now never gets one later, so every
+      trainer whose search failed (and the rest of their class) stays unpaired in some best pairing;
+    * the number of trainers less odd_set_deficiency(), when the whole graph was built, or else less the trainers of
+      a banana count who outnumber all of their opponents.
+    When every search has finished before the deadline, the pairing is the best possible and equals the bound.
+
+    :param banana_list: specifies how many bananas each trainer has
+    :param deadline: when to stop improving, in the units of 'clock'
+    :param initial_steps: the search budget for the first attempt from each trainer
+    :param clock: a function returning the current time; defaults to time.monotonic()
+    :param greedy_max_trainers: the most trainers to build the whole graph for, for the greedy pairing
+    :return: a list where element i is the trainer paired with trainer i, or -1 if trainer i is not paired, and an
+             upper bound on the number of trainers any pairing can distract
+    """
+    trainer_count = len(banana_list)
+    trivial_bound = trainer_count - (trainer_count & 1)
+    mate = [-1] * trainer_count
+    clock = _latched_clock(clock, deadline)
+
+    if not _pair_by_count(mate, banana_list, deadline, clock) or matched_count(mate) == trivial_bound:
+        return mate, trivial_bound
+
+    rows = _TournamentRows(banana_list, batch=False)
+    members = list(rows.members.values())  # the same classes as group_trainers() gives
+
+    if trainer_count <= greedy_max_trainers:
+        graph = BitsetGraph([])
+        for banana_count in banana_list:
+            if clock() >= deadline:
+                return mate, trivial_bound
+            graph.rows.append(rows.row(banana_count))
+
+        # if the deadline cut the greedy pairing short, the trainers it didn't reach are paired first-come; otherwise no
+        # two of its unpaired trainers loop, and this pairs none
+        greedy = greedy_matching_bitset(graph, deadline, clock)
+        unpaired = sum(1 << trainer for trainer in range(trainer_count) if greedy[trainer] == -1)
+        _pair_first_fit(greedy, graph.rows, unpaired, range(trainer_count))
+        mate = max(greedy, mate, key=matched_count)
+
+        deficiency = odd_set_deficiency(graph, members)
+        adjacency = BitsetAdjacency(graph.rows)
+    else:
+        deficiency = 0
+        adjacency = _LazyRowAdjacency(rows, banana_list)
+
+    search = _BlossomSearch(adjacency, mate)
+
+    pending = collections.deque(
+        (class_index, initial_steps) for class_index, class_members in enumerate(members)
+        if any(mate[trainer] == -1 for trainer in class_members))
+    unpairable = [False] * len(members)
+
+    while pending and clock() < deadline:
+        class_index, max_steps = pending.popleft()
+        unpaired_members = [trainer for trainer in members[class_index] if mate[trainer] == -1]
+        if not unpaired_members:
+            continue
+
+        found = search.augment_from(unpaired_members[0], max_steps)
+        if found is None:
+            pending.append((class_index, 2 * max_steps))
+        elif found:
+            pending.appendleft((class_index, max_steps))
+        else:
+            unpairable[class_index] = True
+
+    unpairable_trainers = sum(
+        1 for class_index, class_members in enumerate(members) if unpairable[class_index]
+        for trainer in class_members if mate[trainer] == -1)
+
+    if trainer_count > greedy_max_trainers:
+        # the same star bound as in odd_set_deficiency(), for the counts whose rows the searches built
+        deficiency = max([len(rows.members[banana_count]) - popcount(row) for banana_count, row in rows.rows.items()],
+                         default=0)
+
+    upper_bound = trainer_count - max(unpairable_trainers, deficiency)
+
+    return mate, upper_bound - (upper_bound & 1)
+
+
+class TrainerMatcher(object):
+    """
+    Keep a maximum pairing of trainers up to date while trainers arrive and leave.
+
+    The tournament graph and the matching are kept between changes. A matching that was maximum stays maximum after
+    a change, apart from augmenting paths through the trainer who changed:
+    * when a trainer arrives, any augmenting path must end at the new trainer, so one blossom search from them is
+      enough;
+    * when a paired trainer leaves, any augmenting path must end at their former partner, so one search from the
+      partner is enough; when an unpaired trainer leaves, nothing needs to change.
+
+    Each change therefore costs O(n) loop verdicts plus one O(V + E) search, instead of rebuilding the graph with
+    create_wrestling_tournament() and matching from scratch.
+
+    Trainer ids are handed out by add_trainer(), and the id of a trainer who left may be reused.
+    """
+
+    def __init__(self, banana_list=()):
+        """
+        :param banana_list: the initial trainers; trainer i (counting from 0) holds banana_list[i] bananas
+        """
+        self.bananas = []
+        self.adjacency = []
+        self.mate = []
+        self.free_ids = []
+        self.trainer_count = 0
+        self.search = _BlossomSearch(self.adjacency, self.mate)
+
+        for banana_count in banana_list:
+            self.add_trainer(banana_count)
+
+    def __len__(self):
+        return self.trainer_count
+
+    def __contains__(self, trainer):
+        return 0 <= trainer < len(self.bananas) and self.bananas[trainer] is not None
+
+    def add_trainer(self, banana_count):
+        """
+        Add a trainer and pair them up if that makes room for one more match.
+
+        :param banana_count: the amount of bananas held by the new trainer
+        :return: the new trainer's id
+        """
+        if self.free_ids:
+            trainer = self.free_ids.pop()
+            self.bananas[trainer] = banana_count
+        else:
+            trainer = len(self.bananas)
+            self.bananas.append(banana_count)
+            self.adjacency.append(None)
+            self.mate.append(-1)
+            self.search.add_node()
+
+        neighbors = set()
+        for other, other_count in enumerate(self.bananas):
+            if other_count is not None and other != trainer \
+                    and cached_results_in_infinite_loop(banana_count, other_count):
+                neighbors.add(other)
+                self.adjacency[other].add(trainer)
+
+        self.adjacency[trainer] = neighbors
+        self.trainer_count += 1
+        self.search.augment_from(trainer)
+
+        return trainer
+
+    def remove_trainer(self, trainer):
+        """
+        Remove a trainer, and re-pair their former partner if possible.
+
+        :param trainer: the id of a trainer, as returned by add_trainer()
+        """
+        if trainer not in self:
+            raise KeyError(trainer)
+
+        for neighbor in self.adjacency[trainer]:
+            self.adjacency[neighbor].discard(trainer)
+
+        partner = self.mate[trainer]
+        self.adjacency[trainer] = set()
+        self.bananas[trainer] = None
+        self.mate[trainer] = -1
+        self.free_ids.append(trainer)
+        self.trainer_count -= 1
+
+        if partner != -1:
+            self.mate[partner] = -1
+            self.search.augment_from(partner)
+
+    def partner(self, trainer):
+        """
+        :return: the id of the trainer paired with 'trainer', or None if they are not paired
+        """
+        if trainer not in self:
+            raise KeyError(trainer)
+
+        return self.mate[trainer] if self.mate[trainer] != -1 else None
+
+    def pairs(self):
+        """
+        :return: the current pairs of trainer ids, smallest id first
+        """
+        return [(trainer, partner) for trainer, partner in enumerate(self.mate) if trainer < partner]
+
+    def distracted_trainers(self):
+        return matched_count(self.mate)
+
+    def remaining_trainers(self):
+        """
+        :return: the fewest possible number of trainers left to watch the workers, as returned by solution()
+        """
+        return self.trainer_count - self.distracted_trainers()
+
+
+def _distract_with_adjacency_list(banana_list):
+    return distract_the_trainers(create_wrestling_tournament(banana_list))
+
+
+def _distract_with_bitset(banana_list):
+    return distract_the_trainers_bitset(create_bitset_tournament(banana_list))
+
+
+def _distract_exactly(banana_list):
+    return distract_the_trainers_exact(create_bitset_tournament(banana_list))
+
+
+def _distract_compressed(banana_list):
+    return matched_count(compressed_matching(banana_list))
+
+
+# The strategies solution() can use to pair up the trainers
+MATCHING_MODES = {
+    "greedy": _distract_with_adjacency_list,
+    "bitset": _distract_with_bitset,
+    "exact": _distract_exactly,
+    "compressed": _distract_compressed,
+}
+
+
+def solution(banana_list, mode="greedy", max_trainers=100):
     """
     A function to pair up the trainers in such a way that the maximum number of trainers go into an infinite thumb
     wrestling loop! The number of trainers will be at least 1 and not more than 100, and the number of bananas each
@@ -156,14 +1604,22 @@ def solution(banana_list):
 
     :param banana_list: a list of positive integers depicting the amount of bananas each trainer starts with;
                         Element i of the list will be the number of bananas that trainer i (counting from 0) starts with
+    :param mode: how to pair up the trainers, one of the keys of MATCHING_MODES; "bitset" gives the same result as
+                 "greedy" and is practical for tens of thousands of trainers; "exact" always finds the fewest
+                 remaining trainers; "compressed" gives the same result as "exact", working on distinct banana
+                 counts, which suits lists with many duplicates
+    :param max_trainers: the largest number of trainers accepted; the problem description specifies 100
     :return: the fewest possible number of bunny trainers that will be left to watch the workers; returns None if any
              of the noted preconditions are violated
     """
+    if mode not in MATCHING_MODES:
+        raise ValueError("unknown matching mode %r, expected one of %s" % (mode, ", ".join(sorted(MATCHING_MODES))))
+
     # First, let's check the preconditions that are specified in the problem description
     num_trainers = len(banana_list)
 
     # The number of trainers will be at least 1 and not more than 100
-    if num_trainers < 1 or num_trainers > 100:
+    if num_trainers < 1 or num_trainers > max_trainers:
         return None
 
     if num_trainers == 2 and banana_list[0] == banana_list[1]:
@@ -180,8 +1636,7 @@ def solution(banana_list):
 
     # if the preconditions are satisfied, we can proceed with figuring out the tournament graph,
     # number of distracted trainers, and remaining trainers
-    tournament_graph = create_wrestling_tournament(banana_list)
-    distracted_trainers = distract_the_trainers(tournament_graph)
+    distracted_trainers = MATCHING_MODES[mode](banana_list)
     remaining_trainers = len(banana_list) - distracted_trainers
 
     return remaining_trainers
@@ -196,6 +1651,12 @@ def all_tests():
     suite.addTest(PowersOfTwoTests)
     suite.addTest(LoopTests)
     suite.addTest((MinimumWeightNodeTests))
+    suite.addTest(BitsetGraphTests)
+    suite.addTest(DistractTheTrainersBitsetTests)
+    suite.addTest(MaximumMatchingTests)
+    suite.addTest(CompressedMatchingTests)
+    suite.addTest(TrainerMatcherTests)
+    suite.addTest(AnytimeMatchingTests)
 
     return suite
 
@@ -634,3 +2095,470 @@ class SolutionTests(unittest.TestCase):
 
         remaining_trainers = solution(bananas_per_trainer)
         self.assertEqual(expected_trainers_remaining, remaining_trainers)
+
+
+class BitsetGraphTests(unittest.TestCase):
+
+    def test_6_trainers(self):
+        bananas_per_trainer = [1, 7, 3, 21, 13, 19]
+        graph = create_bitset_tournament(bananas_per_trainer)
+
+        self.assertEqual(create_wrestling_tournament(bananas_per_trainer), graph.to_adjacency_list())
+        self.assertEqual(2, graph.degree(2))
+        self.assertEqual([1, 5], graph.neighbors(2))
+
+    def test_18_trainers(self):
+        bananas_per_trainer = [1, 10, 7, 3, 21, 13, 109, 21, 13, 19, 1, 7, 3, 21, 13, 19, 3, 54]
+        adjacency_list = create_wrestling_tournament(bananas_per_trainer)
+        graph = create_bitset_tournament(bananas_per_trainer)
+
+        self.assertEqual(adjacency_list, graph.to_adjacency_list())
+        self.assertEqual(graph, BitsetGraph.from_adjacency_list(adjacency_list))
+
+    def test_0_trainers(self):
+        graph = create_bitset_tournament([])
+
+        self.assertEqual({}, graph.to_adjacency_list())
+
+    def test_matches_adjacency_list_for_large_banana_counts(self):
+        generator = random.Random(5)
+        bananas_per_trainer = [generator.randint(1, pow(2, 30) - 1) for _ in range(40)]
+        bananas_per_trainer += [generator.choice([1, 3, 5, 7, 12, 4]) for _ in range(40)]
+
+        graph = create_bitset_tournament(bananas_per_trainer)
+        self.assertEqual(create_wrestling_tournament(bananas_per_trainer), graph.to_adjacency_list())
+
+    def test_counts_too_large_to_factor(self):
+        generator = random.Random(6)
+        bananas_per_trainer = [generator.randint(1, pow(2, 40)) for _ in range(30)] + [pow(2, 30), 3 * pow(2, 30)]
+
+        graph = create_bitset_tournament(bananas_per_trainer)
+        self.assertEqual(create_wrestling_tournament(bananas_per_trainer), graph.to_adjacency_list())
+        self.assertEqual(graph.rows, list(tournament_rows(bananas_per_trainer)))
+
+    def test_tournament_rows(self):
+        generator = random.Random(8)
+        bananas_per_trainer = [generator.choice([1, 3, 5, 6, 10, 12, 3 * 5 * 7 * 11 * 13 * 17]) for _ in range(50)]
+
+        self.assertEqual(create_bitset_tournament(bananas_per_trainer).rows, list(tournament_rows(bananas_per_trainer)))
+        self.assertEqual(create_wrestling_tournament(bananas_per_trainer),
+                         create_bitset_tournament(bananas_per_trainer).to_adjacency_list())
+
+    def test_odd_divisors(self):
+        for n in range(1, 1000):
+            self.assertEqual([x for x in range(1, n + 1, 2) if n % x == 0], sorted(odd_divisors(n)))
+
+        # 32749 and 32719 are primes just below SMALL_PRIME_LIMIT, 1073741789 is the largest prime below 2^30
+        self.assertEqual([1, 32719, 32749, 32719 * 32749], sorted(odd_divisors(4 * 32719 * 32749)))
+        self.assertEqual([1, 1073741789], sorted(odd_divisors(1073741789)))
+        self.assertEqual([3 ** i for i in range(19)], sorted(odd_divisors(3 ** 18)))
+        self.assertEqual(1 << 9, len(odd_divisors(3 * 5 * 7 * 11 * 13 * 17 * 19 * 23 * 29)))
+
+        numbers = [3 * 5 * 7 * 11 * 13 * 17 * 19 * 23 * 29, 1073741789, 5 * 32749]
+        self.assertEqual([3 * 5 * 7 * 11 * 13 * 17 * 19 * 23 * 29, 1, 5 * 32749], small_prime_gcds(numbers))
+
+    def test_non_looping_counts(self):
+        generator = random.Random(9)
+        banana_counts = list(range(1, 200)) + [generator.randint(1, pow(2, 30) - 1) for _ in range(50)]
+
+        for banana_count in banana_counts:
+            self.assertEqual([other for other in range(1, 301)
+                              if other != banana_count and not results_in_infinite_loop(banana_count, other)],
+                             sorted(non_looping_counts(banana_count, 300)))
+
+    def test_iter_bits(self):
+        self.assertEqual([], list(iter_bits(0)))
+        self.assertEqual([0, 3, 64], list(iter_bits((1 << 64) | 9)))
+        self.assertEqual(3, lowest_bit_index(24))
+
+
+class DistractTheTrainersBitsetTests(unittest.TestCase):
+
+    def test_2_trainers(self):
+        graph = create_bitset_tournament([1, 1])
+
+        self.assertEqual(0, distract_the_trainers_bitset(graph))
+
+    def test_5_trainers(self):
+        graph = create_bitset_tournament([1, 7, 3, 21, 13])
+
+        self.assertEqual(4, distract_the_trainers_bitset(graph))
+
+    def test_18_trainers(self):
+        bananas_per_trainer = [1, 10, 7, 3, 21, 13, 109, 21, 13, 19, 1, 7, 3, 21, 13, 19, 3, 54]
+        graph = create_bitset_tournament(bananas_per_trainer)
+
+        self.assertEqual(18, distract_the_trainers_bitset(graph))
+        self.assertEqual(create_bitset_tournament(bananas_per_trainer), graph)
+
+    def test_matches_adjacency_list_greedy(self):
+        generator = random.Random(7)
+
+        for trainer_count in range(1, 60):
+            # small banana counts give plenty of pairs that do not loop, so the graphs are far from complete
+            bananas_per_trainer = [generator.randint(1, 16) for _ in range(trainer_count)]
+
+            expected = distract_the_trainers(create_wrestling_tournament(bananas_per_trainer))
+            distracted_trainers = distract_the_trainers_bitset(create_bitset_tournament(bananas_per_trainer))
+            self.assertEqual(expected, distracted_trainers)
+
+    def test_solution_modes_agree(self):
+        bananas_per_trainer = [1, 7, 3, 21, 13, 109, 21, 13, 19, 1, 7, 3, 21, 13, 19, 3, 54]
+
+        self.assertEqual(1, solution(bananas_per_trainer, mode="bitset"))
+        self.assertEqual(None, solution([1] * 101, mode="bitset"))
+        self.assertEqual(101, solution([1] * 101, mode="bitset", max_trainers=1000))
+        self.assertRaises(ValueError, solution, bananas_per_trainer, mode="unknown")
+
+
+def brute_force_matching_size(adjacency, nodes=None):
+    """
+    Find the size of a maximum matching by trying every choice; only for checking maximum_matching() on tiny graphs.
+    """
+    if nodes is None:
+        nodes = frozenset(range(len(adjacency)))
+    if not nodes:
+        return 0
+
+    node = min(nodes)
+    rest = nodes - {node}
+    best = brute_force_matching_size(adjacency, rest)
+
+    for neighbor in adjacency[node]:
+        if neighbor in rest:
+            best = max(best, 1 + brute_force_matching_size(adjacency, rest - {neighbor}))
+
+    return best
+
+
+class MaximumMatchingTests(unittest.TestCase):
+
+    def assertValidMatching(self, adjacency, mate):
+        for node, partner in enumerate(mate):
+            if partner != -1:
+                self.assertEqual(node, mate[partner])
+                self.assertIn(partner, adjacency[node])
+
+    def test_blossom(self):
+        # A triangle 0-1-2 with 1 and 2 matched, and a pendant 1-3: the only augmenting path from 0 is 0-2-1-3, which
+        # is found by contracting the triangle
+        adjacency = [[1, 2], [0, 2, 3], [0, 1], [1]]
+        mate = maximum_matching(adjacency, [-1, 2, 1, -1])
+
+        self.assertValidMatching(adjacency, mate)
+        self.assertEqual([2, 3, 0, 1], mate)
+
+    def test_no_edges(self):
+        self.assertEqual([-1, -1, -1], maximum_matching([[], [], []]))
+        self.assertEqual([], maximum_matching([]))
+
+    def test_random_graphs_against_brute_force(self):
+        generator = random.Random(11)
+
+        for _ in range(200):
+            node_count = generator.randint(1, 10)
+            density = generator.random()
+            adjacency = [[] for _ in range(node_count)]
+            for i in range(node_count):
+                for j in range(i + 1, node_count):
+                    if generator.random() < density:
+                        adjacency[i].append(j)
+                        adjacency[j].append(i)
+
+            mate = maximum_matching(adjacency)
+            self.assertValidMatching(adjacency, mate)
+            self.assertEqual(2 * brute_force_matching_size(adjacency), matched_count(mate))
+
+    def test_exact_is_never_worse_than_greedy(self):
+        generator = random.Random(3)
+
+        for trainer_count in range(1, 60):
+            bananas_per_trainer = [generator.randint(1, 16) for _ in range(trainer_count)]
+            graph = create_bitset_tournament(bananas_per_trainer)
+
+            self.assertLessEqual(distract_the_trainers_bitset(graph), distract_the_trainers_exact(graph))
+
+    def test_exact_improves_on_greedy(self):
+        # the greedy pairing leaves 2 of these 8 nodes unpaired, though all of them can be
+        graph = BitsetGraph.from_adjacency_list({0: [1, 3, 4], 1: [0, 5, 6, 7], 2: [4, 6], 3: [0, 5, 6, 7], 4: [0, 2],
+                                                 5: [1, 3], 6: [1, 2, 3], 7: [1, 3]})
+
+        self.assertEqual(6, distract_the_trainers_bitset(graph))
+        self.assertEqual(8, distract_the_trainers_exact(graph))
+
+    def test_exact_matches_brute_force(self):
+        generator = random.Random(4)
+
+        for trainer_count in range(1, 13):
+            for _ in range(20):
+                bananas_per_trainer = [generator.choice([1, 1, 1, 3, 5, 7, 12]) for _ in range(trainer_count)]
+                graph = create_bitset_tournament(bananas_per_trainer)
+
+                self.assertEqual(2 * brute_force_matching_size(graph.to_adjacency_list()),
+                                 distract_the_trainers_exact(graph))
+
+    def test_solution_exact_mode(self):
+        self.assertEqual(0, solution([1, 7, 3, 21, 13, 19], mode="exact"))
+        self.assertEqual(1, solution([1, 7, 3, 21, 13, 109, 21, 13, 19, 1, 7, 3, 21, 13, 19, 3, 54], mode="exact"))
+        self.assertEqual(2, solution([1, 1], mode="exact"))
+
+
+class CompressedMatchingTests(unittest.TestCase):
+
+    def test_cached_verdicts_match(self):
+        for a in range(1, 40):
+            for b in range(1, 40):
+                self.assertEqual(results_in_infinite_loop(a, b), cached_results_in_infinite_loop(a, b))
+
+    def test_cache_is_keyed_on_reduced_pair(self):
+        cached_results_in_infinite_loop(3, 5)
+        hits = _reduced_pair_loops.cache_info().hits
+
+        cached_results_in_infinite_loop(5, 3)
+        cached_results_in_infinite_loop(60, 36)
+        self.assertEqual(hits + 2, _reduced_pair_loops.cache_info().hits)
+
+    def test_class_tournament_for_large_counts(self):
+        banana_counts = [pow(2, 31), 3 * pow(2, 31), 5 * pow(2, 33), 7, pow(2, 40) - 1]
+        expected = [[j for j, other in enumerate(banana_counts) if results_in_infinite_loop(count, other)]
+                    for count in banana_counts]
+
+        self.assertEqual(expected, create_class_tournament(banana_counts))
+
+    def test_augment_class_pairings(self):
+        # a triangle of classes with 2 trainers each: pairing classes 0 and 1 fully leaves class 2 stranded, and the
+        # walk 2 -> 0 => 1 -> 2 takes one pair off the edge between 0 and 1 to pair class 2 with both of them
+        adjacency = [[1, 2], [0, 2], [0, 1]]
+        pairings, complete = augment_class_pairings(adjacency, [2, 2, 2], [(0, 1, 2)])
+
+        self.assertTrue(complete)
+        self.assertEqual([(0, 1, 1), (0, 2, 1), (1, 2, 1)], sorted(pairings))
+
+        # a triangle with one trainer per class can't pair everyone, but the walk from class 2 looks like it could
+        pairings, complete = augment_class_pairings(adjacency, [1, 1, 1], [(0, 1, 1)])
+        self.assertEqual([(0, 1, 1)], pairings)
+        self.assertFalse(complete)
+        self.assertEqual(1, class_deficiency(adjacency, [1, 1, 1]))
+
+    def test_class_pairings_against_exact(self):
+        generator = random.Random(10)
+
+        for _ in range(300):
+            distinct_counts = sorted(set(generator.randint(1, 24) for _ in range(generator.randint(1, 6))))
+            sizes = [generator.randint(1, 4) for _ in distinct_counts]
+            bananas_per_trainer = [count for count, size in zip(distinct_counts, sizes) for _ in range(size)]
+            adjacency = create_class_tournament(distinct_counts)
+            pairings, complete = augment_class_pairings(adjacency, sizes, greedy_matching_classes(adjacency, sizes))
+
+            best = distract_the_trainers_exact(create_bitset_tournament(bananas_per_trainer))
+            paired = 2 * sum(pair_count for _, _, pair_count in pairings)
+            self.assertLessEqual(paired, best)
+            if complete:
+                self.assertEqual(best, paired)
+            self.assertLessEqual(class_deficiency(adjacency, sizes), len(bananas_per_trainer) - best)
+            self.assertEqual(best, matched_count(compressed_matching(bananas_per_trainer)))
+
+    def test_class_tournament_matches_pairwise_verdicts(self):
+        banana_counts = [1, 7, 3, 21, 13, 19, 54, 109, 2, 6]
+        expected = [[j for j, other in enumerate(banana_counts) if results_in_infinite_loop(count, other)]
+                    for count in banana_counts]
+
+        self.assertEqual(expected, create_class_tournament(banana_counts))
+
+    def test_group_trainers(self):
+        banana_counts, members = group_trainers([7, 1, 7, 3, 1, 7])
+
+        self.assertEqual([7, 1, 3], banana_counts)
+        self.assertEqual([[0, 2, 5], [1, 4], [3]], members)
+
+    def test_18_trainers(self):
+        bananas_per_trainer = [1, 10, 7, 3, 21, 13, 109, 21, 13, 19, 1, 7, 3, 21, 13, 19, 3, 54]
+        mate = compressed_matching(bananas_per_trainer)
+
+        self.assertEqual(18, matched_count(mate))
+        for trainer, partner in enumerate(mate):
+            self.assertEqual(trainer, mate[partner])
+            self.assertTrue(results_in_infinite_loop(bananas_per_trainer[trainer], bananas_per_trainer[partner]))
+
+    def test_same_bananas_are_never_paired(self):
+        self.assertEqual([-1] * 5, compressed_matching([4] * 5))
+        self.assertEqual(5, solution([4] * 5, mode="compressed"))
+
+    def test_many_duplicates(self):
+        bananas_per_trainer = [1] * 30 + [7] * 20 + [13] * 10
+
+        self.assertEqual(solution(bananas_per_trainer, mode="exact"), solution(bananas_per_trainer, mode="compressed"))
+
+    def test_matches_exact(self):
+        generator = random.Random(2)
+
+        for _ in range(300):
+            distinct_counts = [generator.randint(1, 60) for _ in range(generator.randint(1, 8))]
+            bananas_per_trainer = [generator.choice(distinct_counts) for _ in range(generator.randint(1, 60))]
+
+            expected = distract_the_trainers_exact(create_bitset_tournament(bananas_per_trainer))
+            self.assertEqual(expected, matched_count(compressed_matching(bananas_per_trainer)))
+
+
+class TrainerMatcherTests(unittest.TestCase):
+
+    def test_initial_roster(self):
+        bananas_per_trainer = [1, 7, 3, 21, 13, 109, 21, 13, 19, 1, 7, 3, 21, 13, 19, 3, 54]
+        matcher = TrainerMatcher(bananas_per_trainer)
+
+        self.assertEqual(17, len(matcher))
+        self.assertEqual(1, matcher.remaining_trainers())
+        for trainer, partner in matcher.pairs():
+            self.assertEqual(partner, matcher.partner(trainer))
+            self.assertTrue(results_in_infinite_loop(bananas_per_trainer[trainer], bananas_per_trainer[partner]))
+
+    def test_arrivals_and_departures(self):
+        matcher = TrainerMatcher([1, 1])
+        self.assertEqual(2, matcher.remaining_trainers())
+
+        trainer = matcher.add_trainer(4)
+        self.assertEqual(1, matcher.remaining_trainers())
+
+        partner = matcher.partner(trainer)
+        matcher.remove_trainer(partner)
+        self.assertEqual(0, matcher.remaining_trainers())
+        self.assertNotIn(partner, matcher)
+        self.assertRaises(KeyError, matcher.remove_trainer, partner)
+
+        # the id of a trainer who left is reused
+        self.assertEqual(partner, matcher.add_trainer(12))
+
+    def test_matches_exact_after_random_changes(self):
+        generator = random.Random(4)
+        matcher = TrainerMatcher()
+        roster = {}
+
+        for _ in range(300):
+            if roster and generator.random() < 0.4:
+                trainer = generator.choice(sorted(roster))
+                matcher.remove_trainer(trainer)
+                del roster[trainer]
+            else:
+                banana_count = generator.randint(1, 40)
+                roster[matcher.add_trainer(banana_count)] = banana_count
+
+            expected = distract_the_trainers_exact(create_bitset_tournament(list(roster.values())))
+            self.assertEqual(expected, matcher.distracted_trainers())
+            self.assertEqual(len(roster), len(matcher))
+
+
+class AnytimeMatchingTests(unittest.TestCase):
+
+    def test_finishes_with_exact_result_and_tight_bound(self):
+        generator = random.Random(6)
+
+        for _ in range(100):
+            distinct_counts = [generator.randint(1, 60) for _ in range(generator.randint(1, 8))]
+            bananas_per_trainer = [generator.choice(distinct_counts) for _ in range(generator.randint(1, 60))]
+
+            expected = distract_the_trainers_exact(create_bitset_tournament(bananas_per_trainer))
+
+            for greedy_max_trainers in [ANYTIME_GREEDY_MAX_TRAINERS, 0]:
+                mate, upper_bound = anytime_matching(bananas_per_trainer, deadline=float("inf"), initial_steps=2,
+                                                     greedy_max_trainers=greedy_max_trainers)
+                self.assertEqual(expected, matched_count(mate))
+                self.assertEqual(expected, upper_bound)
+
+    def test_deadline_already_passed(self):
+        bananas_per_trainer = [1, 7, 3, 21, 13, 109, 21, 13, 19, 1, 7, 3, 21, 13, 19, 3, 54]
+
+        mate, upper_bound = anytime_matching(bananas_per_trainer, deadline=0, clock=lambda: 1)
+        expected = distract_the_trainers_exact(create_bitset_tournament(bananas_per_trainer))
+        self.assertLessEqual(matched_count(mate), expected)
+        self.assertGreaterEqual(upper_bound, expected)
+        self.assertEqual(16, upper_bound)
+
+    def assertValidPairing(self, bananas_per_trainer, mate):
+        for trainer, partner in enumerate(mate):
+            if partner != -1:
+                self.assertEqual(trainer, mate[partner])
+                self.assertTrue(results_in_infinite_loop(bananas_per_trainer[trainer], bananas_per_trainer[partner]))
+
+    def assertMaximal(self, bananas_per_trainer, mate):
+        unpaired = [trainer for trainer, partner in enumerate(mate) if partner == -1]
+        for trainer in unpaired:
+            for other in unpaired:
+                self.assertFalse(results_in_infinite_loop(bananas_per_trainer[trainer], bananas_per_trainer[other]))
+
+    @staticmethod
+    def uneven_roster():
+        # the pools pair 52 of these trainers, and the greedy pairing pairs 58, the most any pairing can
+        generator = random.Random(29)
+        distinct_counts = [generator.randint(1, 64) for _ in range(6)]
+        return [generator.choice(distinct_counts) for _ in range(60)]
+
+    def test_deadline_during_pool_pairing(self):
+        bananas_per_trainer = self.uneven_roster()
+
+        # the clock advances by one each time it is read, once per trainer while the pools are paired
+        mate, upper_bound = anytime_matching(bananas_per_trainer, deadline=10, clock=itertools.count().__next__)
+
+        self.assertValidPairing(bananas_per_trainer, mate)
+        self.assertGreater(matched_count(mate), 0)
+        self.assertEqual(60, upper_bound)
+
+    def test_deadline_while_building_rows(self):
+        bananas_per_trainer = self.uneven_roster()
+
+        # the pools take 60 readings of the clock, and then each row of the graph takes one
+        mate, upper_bound = anytime_matching(bananas_per_trainer, deadline=65, clock=itertools.count().__next__)
+
+        self.assertValidPairing(bananas_per_trainer, mate)
+        self.assertMaximal(bananas_per_trainer, mate)
+        self.assertEqual(52, matched_count(mate))
+        self.assertEqual(60, upper_bound)
+
+    def test_deadline_during_greedy_pairing(self):
+        bananas_per_trainer = self.uneven_roster()
+
+        # after 60 readings for the pools and 60 for the rows, the greedy pairing is cut short after a few pairs
+        mate, upper_bound = anytime_matching(bananas_per_trainer, deadline=125, clock=itertools.count().__next__)
+
+        self.assertValidPairing(bananas_per_trainer, mate)
+        self.assertMaximal(bananas_per_trainer, mate)
+        self.assertGreaterEqual(matched_count(mate), 52)
+        self.assertEqual(60, upper_bound)
+
+    def test_improves_steadily_until_the_deadline(self):
+        bananas_per_trainer = self.uneven_roster()
+
+        for greedy_max_trainers in [ANYTIME_GREEDY_MAX_TRAINERS, 0]:
+            matched = 0
+            for deadline in range(200):
+                clock = itertools.count()
+                mate, upper_bound = anytime_matching(bananas_per_trainer, deadline, initial_steps=1,
+                                                     clock=clock.__next__, greedy_max_trainers=greedy_max_trainers)
+
+                # no reading of the clock after the one that reached the deadline
+                self.assertLessEqual(next(clock), deadline + 1)
+                self.assertValidPairing(bananas_per_trainer, mate)
+                self.assertGreaterEqual(matched_count(mate), matched)
+                self.assertGreaterEqual(upper_bound, 58)
+                matched = matched_count(mate)
+
+            self.assertEqual(58, matched)
+            self.assertEqual(58, upper_bound)
+
+    def test_perfect_pool_pairing_is_returned_at_once(self):
+        bananas_per_trainer = [1, 7, 3, 21, 13, 109, 21, 13, 19, 1, 7, 3, 21, 13, 19, 3, 54]
+        clock = itertools.count()
+
+        mate, upper_bound = anytime_matching(bananas_per_trainer, deadline=float("inf"), clock=clock.__next__)
+
+        self.assertValidPairing(bananas_per_trainer, mate)
+        self.assertEqual(16, matched_count(mate))
+        self.assertEqual(16, upper_bound)
+        self.assertEqual(17, next(clock))
+
+    def test_odd_set_deficiency(self):
+        # 5 trainers with 1 banana, who can only be paired with the 2 trainers holding 13 or 21
+        bananas_per_trainer = [1, 1, 1, 1, 1, 13, 21]
+        banana_counts, members = group_trainers(bananas_per_trainer)
+
+        self.assertEqual(3, odd_set_deficiency(create_bitset_tournament(bananas_per_trainer), members))
+        self.assertEqual(0, odd_set_deficiency(BitsetGraph([]), []))
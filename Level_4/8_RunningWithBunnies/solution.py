@@ -1,6 +1,19 @@
+import bisect
+import collections
+import concurrent.futures
+import hashlib
+import heapq
 import itertools
+import multiprocessing
+import operator
+import os
+import random
+import threading
 import unittest
 
+from array import array
+from itertools import repeat
+
 
 def all_pairs_shortest_paths(graph):
     """
@@ -22,6 +35,578 @@ def all_pairs_shortest_paths(graph):
                     graph[i][j] = graph[i][k] + graph[k][j]
 
 
+def all_pairs_shortest_paths_fast(graph):
+    """
+    Same as all_pairs_shortest_paths(), in place, using shortest_path_matrix() to do the work.
+
+    :param graph: a dense graph represented as a square matrix
+    """
+    for row, distances in zip(graph, shortest_path_matrix(graph)):
+        row[:] = distances
+
+
+def shortest_path_matrix(graph):
+    """
+    Run the Floyd-Warshall algorithm one row at a time, rather than one cell at a time, and return the shortest path
+    matrix without changing the given graph.
+
+    When no edge weight is negative, each row is packed into one big integer and each row update is done with a
+    handful of integer operations (see floyd_warshall_packed()). Otherwise, each row update is a single list
+    comprehension (see floyd_warshall_rows()). Either way, the innermost loop of all_pairs_shortest_paths() runs in C.
+
+    :param graph: a dense graph represented as a square matrix
+    :return: the matrix of shortest path lengths
+    """
+    if not graph:
+        return []
+
+    if min(min(row) for row in graph) >= 0:
+        return floyd_warshall_packed(graph)
+
+    return floyd_warshall_rows(graph)
+
+
+def has_negative_cycle(distances):
+    """
+    A node lies on a negative cycle exactly when its shortest path back to itself is negative.
+
+    :param distances: the matrix of shortest path lengths
+    :return: True if the graph contains a negative cycle, otherwise return False
+    """
+    return any(distances[node][node] < 0 for node in range(len(distances)))
+
+
+SHORTEST_PATHS_CACHE_SIZE = 64
+
+_shortest_paths_cache = collections.OrderedDict()
+_shortest_paths_cache_lock = threading.Lock()
+
+
+def matrix_digest(matrix):
+    """
+    Return a 128-bit hash of the contents of a matrix, for use as a cache key. Each row is hashed as its length and
+    its packed 64-bit integers, so a list and a tuple of the same values get the same key, and the key does not hold
+    on to the matrix itself. A row that doesn't fit in 64-bit integers is hashed as the repr() of its values.
+    """
+    digest = hashlib.blake2b(array("q", [len(matrix)]).tobytes(), digest_size=16)
+
+    for row in matrix:
+        try:
+            encoded = b"q" + array("q", row).tobytes()
+        except (TypeError, OverflowError):
+            encoded = b"r" + repr(tuple(row)).encode("utf-8")
+        digest.update(array("q", [len(encoded)]).tobytes())
+        digest.update(encoded)
+
+    return digest.digest()
+
+
+def cached_shortest_path_matrix(graph):
+    """
+    Same as shortest_path_matrix(), but remember the results for the most recently used graphs, keyed by a hash of
+    their contents. Calling solution() again with the same times matrix and a different time limit then skips the
+    O(n^3) step. The given graph is never changed, so the same matrix can be shared between threads.
+
+    The result is shared between callers, so it is returned as a tuple of tuples that cannot be changed by accident.
+
+    :param graph: a dense graph represented as a square matrix
+    :return: the matrix of shortest path lengths
+    """
+    key = matrix_digest(graph)
+
+    with _shortest_paths_cache_lock:
+        distances = _shortest_paths_cache.get(key)
+        if distances is not None:
+            _shortest_paths_cache.move_to_end(key)
+            return distances
+
+    distances = tuple(tuple(row) for row in shortest_path_matrix(graph))
+
+    with _shortest_paths_cache_lock:
+        _shortest_paths_cache[key] = distances
+        while len(_shortest_paths_cache) > SHORTEST_PATHS_CACHE_SIZE:
+            _shortest_paths_cache.popitem(last=False)
+
+    return distances
+
+
+def clear_shortest_paths_cache():
+    with _shortest_paths_cache_lock:
+        _shortest_paths_cache.clear()
+
+
+def floyd_warshall_rows(graph):
+    """
+    The Floyd-Warshall algorithm with each row relaxed through node k by one list comprehension:
+
+        D[i] = min(D[i], D[i][k] + D[k]), element by element
+
+    Works for any edge weights, including negative cycles, which show up as negative values on the diagonal.
+
+    :param graph: a dense graph represented as a square matrix
+    :return: the matrix of shortest path lengths
+    """
+    distances = [list(row) for row in graph]
+
+    for k in range(len(distances)):
+        row_k = distances[k]
+
+        for i, row_i in enumerate(distances):
+            through_k = map(operator.add, repeat(row_i[k], len(row_k)), row_k)
+            distances[i] = [direct if direct <= indirect else indirect for direct, indirect in zip(row_i, through_k)]
+
+    return distances
+
+
+def floyd_warshall_packed(graph):
+    """
+    The Floyd-Warshall algorithm with each row packed into one big integer, one fixed-width lane per column, so a whole
+    row is relaxed through node k with a few big-integer operations instead of a loop over columns.
+
+    Each lane is wide enough to hold the sum of two path lengths, plus a guard bit at the top. For rows A and B:
+    * B + d * ONES adds d to every lane of B at once, where ONES has a 1 in the lowest bit of every lane;
+    * ((A | GUARDS) - B) & GUARDS leaves the guard bit set in exactly the lanes where A >= B, since setting the guard
+      bit first means no lane borrows from its neighbour;
+    * subtracting that value shifted down to bit 0 of each lane turns each guard bit into a mask over its lane,
+      which picks the smaller of the two lanes.
+
+    Only for non-negative edge weights, so that every lane holds a non-negative value.
+
+    :param graph: a dense graph represented as a square matrix with no negative values
+    :return: the matrix of shortest path lengths
+    """
+    n = len(graph)
+    longest_path = max(n - 1, 1) * max(max(row) for row in graph)
+    lane_bytes = ((2 * longest_path).bit_length() + 1 + 7) // 8  # room for the sum of two paths and a guard bit
+    lane_bits = 8 * lane_bytes
+    guard_shift = lane_bits - 1
+    lane_mask = (1 << lane_bits) - 1
+
+    ones = int.from_bytes((b"\x01" + bytes(lane_bytes - 1)) * n, "little")
+    guards = ones << guard_shift
+
+    rows = [pack_row(row, lane_bytes) for row in graph]
+
+    for k in range(n):
+        row_k = rows[k]
+        shift_k = k * lane_bits
+
+        for i, row_i in enumerate(rows):
+            through_k = row_k + ((row_i >> shift_k) & lane_mask) * ones
+            not_smaller = ((row_i | guards) - through_k) & guards
+            mask = not_smaller - (not_smaller >> guard_shift)
+            rows[i] = row_i ^ ((row_i ^ through_k) & mask)
+
+    return [unpack_row(row, n, lane_bytes) for row in rows]
+
+
+def pack_row(row, lane_bytes):
+    """
+    Pack a row of non-negative integers into one integer, lane_bytes bytes per value, first value lowest.
+    """
+    return int.from_bytes(b"".join(value.to_bytes(lane_bytes, "little") for value in row), "little")
+
+
+def unpack_row(packed, n, lane_bytes):
+    """
+    Unpack a row of n values packed by pack_row().
+    """
+    data = packed.to_bytes(n * lane_bytes, "little")
+
+    return [int.from_bytes(data[j:j + lane_bytes], "little") for j in range(0, n * lane_bytes, lane_bytes)]
+
+
+class DynamicShortestPaths(object):
+    """
+    All-pairs shortest paths for a times matrix whose entries change a few at a time, kept up to date without running
+    the Floyd-Warshall algorithm again after every change.
+
+    * When an edge gets cheaper, every shortest path either stays the same or now uses the edge, so one O(n^2) pass
+      over the matrix updates it: D[i][j] = min(D[i][j], D[i][u] + w + D[v][j]).
+    * When an edge gets dearer, only the rows with a shortest path through it can change. If the edge was not itself
+      a shortest path from u to v, nothing changes at all. Otherwise each such row is found again with a dense
+      Dijkstra search, reweighted by the old distances from node 0, which stay valid potentials when weights go up.
+    * A cheaper edge (u, v) makes a negative cycle exactly when D[v][u] + w < 0, which is checked in O(1). Once there
+      is a negative cycle, a dearer edge may break it, so the matrix is computed again from scratch.
+    """
+
+    def __init__(self, times):
+        """
+        :param times: a matrix, as given to solution(); it is copied, not changed
+        """
+        self.times = [list(row) for row in times]
+        self.distances = shortest_path_matrix(self.times)
+        self.has_negative_cycle = has_negative_cycle(self.distances)
+
+    def __len__(self):
+        return len(self.times)
+
+    def update(self, source, target, weight):
+        """
+        Change the time of the corridor from source to target.
+
+        :param source: the row of times to change
+        :param target: the column of times to change
+        :param weight: the new time
+        :return: the number of rows of the distance matrix that were computed again
+        """
+        old_weight = self.times[source][target]
+        self.times[source][target] = weight
+
+        if weight == old_weight:
+            return 0
+
+        if self.has_negative_cycle:
+            if weight < old_weight:
+                return 0  # making an edge cheaper can't break a negative cycle; the distances stay meaningless
+
+            self.distances = shortest_path_matrix(self.times)
+            self.has_negative_cycle = has_negative_cycle(self.distances)
+            return len(self.times)
+
+        if weight < old_weight:
+            self._decrease(source, target, weight)
+            return 0
+
+        return self._increase(source, target, old_weight)
+
+    def rescue(self, time_limit, mode="held_karp"):
+        """
+        :param time_limit: the time limit
+        :param mode: how to search for the best rescue, one of the keys of RESCUE_MODES
+        :return: the ids of the rescued bunnies, as solution() would return them for the current times
+        """
+        if mode not in RESCUE_MODES:
+            raise ValueError("unknown rescue mode %r, expected one of %s" % (mode, ", ".join(sorted(RESCUE_MODES))))
+
+        if self.has_negative_cycle:
+            return list(range(max(len(self.times) - 2, 0)))
+
+        return RESCUE_MODES[mode](self.distances, time_limit)
+
+    def _decrease(self, source, target, weight):
+        distances = self.distances
+        row_target = self._walks_from(target)
+        if row_target[source] + weight < 0:
+            self.has_negative_cycle = True
+
+        for i, row_i in enumerate(distances):
+            through_edge = (row_i[source] if i != source else 0) + weight
+            if through_edge >= row_i[target]:
+                continue  # no path from i gets shorter by taking the edge
+
+            candidates = map(operator.add, repeat(through_edge, len(row_target)), row_target)
+            distances[i] = [direct if direct <= indirect else indirect for direct, indirect in zip(row_i, candidates)]
+
+    def _increase(self, source, target, old_weight):
+        distances = self.distances
+        if old_weight > distances[source][target]:
+            return 0  # the edge was not on any shortest path
+
+        if source == target:
+            # a non-negative self-loop only ever shortens the path from a node back to itself
+            distances[source][source] = self._cycle_length(source, distances[source])
+            return 1
+
+        row_target = self._walks_from(target)
+        affected = [i for i, row_i in enumerate(distances)
+                    if any(map(operator.eq,
+                               map(operator.add, repeat((row_i[source] if i != source else 0) + old_weight,
+                                                        len(row_target)), row_target),
+                               row_i))]
+
+        potentials = list(distances[0])
+        for i in affected:
+            distances[i] = self._dijkstra_row(i, potentials)
+
+        return len(affected)
+
+    def _walks_from(self, node):
+        """
+        The diagonal holds the shortest cycle through each node, but a path that ends where it starts can also just
+        stay put, so the shortest walk from node to itself is at most 0.
+
+        :return: the shortest walks from node to every node
+        """
+        row = list(self.distances[node])
+        row[node] = min(row[node], 0)
+
+        return row
+
+    def _dijkstra_row(self, source, potentials):
+        """
+        The shortest paths from source, with a dense O(n^2) Dijkstra search over the edges reweighted by potentials.
+        """
+        times = self.times
+        n = len(times)
+        infinity = float("inf")
+
+        frontier = [infinity] * n
+        frontier[source] = 0
+        settled = [False] * n
+        reduced = [infinity] * n
+
+        for _ in range(n):
+            node = min(range(n), key=frontier.__getitem__)
+            if frontier[node] == infinity:
+                break
+
+            reduced[node] = frontier[node]
+            settled[node] = True
+            frontier[node] = infinity
+
+            base = reduced[node] + potentials[node]
+            candidates = map(operator.sub, map(operator.add, repeat(base, n), times[node]), potentials)
+            frontier = [current if done or current <= candidate else candidate
+                        for current, candidate, done in zip(frontier, candidates, settled)]
+
+        shift = potentials[source]
+        row = [distance - shift + potential for distance, potential in zip(reduced, potentials)]
+        row[source] = self._cycle_length(source, row)
+
+        return row
+
+    def _cycle_length(self, node, row):
+        """
+        :return: the shortest path from node back to itself, given the shortest paths from node to every other node
+        """
+        times = self.times
+
+        return min([times[node][node]] + [row[other] + times[other][node] for other in range(len(times))
+                                          if other != node])
+
+
+class CSRGraph(object):
+    """
+    A sparse directed graph in compressed sparse row (CSR) form: the edges leaving node u are
+    indices[indptr[u]:indptr[u + 1]], with the matching weights[indptr[u]:indptr[u + 1]].
+    """
+
+    def __init__(self, indptr, indices, weights):
+        """
+        :param indptr: n + 1 offsets into indices and weights, starting at 0
+        :param indices: the target of each edge
+        :param weights: the weight of each edge
+        """
+        if len(indices) != len(weights) or not indptr or indptr[0] != 0 or indptr[-1] != len(indices):
+            raise ValueError("indptr, indices and weights do not describe a CSR graph")
+
+        self.indptr = array('q', indptr)
+        self.indices = array('q', indices)
+        self.weights = list(weights)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def edges(self, node):
+        """
+        :return: the (target, weight) pairs of the edges leaving node
+        """
+        start, end = self.indptr[node], self.indptr[node + 1]
+
+        return zip(self.indices[start:end], self.weights[start:end])
+
+    @classmethod
+    def from_matrix(cls, times):
+        """
+        Build a CSRGraph from a times matrix as given to solution(). Every entry off the diagonal is an edge; an entry
+        on the diagonal is only kept if it is negative, since it is then a negative cycle on its own.
+        """
+        indptr = [0]
+        indices = []
+        weights = []
+
+        for source, row in enumerate(times):
+            for target, weight in enumerate(row):
+                if target != source or weight < 0:
+                    indices.append(target)
+                    weights.append(weight)
+            indptr.append(len(indices))
+
+        return cls(indptr, indices, weights)
+
+
+def bellman_ford_potentials(graph):
+    """
+    The reweighting step of Johnson's algorithm: the shortest path lengths from a virtual node with a zero-weight edge
+    to every node, found with the Bellman-Ford algorithm. Every edge (u, v, w) then has w + h[u] - h[v] >= 0.
+
+    :param graph: a CSRGraph
+    :return: the potentials h, or None if the graph has a negative cycle
+    """
+    n = len(graph)
+    indptr, indices, weights = graph.indptr, graph.indices, graph.weights
+    potentials = [0] * n  # the edges from the virtual node have already been relaxed
+
+    for _ in range(n):
+        changed = False
+
+        for source in range(n):
+            base = potentials[source]
+            for edge in range(indptr[source], indptr[source + 1]):
+                target = indices[edge]
+                if base + weights[edge] < potentials[target]:
+                    potentials[target] = base + weights[edge]
+                    changed = True
+
+        if not changed:
+            return potentials
+
+    return None  # still improving after n passes, so some path can be made shorter forever
+
+
+def dijkstra_with_next_hops(graph, potentials, source):
+    """
+    The shortest paths from one node, with a heap-based Dijkstra search over the reweighted edges.
+
+    :param graph: a CSRGraph
+    :param potentials: the potentials from bellman_ford_potentials()
+    :param source: the node to start from
+    :return: the shortest path length to every node (inf if it can't be reached), and the first node after source on
+             each of those paths (-1 for source itself and for nodes that can't be reached)
+    """
+    n = len(graph)
+    indptr, indices, weights = graph.indptr, graph.indices, graph.weights
+    infinity = float("inf")
+
+    reduced = [infinity] * n
+    next_hops = [-1] * n
+    done = [False] * n
+    reduced[source] = 0
+    heap = [(0, source)]
+
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if done[node]:
+            continue
+        done[node] = True
+
+        base = distance + potentials[node]
+        hop = next_hops[node]
+        for edge in range(indptr[node], indptr[node + 1]):
+            target = indices[edge]
+            candidate = base + weights[edge] - potentials[target]
+            if candidate < reduced[target]:
+                reduced[target] = candidate
+                next_hops[target] = target if node == source else hop
+                heapq.heappush(heap, (candidate, target))
+
+    shift = potentials[source]
+    distances = [distance - shift + potential if distance < infinity else infinity
+                 for distance, potential in zip(reduced, potentials)]
+
+    return distances, next_hops
+
+
+def next_hop_typecode(n):
+    """
+    :return: the smallest signed array typecode that holds every node index below n, and -1
+    """
+    for typecode in ('b', 'h', 'i'):
+        if n <= 1 << (8 * array(typecode).itemsize - 1):
+            return typecode
+
+    return 'q'
+
+
+class ShortestPaths(object):
+    """
+    The result of johnson_shortest_paths(): the matrix of shortest path lengths, plus a compact next-hop matrix from
+    which the corridor route behind any of them can be rebuilt without searching again.
+    """
+
+    def __init__(self, distances, next_hops):
+        """
+        :param distances: the matrix of shortest path lengths, as a tuple of tuples, or None if there is a negative
+                          cycle
+        :param next_hops: a flat array, n * n long, of the first node after u on the shortest path from u to v at index
+                          u * n + v, with -1 where there is no such node
+        """
+        self.distances = distances
+        self.next_hops = next_hops
+
+    @property
+    def has_negative_cycle(self):
+        return self.distances is None
+
+    def route(self, source, target):
+        """
+        :return: the nodes on the shortest path from source to target, both included, or None if target can't be
+                 reached
+        """
+        n = len(self.distances)
+        nodes = [source]
+
+        while source != target:
+            source = self.next_hops[source * n + target]
+            if source < 0:
+                return None
+            nodes.append(source)
+
+        return nodes
+
+    def rescue_route(self, bunnies):
+        """
+        :param bunnies: the ids of the bunnies to pick up, in the order to pick them up
+        :return: every node walked through, from the start to the bulkhead, or None if the route can't be walked
+        """
+        stops = [0] + [bunny + 1 for bunny in bunnies] + [len(self.distances) - 1]
+        nodes = [0]
+
+        for source, target in zip(stops, stops[1:]):
+            leg = self.route(source, target)
+            if leg is None:
+                return None
+            nodes.extend(leg[1:])
+
+        return nodes
+
+
+# The graph and potentials used by the Dijkstra searches running in a worker process, set by _init_johnson_worker()
+_johnson_graph = None
+_johnson_potentials = None
+
+
+def _init_johnson_worker(graph, potentials):
+    global _johnson_graph, _johnson_potentials
+    _johnson_graph = graph
+    _johnson_potentials = potentials
+
+
+def _dijkstra_in_worker(source):
+    return dijkstra_with_next_hops(_johnson_graph, _johnson_potentials, source)
+
+
+def johnson_shortest_paths(graph, max_workers=1):
+    """
+    All-pairs shortest paths on a sparse graph with Johnson's algorithm: one Bellman-Ford pass to reweight the edges
+    (and to find negative cycles), then a Dijkstra search from every node. This takes O(n * m * log(n)) time for m
+    edges, rather than the O(n^3) of the Floyd-Warshall algorithm, and never builds the dense times matrix.
+
+    :param graph: a CSRGraph
+    :param max_workers: the number of processes to spread the Dijkstra searches over, or None for one per CPU
+    :return: a ShortestPaths
+    """
+    n = len(graph)
+    potentials = bellman_ford_potentials(graph)
+    if potentials is None:
+        return ShortestPaths(None, None)
+
+    workers = max_workers if max_workers is not None else os.cpu_count() or 1
+    if workers <= 1 or n < 2:
+        rows = [dijkstra_with_next_hops(graph, potentials, source) for source in range(n)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_johnson_worker,
+                                                    initargs=(graph, potentials)) as executor:
+            rows = list(executor.map(_dijkstra_in_worker, range(n), chunksize=max(n // (4 * workers), 1)))
+
+    next_hops = array(next_hop_typecode(n))
+    for _, hops in rows:
+        next_hops.extend(hops)
+
+    return ShortestPaths(tuple(tuple(distances) for distances, _ in rows), next_hops)
+
+
 def path(bunnies):
     """
     Given a list of bunnies, return a path to pick up the bunnies.
@@ -38,7 +623,435 @@ def path(bunnies):
     return path_to_bunnies
 
 
-def solution(times, time_limit):
+def rescue_with_permutations(distances, time_limit):
+    """
+    Try every order of every subset of bunnies, largest subsets first, and return the first rescue that fits within
+    the time limit.
+
+    :param distances: the matrix of shortest path lengths, with no negative cycles
+    :param time_limit: the time limit
+    :return: the ids of the rescued bunnies
+    """
+    bunny_count = len(distances) - 2  # first row is "Start", last row is "Bulkhead"
+    rescued_bunnies = []
+
+    for bunny in reversed(range(bunny_count + 1)):
+
+        for bunnies in itertools.permutations(range(1, bunny_count + 1), r=bunny):
+            total_time = 0
+
+            path_to_bunnies = path(list(bunnies))
+
+            for start_time, end_time in path_to_bunnies:
+                total_time += distances[start_time][end_time]
+
+            if total_time <= time_limit:
+                rescued_bunnies = sorted(list(bunny - 1 for bunny in bunnies))
+                return rescued_bunnies
+
+    return rescued_bunnies
+
+
+# Stands in for "no such path" in the Held-Karp table, and fits in a signed 64-bit array entry
+UNREACHABLE = 1 << 62
+
+
+def held_karp_rescue_times(distances):
+    """
+    Find the shortest rescue time for every set of bunnies with the Held-Karp dynamic programming algorithm, instead of
+    trying every order of every subset of bunnies.
+
+    cost[mask][last] is the shortest time to go from the start, pick up exactly the bunnies in 'mask' (a bitmask of
+    bunny ids), and finish at bunny 'last'. Each entry only depends on entries for the same mask without 'last':
+
+        cost[mask][last] = min over b in mask - {last} of cost[mask - {last}][b] + distances[b][last]
+
+    so one pass over the masks in increasing order fills in the whole table, in O(2^k * k^2) time for k bunnies rather
+    than O(k!). The table is a flat array of 64-bit integers, and each minimum is taken over a whole row of the table
+    with map(), so the innermost loop runs in C. The time for a whole rescue is the best cost[mask][last] plus the time
+    from 'last' to the bulkhead.
+
+    Memory is 8 * 2^k * k bytes: 168 MB for 20 bunnies.
+
+    :param distances: the matrix of shortest path lengths, with no negative cycles
+    :return: a generator of (mask, rescue time) pairs, for every non-empty set of bunnies in increasing mask order
+    """
+    bunny_count = len(distances) - 2  # first row is "Start", last row is "Bulkhead"
+    if bunny_count < 1:
+        return
+
+    # Row b of distances_to holds the time from each bunny to bunny b; bunny b is at row b + 1 of distances
+    distances_to = [[distances[other + 1][bunny + 1] for other in range(bunny_count)] for bunny in range(bunny_count)]
+    distances_to_bulkhead = [distances[bunny + 1][-1] for bunny in range(bunny_count)]
+
+    costs = array('q', [UNREACHABLE]) * ((1 << bunny_count) * bunny_count)
+
+    for mask in range(1, 1 << bunny_count):
+        offset = mask * bunny_count
+        remaining = mask
+
+        while remaining:
+            lowest = remaining & -remaining
+            remaining ^= lowest
+            last = lowest.bit_length() - 1
+            previous = mask ^ lowest
+
+            if previous:
+                previous_offset = previous * bunny_count
+                cost = min(map(operator.add, costs[previous_offset:previous_offset + bunny_count], distances_to[last]))
+            else:
+                cost = distances[0][last + 1]
+
+            costs[offset + last] = cost if cost < UNREACHABLE else UNREACHABLE
+
+        yield mask, min(map(operator.add, costs[offset:offset + bunny_count], distances_to_bulkhead))
+
+
+def mask_to_bunnies(mask):
+    """
+    Convert a bitmask of bunnies to a sorted list of bunny ids.
+    """
+    return [bunny for bunny in range(mask.bit_length()) if mask >> bunny & 1]
+
+
+def rescue_with_held_karp(distances, time_limit):
+    """
+    Find the best rescue from the rescue times computed by held_karp_rescue_times(): the largest set of bunnies that
+    fits within the time limit, with the lowest worker IDs among sets of the same size.
+
+    :param distances: the matrix of shortest path lengths, with no negative cycles
+    :param time_limit: the time limit
+    :return: the ids of the rescued bunnies
+    """
+    best_count = 0
+    best_bunnies = []
+
+    for mask, rescue_time in held_karp_rescue_times(distances):
+        if rescue_time > time_limit:
+            continue
+
+        count = bin(mask).count("1")
+        if count >= best_count:
+            bunnies = mask_to_bunnies(mask)
+            if count > best_count or bunnies < best_bunnies:
+                best_count = count
+                best_bunnies = bunnies
+
+    return best_bunnies
+
+
+# Below this many bunnies, rescue_with_branch_and_bound() searches in the calling process
+PARALLEL_MIN_BUNNIES = 12
+
+# The most (position, visited bunnies) states one branch-and-bound search remembers the earliest arrival time for
+BRANCH_AND_BOUND_MEMO_SIZE = 1 << 20
+
+
+def rescue_score(mask, bunny_count):
+    """
+    Rank a set of bunnies as a single integer, so that a better rescue always has a higher score: a larger set scores
+    higher, and among sets of the same size, the one with the lower worker IDs scores higher. Two sorted lists of ids of
+    the same size differ first at the lowest id that is in only one of them, so the bits below the size hold the mask
+    in reverse, with bunny 0 as the most significant bit.
+
+    :param mask: a bitmask of bunnies
+    :param bunny_count: the number of bunnies
+    :return: the score
+    """
+    reversed_mask = int(format(mask, "0%db" % bunny_count)[::-1], 2) if bunny_count else 0
+
+    return bin(mask).count("1") << bunny_count | reversed_mask
+
+
+def score_to_bunnies(score, bunny_count):
+    """
+    Convert a score from rescue_score() back to a sorted list of bunny ids.
+    """
+    reversed_mask = score & ((1 << bunny_count) - 1)
+
+    return [bunny for bunny in range(bunny_count) if reversed_mask >> (bunny_count - 1 - bunny) & 1]
+
+
+class _LocalBound(object):
+    """
+    The score of the best rescue found so far, for a search that runs in a single process; it has the same 'value'
+    attribute and get_lock() method as the multiprocessing.Value shared between worker processes.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def get_lock(self):
+        return self._lock
+
+
+# The bound shared by the branch-and-bound searches running in a worker process, set by _init_branch_worker()
+_shared_bound = None
+
+
+def _init_branch_worker(shared_bound):
+    global _shared_bound
+    _shared_bound = shared_bound
+
+
+class _BranchAndBound(object):
+    """
+    A depth-first search over rescue orders that prunes every partial order that cannot beat the best rescue found so
+    far, by this search or by any other search sharing its bound. The best rescue is kept as its rescue_score().
+
+    A partial order is at some position, with a set of bunnies visited and some time spent. Finishing it with 'need'
+    more bunnies and the bulkhead takes need + 1 more moves, each of which enters a different one of those places from
+    the position or a remaining bunny, so it takes at least the sum of the cheapest such way into each of them. When
+    every remaining bunny is needed, the moves also form a spanning tree over the position, the remaining bunnies and
+    the bulkhead, so the minimum spanning tree (with each pair weighted by its cheaper direction) is a bound as well.
+    Both bounds hold for negative times.
+    """
+
+    def __init__(self, distances, time_limit, shared_bound):
+        self.distances = distances
+        self.time_limit = time_limit
+        self.shared_bound = shared_bound
+        self.bunny_count = len(distances) - 2
+        self.bulkhead = len(distances) - 1
+        self.earliest = {}
+
+        # Column p holds the time from every place to place p
+        self.columns = list(zip(*distances))
+
+    def search(self, position, visited, elapsed):
+        """
+        Search every order that starts with the bunnies in 'visited', ending at 'position' after 'elapsed' time.
+        """
+        distances = self.distances
+
+        if elapsed + distances[position][self.bulkhead] <= self.time_limit:
+            self._offer(visited)
+
+        remaining = [bunny for bunny in range(self.bunny_count) if not visited >> bunny & 1]
+        need = self._bunnies_needed(visited, remaining)
+        if need > len(remaining):
+            return
+
+        if elapsed + self._lower_bound(position, remaining, need) > self.time_limit:
+            return
+
+        key = (position, visited)
+        if self.earliest.get(key, UNREACHABLE) <= elapsed:
+            return  # the same bunnies were already searched from here with at least as much time left
+        if len(self.earliest) < BRANCH_AND_BOUND_MEMO_SIZE:
+            self.earliest[key] = elapsed
+
+        # Nearest bunnies first, so that large rescues are found early and prune the rest of the search
+        row = distances[position]
+        for bunny in sorted(remaining, key=lambda bunny: row[bunny + 1]):
+            self.search(bunny + 1, visited | 1 << bunny, elapsed + row[bunny + 1])
+
+    def _offer(self, visited):
+        score = rescue_score(visited, self.bunny_count)
+
+        if score > self.shared_bound.value:
+            with self.shared_bound.get_lock():
+                if score > self.shared_bound.value:
+                    self.shared_bound.value = score
+
+    def _bunnies_needed(self, visited, remaining):
+        """
+        :return: the fewest more bunnies that a rescue extending 'visited' must pick up to beat the best one so far
+        """
+        best_score = self.shared_bound.value
+        count = bin(visited).count("1")
+        best_count = best_score >> self.bunny_count
+        need = max(best_count - count, 1)
+
+        if count + need == best_count and need <= len(remaining):
+            # A set of the same size as the best one wins only with lower worker IDs; the lowest any set of this size
+            # can have come from adding the lowest remaining bunnies
+            lowest = visited
+            for bunny in remaining[:need]:
+                lowest |= 1 << bunny
+            if rescue_score(lowest, self.bunny_count) <= best_score:
+                need += 1
+
+        return need
+
+    def _lower_bound(self, position, remaining, need):
+        """
+        :return: a lower bound on the time to pick up 'need' of the remaining bunnies from 'position' and then reach
+                 the bulkhead
+        """
+        columns = self.columns
+        places = [position] + [bunny + 1 for bunny in remaining]
+
+        # The cheapest way into each remaining bunny from the current position or another remaining bunny
+        cheapest_into = sorted(min(map(columns[place].__getitem__, places[:index] + places[index + 1:]))
+                               for index, place in enumerate(places) if index)
+        bound = sum(cheapest_into[:need]) + min(map(columns[self.bulkhead].__getitem__, places))
+
+        if need == len(remaining):
+            bound = max(bound, self._spanning_tree_weight(places + [self.bulkhead]))
+
+        return bound
+
+    def _spanning_tree_weight(self, places):
+        """
+        :return: the weight of a minimum spanning tree over 'places', using Prim's algorithm on the dense matrix
+        """
+        distances = self.distances
+        first = places[0]
+        others = places[1:]
+        cost = [min(distances[first][place], distances[place][first]) for place in others]
+        total = 0
+
+        while others:
+            cheapest = min(range(len(others)), key=cost.__getitem__)
+            total += cost[cheapest]
+            joined = others.pop(cheapest)
+            cost.pop(cheapest)
+
+            for index, place in enumerate(others):
+                weight = min(distances[joined][place], distances[place][joined])
+                if weight < cost[index]:
+                    cost[index] = weight
+
+        return total
+
+
+def _search_branch(distances, time_limit, first_bunny):
+    """
+    Search every rescue order that starts with 'first_bunny', in a worker process.
+    """
+    search = _BranchAndBound(distances, time_limit, _shared_bound)
+    search.search(first_bunny + 1, 1 << first_bunny, distances[0][first_bunny + 1])
+
+
+def rescue_with_branch_and_bound(distances, time_limit, max_workers=None):
+    """
+    Find the best rescue with a branch-and-bound search over rescue orders: the largest set of bunnies that fits within
+    the time limit, with the lowest worker IDs among sets of the same size. Unlike rescue_with_held_karp(), its memory
+    does not grow with the number of sets of bunnies.
+
+    With at least PARALLEL_MIN_BUNNIES bunnies and more than one worker, the orders starting with each bunny are
+    searched in separate processes, which share the score of the best rescue found so far to prune each other's
+    searches.
+
+    :param distances: the matrix of shortest path lengths, with no negative cycles
+    :param time_limit: the time limit
+    :param max_workers: the most worker processes to use, or None for one per CPU
+    :return: the ids of the rescued bunnies
+    """
+    bunny_count = len(distances) - 2  # first row is "Start", last row is "Bulkhead"
+    if bunny_count < 1:
+        return []
+
+    distances = tuple(tuple(row) for row in distances)
+    workers = max_workers if max_workers is not None else os.cpu_count() or 1
+
+    if bunny_count < PARALLEL_MIN_BUNNIES or workers <= 1:
+        bound = _LocalBound()
+        _BranchAndBound(distances, time_limit, bound).search(0, 0, 0)
+        return score_to_bunnies(bound.value, bunny_count)
+
+    bound = multiprocessing.Value('q', 0)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_branch_worker,
+                                                initargs=(bound,)) as executor:
+        # Nearest bunnies first, as in the search itself, so that the early branches set a good bound for the rest
+        first_bunnies = sorted(range(bunny_count), key=lambda bunny: distances[0][bunny + 1])
+        branches = [executor.submit(_search_branch, distances, time_limit, bunny) for bunny in first_bunnies]
+        for branch in branches:
+            branch.result()
+
+    return score_to_bunnies(bound.value, bunny_count)
+
+
+class RescueTable(object):
+    """
+    The best rescue for every time limit at once, for one times matrix.
+
+    Allowing more time never makes the best rescue worse, so the best rescue is a step function of the time limit.
+    It is built in one pass: the rescue time of every set of bunnies comes from a single Held-Karp run, the sets are
+    sorted by rescue time, and the best set so far is recorded each time it changes. A lookup is then a binary search
+    over the k + 1 or fewer steps.
+    """
+
+    def __init__(self, time_limits, rescues):
+        """
+        :param time_limits: the smallest time limit for each step, in increasing order
+        :param rescues: the ids of the rescued bunnies for each step
+        """
+        self.time_limits = time_limits
+        self.rescues = rescues
+
+    def __len__(self):
+        return len(self.time_limits)
+
+    @classmethod
+    def from_times(cls, times):
+        """
+        :param times: a matrix, as given to solution(); it is not changed
+        :return: a RescueTable
+        """
+        distances = cached_shortest_path_matrix(times)
+        bunny_count = max(len(distances) - 2, 0)
+
+        if has_negative_cycle(distances):
+            # Walking round the negative cycle buys as much time as needed to rescue every bunny
+            return cls([float("-inf")], [list(range(bunny_count))])
+
+        time_limits = []
+        rescues = []
+        best_count = -1
+        best_bunnies = None
+
+        steps = [(distances[0][-1], 0)] if distances else []
+        steps += [(rescue_time, mask) for mask, rescue_time in held_karp_rescue_times(distances)
+                  if rescue_time < UNREACHABLE]
+        steps.sort()
+
+        for rescue_time, mask in steps:
+            count = bin(mask).count("1")
+            if count < best_count:
+                continue
+
+            bunnies = mask_to_bunnies(mask)
+            if count > best_count or bunnies < best_bunnies:
+                best_count = count
+                best_bunnies = bunnies
+
+                if time_limits and time_limits[-1] == rescue_time:
+                    rescues[-1] = bunnies
+                else:
+                    time_limits.append(rescue_time)
+                    rescues.append(bunnies)
+
+        return cls(time_limits, rescues)
+
+    def rescue(self, time_limit):
+        """
+        :param time_limit: the time limit
+        :return: the ids of the rescued bunnies, as solution() would return them
+        """
+        if time_limit < 0 or time_limit > MAX_TIME_LIMIT:
+            return []
+
+        step = bisect.bisect_right(self.time_limits, time_limit) - 1
+
+        return list(self.rescues[step]) if step >= 0 else []
+
+
+# time_limit is a non-negative integer that is at most 999; solution() rescues no bunnies for any other limit
+MAX_TIME_LIMIT = 999
+
+# The ways solution() can search for the best rescue
+RESCUE_MODES = {
+    "permutations": rescue_with_permutations,
+    "held_karp": rescue_with_held_karp,
+    "branch_and_bound": rescue_with_branch_and_bound,
+}
+
+
+def solution(times, time_limit, mode="permutations"):
     """
     Calculate the most bunnies you can pick up and which bunnies they are, while still escaping through the bulkhead
     before the doors close for good. If there are multiple sets of bunnies of the same size, return the set of bunnies
@@ -48,45 +1061,66 @@ def solution(times, time_limit):
 
     :param times: a matrix
     :param time_limit: the time limit
+    :param mode: how to search for the best rescue, one of the keys of RESCUE_MODES; "held_karp" handles 15 to 20
+                 bunnies
     :return: the ids of the rescued bunnies
     """
-    max_time_limit = 999
-    if time_limit < 0 or time_limit > max_time_limit:  # time_limit is a non-negative integer that is at most 999
+    if mode not in RESCUE_MODES:
+        raise ValueError("unknown rescue mode %r, expected one of %s" % (mode, ", ".join(sorted(RESCUE_MODES))))
+
+    if time_limit < 0 or time_limit > MAX_TIME_LIMIT:
         return []
 
-    all_pairs_shortest_paths(times)
+    # The shortest paths do not depend on the time limit, so they are cached; 'times' itself is left untouched
+    distances = cached_shortest_path_matrix(times)
 
-    n = len(times)  # number of rows
+    n = len(distances)  # number of rows
     bunny_count = n - 2  # first row is "Start", last row is "Bulkhead"
-    rescued_bunnies = []
 
     for bunny in range(n):
-        if times[bunny][bunny] < 0:  # check the diagonal
+        if distances[bunny][bunny] < 0:  # check the diagonal
             rescued_bunnies = [bunny for bunny in range(bunny_count)]
             return rescued_bunnies
 
-    for bunny in reversed(range(bunny_count + 1)):
+    return RESCUE_MODES[mode](distances, time_limit)
 
-        for bunnies in itertools.permutations(range(1, bunny_count + 1), r=bunny):
-            total_time = 0
 
-            path_to_bunnies = path(list(bunnies))
+def solution_sparse(graph, time_limit, mode="permutations", max_workers=1):
+    """
+    Same as solution(), for a corridor map given as a CSRGraph rather than a dense times matrix. A pair of nodes with
+    no path between them can't be walked at all.
 
-            for start_time, end_time in path_to_bunnies:
-                total_time += times[start_time][end_time]
+    :param graph: a CSRGraph, with the start at node 0 and the bulkhead at the last node
+    :param time_limit: the time limit
+    :param mode: how to search for the best rescue, one of the keys of RESCUE_MODES
+    :param max_workers: the number of processes to spread the shortest path searches over
+    :return: the ids of the rescued bunnies
+    """
+    if mode not in RESCUE_MODES:
+        raise ValueError("unknown rescue mode %r, expected one of %s" % (mode, ", ".join(sorted(RESCUE_MODES))))
 
-            if total_time <= time_limit:
-                rescued_bunnies = sorted(list(bunny - 1 for bunny in bunnies))
-                return rescued_bunnies
+    if time_limit < 0 or time_limit > MAX_TIME_LIMIT:
+        return []
 
-    return rescued_bunnies
+    shortest_paths = johnson_shortest_paths(graph, max_workers)
+    if shortest_paths.has_negative_cycle:
+        return list(range(max(len(graph) - 2, 0)))
+
+    return RESCUE_MODES[mode](shortest_paths.distances, time_limit)
 
 
 def all_tests():
     suite = unittest.TestSuite()
     suite.addTest(AllPairsShortestPathsTests)
+    suite.addTest(ShortestPathMatrixTests)
     suite.addTest(PathTests)
     suite.addTest(RescuedBunniesTests)
+    suite.addTest(HeldKarpTests)
+    suite.addTest(ShortestPathsCacheTests)
+    suite.addTest(RescueTableTests)
+    suite.addTest(BranchAndBoundTests)
+    suite.addTest(JohnsonTests)
+    suite.addTest(DynamicShortestPathsTests)
 
     return suite
 
@@ -424,3 +1458,458 @@ class RescuedBunniesTests(unittest.TestCase):
 
         rescued_bunnies = solution(times, time_limit)
         self.assertEqual(expected_bunny_ids, rescued_bunnies)
+
+
+class ShortestPathMatrixTests(unittest.TestCase):
+    """
+    Verify that the row-at-a-time Floyd-Warshall engines agree with all_pairs_shortest_paths().
+    """
+
+    def random_matrix(self, generator, n, low, high):
+        return [[0 if i == j else generator.randint(low, high) for j in range(n)] for i in range(n)]
+
+    def test_packed_matches_cell_by_cell(self):
+        generator = random.Random(8)
+
+        for n in range(1, 30):
+            times = self.random_matrix(generator, n, 0, generator.choice([1, 9, 999, 10 ** 12]))
+            expected = [list(row) for row in times]
+            all_pairs_shortest_paths(expected)
+
+            self.assertEqual(expected, floyd_warshall_packed(times))
+            self.assertEqual(expected, floyd_warshall_rows(times))
+
+    def test_negative_edges_without_negative_cycles(self):
+        times = [
+            [0, 2, 2, 2, -1],
+            [9, 0, 2, 2, -1],
+            [9, 3, 0, 2, -1],
+            [9, 3, 2, 0, -1],
+            [9, 3, 2, 2, 0]
+        ]
+        expected = [list(row) for row in times]
+        all_pairs_shortest_paths(expected)
+
+        distances = shortest_path_matrix(times)
+        self.assertEqual(expected, distances)
+        self.assertFalse(has_negative_cycle(distances))
+        self.assertEqual(2, times[0][1])  # the input is left untouched
+
+    def test_negative_cycle(self):
+        times = [
+            [0, 2, 2, 2, -1],
+            [9, 0, 2, 2, 0],
+            [9, 3, 0, 2, 0],
+            [9, 3, 2, 0, 0],
+            [-1, 3, 2, 2, 0]
+        ]
+
+        self.assertTrue(has_negative_cycle(shortest_path_matrix(times)))
+
+    def test_in_place(self):
+        times = [
+            [0, 3, 2, 2, -1],
+            [8, 0, 1, 2, -1],
+            [8, 3, 2, 2, -1],
+            [9, 2, 3, 0, -1],
+            [9, 3, 1, 2, 0],
+        ]
+        expected = [list(row) for row in times]
+        all_pairs_shortest_paths(expected)
+
+        all_pairs_shortest_paths_fast(times)
+        self.assertEqual(expected, times)
+        self.assertEqual([], shortest_path_matrix([]))
+
+
+def brute_force_rescue(distances, time_limit):
+    """
+    Check every order of every set of bunnies, sets in order of size and then worker ID; only for testing.
+    """
+    bunny_count = len(distances) - 2
+
+    for size in reversed(range(bunny_count + 1)):
+        for bunnies in itertools.combinations(range(1, bunny_count + 1), size):
+            for order in itertools.permutations(bunnies):
+                stops = [0] + list(order) + [-1]
+                if sum(distances[a][b] for a, b in zip(stops, stops[1:])) <= time_limit:
+                    return [bunny - 1 for bunny in bunnies]
+
+    return []
+
+
+class HeldKarpTests(unittest.TestCase):
+    """
+    Verify that the Held-Karp search finds the same rescues as checking every order of every set of bunnies.
+    """
+
+    def test_matches_brute_force(self):
+        generator = random.Random(9)
+
+        for _ in range(300):
+            n = generator.randint(2, 8)
+            times = [[0 if i == j else generator.randint(-1, 9) for j in range(n)] for i in range(n)]
+            distances = shortest_path_matrix(times)
+            if has_negative_cycle(distances):
+                continue
+
+            time_limit = generator.randint(0, 20)
+            self.assertEqual(brute_force_rescue(distances, time_limit), rescue_with_held_karp(distances, time_limit))
+
+    def test_solution_held_karp_mode(self):
+        times = [
+            [0, 2, 2, 2, -1],
+            [9, 0, 2, 2, -1],
+            [9, 3, 0, 2, -1],
+            [9, 3, 2, 0, -1],
+            [9, 3, 2, 2, 0],
+        ]
+
+        self.assertEqual([1, 2], solution(times, 1, mode="held_karp"))
+        self.assertEqual([], solution([[2, 2], [2, 2]], 1, mode="held_karp"))
+        self.assertEqual([], solution([], 10, mode="held_karp"))
+        self.assertRaises(ValueError, solution, times, 1, mode="unknown")
+
+    def test_lowest_worker_ids_win_ties(self):
+        # bunnies 0 and 1 can only be picked up in the order 1, 0, and bunnies 0 and 2 in the order 0, 2; trying orders
+        # lexicographically reaches (0, 2) before (1, 0), but [0, 1] has the lower worker IDs
+        times = [
+            [0, 1, 1, 9, 9],
+            [9, 0, 9, 1, 1],
+            [9, 1, 0, 9, 9],
+            [9, 9, 9, 0, 1],
+            [9, 9, 9, 9, 0],
+        ]
+        distances = shortest_path_matrix(times)
+
+        self.assertEqual([0, 1], rescue_with_held_karp(distances, 3))
+        self.assertEqual(brute_force_rescue(distances, 3), rescue_with_held_karp(distances, 3))
+
+
+class ShortestPathsCacheTests(unittest.TestCase):
+    """
+    Verify that solution() leaves its input alone and reuses the shortest paths for the same times matrix.
+    """
+
+    times = [
+        [0, 2, 2, 2, -1],
+        [9, 0, 2, 2, -1],
+        [9, 3, 0, 2, -1],
+        [9, 3, 2, 0, -1],
+        [9, 3, 2, 2, 0]
+    ]
+
+    def test_solution_does_not_change_times(self):
+        times = [list(row) for row in self.times]
+
+        self.assertEqual([1, 2], solution(times, 1))
+        self.assertEqual(self.times, times)
+
+    def test_same_contents_share_one_result(self):
+        clear_shortest_paths_cache()
+        distances = cached_shortest_path_matrix(self.times)
+
+        self.assertIs(distances, cached_shortest_path_matrix([list(row) for row in self.times]))
+        self.assertEqual(shortest_path_matrix(self.times), [list(row) for row in distances])
+
+    def test_different_contents_do_not_collide(self):
+        changed = [list(row) for row in self.times]
+        changed[0][1] = 1
+
+        self.assertNotEqual(cached_shortest_path_matrix(self.times), cached_shortest_path_matrix(changed))
+        self.assertNotEqual(matrix_digest(self.times), matrix_digest(changed))
+
+    def test_list_and_tuple_share_a_key(self):
+        self.assertEqual(matrix_digest(self.times), matrix_digest(tuple(tuple(row) for row in self.times)))
+        self.assertEqual(matrix_digest([[0, 1], [2, 0]]), matrix_digest(([0, 1], (2, 0))))
+        self.assertNotEqual(matrix_digest([[0, 1], [2, 0]]), matrix_digest([[0, 1.5], [2, 0]]))
+        self.assertNotEqual(matrix_digest([[0, 1 << 70], [2, 0]]), matrix_digest([[0, 1 << 71], [2, 0]]))
+
+    def test_large_matrices_do_not_collide(self):
+        # a repr() that elides the middle of a large matrix would give both of these the same key
+        matrix = [[0] * 1000 for _ in range(1000)]
+        changed = [list(row) for row in matrix]
+        changed[500][500] = 1
+
+        self.assertNotEqual(matrix_digest(matrix), matrix_digest(changed))
+        self.assertNotEqual(matrix_digest([[0, 1, 2]]), matrix_digest([[0, 1], [2]]))
+
+    def test_cache_is_bounded(self):
+        clear_shortest_paths_cache()
+
+        for time in range(SHORTEST_PATHS_CACHE_SIZE + 10):
+            cached_shortest_path_matrix([[0, time], [time, 0]])
+
+        self.assertEqual(SHORTEST_PATHS_CACHE_SIZE, len(_shortest_paths_cache))
+
+
+class RescueTableTests(unittest.TestCase):
+    """
+    Verify that a RescueTable gives the same rescue as solution() for every time limit.
+    """
+
+    def test_matches_solution_for_every_time_limit(self):
+        generator = random.Random(10)
+
+        for _ in range(100):
+            n = generator.randint(2, 7)
+            times = [[0 if i == j else generator.randint(-1, 9) for j in range(n)] for i in range(n)]
+            table = RescueTable.from_times(times)
+
+            for time_limit in itertools.chain(range(-5, 40), [MAX_TIME_LIMIT, MAX_TIME_LIMIT + 1]):
+                self.assertEqual(solution(times, time_limit, "held_karp"), table.rescue(time_limit))
+
+    def test_steps(self):
+        times = [
+            [0, 1, 1, 1, 1],
+            [1, 0, 1, 1, 1],
+            [1, 1, 0, 1, 1],
+            [1, 1, 1, 0, 1],
+            [1, 1, 1, 1, 0]
+        ]
+        table = RescueTable.from_times(times)
+
+        self.assertEqual([1, 2, 3, 4], table.time_limits)
+        self.assertEqual([[], [0], [0, 1], [0, 1, 2]], table.rescues)
+        self.assertEqual([0, 1], table.rescue(3))
+        self.assertEqual([], table.rescue(0))
+        self.assertEqual([0, 1, 2], table.rescue(999))
+        self.assertEqual([], table.rescue(1000))
+
+    def test_negative_cycle_within_time_limits(self):
+        times = [
+            [0, 2, 2, 2, 2],
+            [9, 0, -2, 2, 2],
+            [9, 1, 0, 2, 2],
+            [9, 3, 2, 0, 2],
+            [9, 3, 2, 2, 0]
+        ]
+        table = RescueTable.from_times(times)
+
+        self.assertEqual([0, 1, 2], table.rescue(0))
+        self.assertEqual([], table.rescue(-1))
+        self.assertEqual([], table.rescue(1000))
+
+    def test_empty_matrix(self):
+        self.assertEqual([], RescueTable.from_times([]).rescue(10))
+
+
+class BranchAndBoundTests(unittest.TestCase):
+    """
+    Verify that the branch-and-bound search finds the same rescues as the Held-Karp search, in one process or several.
+    """
+
+    def test_matches_held_karp(self):
+        generator = random.Random(38)
+
+        for _ in range(300):
+            n = generator.randint(2, 9)
+            times = [[0 if i == j else generator.randint(-1, 9) for j in range(n)] for i in range(n)]
+            distances = shortest_path_matrix(times)
+            if has_negative_cycle(distances):
+                continue
+
+            time_limit = generator.randint(0, 25)
+            self.assertEqual(rescue_with_held_karp(distances, time_limit),
+                             rescue_with_branch_and_bound(distances, time_limit, max_workers=1))
+
+    def test_worker_processes(self):
+        generator = random.Random(12)
+        n = PARALLEL_MIN_BUNNIES + 2
+        times = [[0 if i == j else generator.randint(1, 30) for j in range(n)] for i in range(n)]
+        distances = shortest_path_matrix(times)
+
+        for time_limit in (10, 25, 200):
+            self.assertEqual(rescue_with_held_karp(distances, time_limit),
+                             rescue_with_branch_and_bound(distances, time_limit, max_workers=2))
+
+    def test_lowest_worker_ids_win_ties(self):
+        times = [
+            [0, 1, 1, 9, 9],
+            [9, 0, 9, 1, 1],
+            [9, 1, 0, 9, 9],
+            [9, 9, 9, 0, 1],
+            [9, 9, 9, 9, 0],
+        ]
+
+        self.assertEqual([0, 1], rescue_with_branch_and_bound(shortest_path_matrix(times), 3))
+
+    def test_rescue_score(self):
+        sets = [mask for mask in range(1 << 5)]
+        by_score = sorted(sets, key=lambda mask: rescue_score(mask, 5))
+        by_rule = sorted(sets, key=lambda mask: (bin(mask).count("1"), [-bunny for bunny in mask_to_bunnies(mask)]))
+
+        self.assertEqual([mask_to_bunnies(mask) for mask in by_rule], [mask_to_bunnies(mask) for mask in by_score])
+        for mask in sets:
+            self.assertEqual(mask_to_bunnies(mask), score_to_bunnies(rescue_score(mask, 5), 5))
+
+    def test_solution_branch_and_bound_mode(self):
+        times = [
+            [0, 2, 2, 2, -1],
+            [9, 0, 2, 2, -1],
+            [9, 3, 0, 2, -1],
+            [9, 3, 2, 0, -1],
+            [9, 3, 2, 2, 0],
+        ]
+
+        self.assertEqual([1, 2], solution(times, 1, mode="branch_and_bound"))
+        self.assertEqual([], solution([], 10, mode="branch_and_bound"))
+
+
+class JohnsonTests(unittest.TestCase):
+    """
+    Verify that Johnson's algorithm on a CSRGraph agrees with the Floyd-Warshall algorithm on the dense matrix, and
+    that the next-hop matrix rebuilds routes of the right length.
+    """
+
+    def random_times(self, generator, n):
+        return [[0 if i == j else generator.randint(-1, 9) for j in range(n)] for i in range(n)]
+
+    def test_matches_floyd_warshall(self):
+        generator = random.Random(39)
+
+        for _ in range(200):
+            times = self.random_times(generator, generator.randint(1, 8))
+            distances = shortest_path_matrix(times)
+            shortest_paths = johnson_shortest_paths(CSRGraph.from_matrix(times))
+
+            self.assertEqual(has_negative_cycle(distances), shortest_paths.has_negative_cycle)
+            if not shortest_paths.has_negative_cycle:
+                for i, row in enumerate(distances):
+                    for j, distance in enumerate(row):
+                        if i != j:
+                            self.assertEqual(distance, shortest_paths.distances[i][j])
+
+    def test_routes(self):
+        generator = random.Random(40)
+
+        for _ in range(100):
+            times = self.random_times(generator, generator.randint(2, 8))
+            shortest_paths = johnson_shortest_paths(CSRGraph.from_matrix(times))
+            if shortest_paths.has_negative_cycle:
+                continue
+
+            n = len(times)
+            for source in range(n):
+                for target in range(n):
+                    route = shortest_paths.route(source, target)
+                    self.assertEqual(source, route[0])
+                    self.assertEqual(target, route[-1])
+                    length = sum(times[u][v] for u, v in zip(route, route[1:]))
+                    self.assertEqual(shortest_paths.distances[source][target], length)
+
+    def test_unreachable(self):
+        # 0 -> 1 -> 3, and nothing leads to 2
+        graph = CSRGraph([0, 1, 2, 3, 3], [1, 3, 1], [4, 2, 1])
+        shortest_paths = johnson_shortest_paths(graph)
+
+        self.assertEqual((0, 4, float("inf"), 6), shortest_paths.distances[0])
+        self.assertEqual([0, 1, 3], shortest_paths.route(0, 3))
+        self.assertIsNone(shortest_paths.route(0, 2))
+        self.assertEqual([0, 1, 3], shortest_paths.rescue_route([0]))
+        self.assertIsNone(shortest_paths.rescue_route([1]))
+        self.assertEqual([0], solution_sparse(graph, 6))
+        self.assertEqual([], solution_sparse(graph, 5))
+
+    def test_worker_processes(self):
+        generator = random.Random(41)
+        times = [[0 if i == j else generator.randint(1, 9) for j in range(12)] for i in range(12)]
+        graph = CSRGraph.from_matrix(times)
+
+        single = johnson_shortest_paths(graph)
+        spread = johnson_shortest_paths(graph, max_workers=2)
+        self.assertEqual(single.distances, spread.distances)
+        self.assertEqual(single.next_hops, spread.next_hops)
+
+    def test_solution_sparse(self):
+        times = [
+            [0, 2, 2, 2, -1],
+            [9, 0, 2, 2, -1],
+            [9, 3, 0, 2, -1],
+            [9, 3, 2, 0, -1],
+            [9, 3, 2, 2, 0],
+        ]
+        graph = CSRGraph.from_matrix(times)
+
+        self.assertEqual([1, 2], solution_sparse(graph, 1))
+        self.assertEqual([1, 2], solution_sparse(graph, 1, mode="held_karp"))
+        self.assertEqual([0, 1, 2], solution_sparse(CSRGraph.from_matrix([
+            [0, 1, 1, 1, 1],
+            [1, 0, 1, 1, 1],
+            [1, 1, 0, -2, 1],
+            [1, 1, 1, 0, 1],
+            [1, 1, 1, 1, 0]
+        ]), 0))
+        self.assertRaises(ValueError, CSRGraph, [0, 2], [1], [1])
+
+
+class DynamicShortestPathsTests(unittest.TestCase):
+    """
+    Verify that DynamicShortestPaths keeps the same distances as running the Floyd-Warshall algorithm again after every
+    change, and notices negative cycles coming and going.
+    """
+
+    def test_matches_floyd_warshall(self):
+        generator = random.Random(40)
+
+        for _ in range(200):
+            n = generator.randint(1, 7)
+            times = [[0 if i == j else generator.randint(0, 9) for j in range(n)] for i in range(n)]
+            dynamic = DynamicShortestPaths(times)
+
+            for _ in range(15):
+                source, target = generator.randrange(n), generator.randrange(n)
+                weight = generator.randint(-2, 12) if source != target else generator.randint(-1, 3)
+                times[source][target] = weight
+                dynamic.update(source, target, weight)
+
+                distances = shortest_path_matrix(times)
+                self.assertEqual(has_negative_cycle(distances), dynamic.has_negative_cycle)
+                if not dynamic.has_negative_cycle:
+                    self.assertEqual(distances, dynamic.distances)
+
+    def test_negative_cycle(self):
+        dynamic = DynamicShortestPaths([
+            [0, 1, 1],
+            [1, 0, 1],
+            [1, 1, 0]
+        ])
+
+        dynamic.update(1, 2, -1)
+        self.assertFalse(dynamic.has_negative_cycle)
+        dynamic.update(2, 1, 0)
+        self.assertTrue(dynamic.has_negative_cycle)
+        self.assertEqual([0], dynamic.rescue(0))
+        dynamic.update(2, 1, 1)
+        self.assertFalse(dynamic.has_negative_cycle)
+        self.assertEqual([[0, 1, 0], [0, 0, -1], [1, 1, 0]], dynamic.distances)
+
+    def test_rows_computed_again(self):
+        times = [
+            [0, 1, 5, 5],
+            [5, 0, 1, 5],
+            [5, 5, 0, 1],
+            [1, 5, 5, 0]
+        ]
+        dynamic = DynamicShortestPaths(times)
+
+        self.assertEqual(0, dynamic.update(0, 2, 9))  # not on any shortest path
+        self.assertEqual(0, dynamic.update(0, 2, 1))  # cheaper, so no row is searched again
+        self.assertEqual(3, dynamic.update(3, 0, 4))  # used by the paths from 1, 2 and 3, not 0
+        self.assertEqual(shortest_path_matrix(dynamic.times), dynamic.distances)
+
+    def test_rescue(self):
+        times = [
+            [0, 2, 2, 2, -1],
+            [9, 0, 2, 2, -1],
+            [9, 3, 0, 2, -1],
+            [9, 3, 2, 0, -1],
+            [9, 3, 2, 2, 0]
+        ]
+        dynamic = DynamicShortestPaths(times)
+
+        self.assertEqual(solution(times, 1, mode="held_karp"), dynamic.rescue(1))
+        dynamic.update(4, 1, 0)
+        times[4][1] = 0
+        self.assertEqual(solution(times, 1, mode="held_karp"), dynamic.rescue(1))
+        self.assertRaises(ValueError, dynamic.rescue, 1, mode="unknown")
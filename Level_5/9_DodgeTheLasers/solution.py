@@ -1,6 +1,13 @@
+import collections
+import concurrent.futures
+import functools
+import itertools
+import math
+import random
+import threading
 import unittest
 
-from decimal import Decimal, getcontext
+from decimal import Decimal, getcontext, localcontext
 
 
 def beatty_sequence(alpha, n):
@@ -48,33 +55,667 @@ def beatty_sequence(alpha, n):
     return p + q - r - beatty_sequence(beta, n_prime)
 
 
-def solution(s):
+def floor_sqrt2_minus_1(x):
+    """
+    floor((sqrt(2) - 1) * x) for any integer x, exactly. sqrt(2) * x is irrational for x != 0, so
+    floor(sqrt(2) * |x|) = isqrt(2 * x * x), and for negative x the floor is one less than minus the floor for |x|.
+    """
+    if x >= 0:
+        return math.isqrt(2 * x * x) - x
+
+    return -(math.isqrt(2 * x * x) + x) - 1
+
+
+def beatty_sum_sqrt2(n):
+    """
+    The same sum as beatty_sequence(Decimal(2).sqrt(), n), using only integer arithmetic, so it is exact for n of any
+    size rather than only up to the Decimal precision.
+
+    floor((sqrt(2) - 1) * n) is computed exactly as isqrt(2 * n * n) - n, and the recursion S(n) = p + q - r - S(n') is
+    unrolled into a loop that adds and subtracts the terms in turn. Each step costs an isqrt on numbers as long as n,
+    and n only shrinks by a factor of sqrt(2) - 1 per step, so for n longer than OSTROWSKI_MIN_BITS the work is handed
+    to beatty_sum_sqrt2_ostrowski(), which gives the same result without a full-length isqrt per step.
+
+    :param n: defines the range 1 to n
+    :return: the sum of floor(i * sqrt(2)) for i in 1 to n
+    """
+    if n.bit_length() > OSTROWSKI_MIN_BITS:
+        return beatty_sum_sqrt2_ostrowski(n)
+
+    return beatty_sum_sqrt2_direct(n)
+
+
+# beatty_sum_sqrt2() loops directly below this many bits of n
+OSTROWSKI_MIN_BITS = 256
+
+# Fixed-point fractional bits used for the real-valued parts of beatty_sum_sqrt2_ostrowski()
+OSTROWSKI_FRACTION_BITS = 128
+
+LOG2_SILVER_RATIO = math.log2(1 + math.sqrt(2))
+
+
+def pell_pair(j):
+    """
+    :return: (q_j, q_j+1) for the denominators of the convergents of sqrt(2) - 1: q_0 = 1, q_1 = 2,
+             q_j+1 = 2 * q_j + q_j-1 (1, 2, 5, 12, 29, 70, ...)
+    """
+    result = (1, 0, 0, 1)
+    power = (2, 1, 1, 0)
+
+    while j:
+        if j & 1:
+            result = _multiply_2x2(result, power)
+        power = _multiply_2x2(power, power)
+        j >>= 1
+
+    return 2 * result[2] + result[3], 2 * result[0] + result[1]
+
+
+def _multiply_2x2(x, y):
+    return (x[0] * y[0] + x[1] * y[2], x[0] * y[1] + x[1] * y[3],
+            x[2] * y[0] + x[3] * y[2], x[2] * y[1] + x[3] * y[3])
+
+
+def ostrowski_digits(n):
+    """
+    Write n >= 1 as sum(d_j * q_j) over the denominators q_j from pell_pair(), taking the largest q_j that fits each
+    time. Every digit is 0, 1 or 2, d_0 is at most 1, and a 2 is always followed (towards j = 0) by a 0.
+
+    Walking down from the largest q_j needs only a subtraction or two and a shift per digit, all running in C.
+
+    :return: a bytearray of the digits, d_0 first
+    """
+    top = max(int(n.bit_length() / LOG2_SILVER_RATIO) - 2, 0)
+    q, q_next = pell_pair(top)
+    while q_next <= n:
+        q, q_next = q_next, 2 * q_next + q
+        top += 1
+
+    digits = bytearray(top + 1)
+    remainder = n
+
+    for j in range(top, -1, -1):
+        if remainder >= q:
+            remainder -= q
+            if remainder >= q:
+                remainder -= q
+                digits[j] = 2
+            else:
+                digits[j] = 1
+        q, q_next = q_next - 2 * q, q
+
+    return digits
+
+
+def beatty_sum_sqrt2_ostrowski(n):
+    """
+    beatty_sum_sqrt2() for long n, in about the time of a few dozen full-length subtractions per digit of n.
+
+    Let theta = sqrt(2) - 1, n_0 = n and n_k+1 = floor(theta * n_k), the arguments of the recursion in
+    beatty_sequence(), and f_k = theta * n_k - n_k+1, the fractional part thrown away at each step. Substituting
+    n_k+1 = theta * n_k - f_k into the recursion cancels every term in n_k^2 and n_k * f_k, which leaves
+
+        S(n) = sqrt(2) * n(n+1)/2 - n/2 - sum((-1)^k * g(f_k)),    g(f) = f^2 / (2 * theta) - f / sqrt(2)
+
+    so apart from one sqrt(2) * n(n+1)/2, only the fractional parts f_k are needed, each to a fixed precision.
+
+    They come from the digits d_j of n in ostrowski_digits(). Since theta * q_j = q_j-1 + delta_j with
+    delta_j = (-theta)^j * theta, the shifted number m_k = sum(d_k+j * q_j) has theta * m_k = m_k+1 + e_k, where
+    e_k = sum(d_k+j * delta_j) = theta * (d_k - e_k+1) is computed for every k in one contracting pass from the top
+    digit down. n_k differs from m_k by a small correction c_k, so each step of the recursion is
+
+        y = e_k - theta * c_k,    c_k+1 = -floor(y),    f_k = y - floor(y)
+
+    on OSTROWSKI_FRACTION_BITS-bit fixed-point numbers. When y is too close to an integer for that precision, its
+    floor is settled exactly with isqrt instead (see _exact_step_floor()). The last few dozen steps, where n_k is
+    small, are done by the direct loop.
+
+    :param n: defines the range 1 to n
+    :return: the sum of floor(i * sqrt(2)) for i in 1 to n
+    """
+    digits = ostrowski_digits(n)
+    top = len(digits) - 1
+    steps = top - 40  # n_k >= q_40 - c_k > 2^50 for every step before this one
+    if steps <= 0:
+        return beatty_sum_sqrt2_direct(n)
+
+    bits = OSTROWSKI_FRACTION_BITS
+    one = 1 << bits
+    fraction_mask = one - 1
+    margin = 1 << (bits // 8)
+    theta = math.isqrt(2 << (2 * bits)) - one
+
+    e_values = [0] * (top + 1)
+    e = 0
+    for k in range(top, -1, -1):
+        e = (theta * ((digits[k] << bits) - e)) >> bits
+        e_values[k] = e
+
+    correction = 0
+    sum_f = 0  # sum((-1)^k * f_k), scaled by 2^bits
+    sum_f_squared = 0  # sum((-1)^k * f_k^2), scaled by 2^(2 * bits)
+
+    for k in range(steps):
+        y = e_values[k] - theta * correction
+        if margin < y & fraction_mask < one - margin:
+            floor_y = y >> bits
+        else:
+            floor_y = _exact_step_floor(digits, k, correction)
+
+        f = y - (floor_y << bits)
+        if k & 1:
+            sum_f -= f
+            sum_f_squared -= f * f
+        else:
+            sum_f += f
+            sum_f_squared += f * f
+        correction = -floor_y
+
+    # n_k for the first step left to the direct loop
+    rest = -correction
+    q_previous, q = 0, 1
+    for digit in digits[steps:]:
+        rest += digit * q
+        q_previous, q = q, 2 * q + q_previous
+
+    # Everything below is scaled by 2^(2 * bits); g(f) = (f^2 + sqrt(2) * f^2 - sqrt(2) * f) / 2
+    wide = 2 * bits + 64
+    sqrt2 = math.isqrt(2 << (2 * wide))
+    g_sum = (sum_f_squared + ((sum_f_squared * sqrt2) >> wide) - (((sum_f * sqrt2) >> wide) << bits)) >> 1
+
+    # The part of the sum left to the direct loop is S(rest) = sqrt(2) * T(rest) - rest/2 - D(rest), where the
+    # alternating sum D(rest) continues the one above
+    rest_sum = (_scaled_sqrt2_triangle(rest, bits) - (rest << (2 * bits - 1)) -
+                (beatty_sum_sqrt2_direct(rest) << (2 * bits)))
+    if steps & 1:
+        rest_sum = -rest_sum
+
+    total = _scaled_sqrt2_triangle(n, bits) - (n << (2 * bits - 1)) - g_sum - rest_sum
+
+    return (total + (1 << (2 * bits - 1))) >> (2 * bits)
+
+
+def beatty_sum_sqrt2_direct(n):
+    """
+    The loop described in beatty_sum_sqrt2(), for any n.
+    """
+    total = 0
+    sign = 1
+
+    while n >= 1:
+        n_prime = floor_sqrt2_minus_1(n)
+        total += sign * (n * n_prime + n * (n + 1) // 2 - n_prime * (n_prime + 1) // 2)
+        sign = -sign
+        n = n_prime
+
+    return total
+
+
+def _scaled_sqrt2_triangle(n, bits):
+    """
+    :return: floor(sqrt(2) * n(n+1)/2 * 2^(2 * bits))
+    """
+    triangle = n * (n + 1) // 2
+
+    return math.isqrt((2 * triangle * triangle) << (4 * bits))
+
+
+def _exact_step_floor(digits, k, correction):
+    """
+    floor(e_k - theta * c_k) from beatty_sum_sqrt2_ostrowski(), exactly, for when the fixed-point value is too close to
+    an integer to tell.
+
+    The first 'width' digits from d_k give integers Q = sum(d_k+j * q_j) and P = sum(d_k+j * q_j-1), so that
+    e_k - theta * c_k = theta * (Q - c_k) - P + tail, where the tail from the remaining digits is at most
+    2.7 * theta^(width + 1) in size. The floor of theta * (Q - c_k) - P is found exactly with isqrt; if it is further
+    from an integer than the tail can reach, that settles it, and otherwise the window grows, until it covers every
+    digit and there is no tail at all.
+    """
+    remaining = len(digits) - k
+    width = 64
+
+    while True:
+        width = min(width, remaining)
+
+        q_sum = 0
+        p_sum = 0
+        q_previous, q = 0, 1
+        for digit in digits[k:k + width]:
+            if digit:
+                q_sum += digit * q
+                p_sum += digit * q_previous
+            q_previous, q = q, 2 * q + q_previous
+
+        x = q_sum - correction
+        if width == remaining:
+            return floor_sqrt2_minus_1(x) - p_sum
+
+        bits = int(1.28 * width) + 64
+        scaled = floor_sqrt2_minus_1(x << bits) - (p_sum << bits)
+        tail = int(2.7 * 2 ** (bits - LOG2_SILVER_RATIO * (width + 1))) + 4
+        fraction = scaled & ((1 << bits) - 1)
+        if tail < fraction < (1 << bits) - tail:
+            return scaled >> bits
+
+        width *= 4
+
+
+class QuadraticIrrational(collections.namedtuple("QuadraticIrrational", "a b c d")):
+    """
+    The positive irrational number (a + b * sqrt(d)) / c, for integers a, b, c and d, with b and c non-zero and d not a
+    perfect square. Instances are hashable, so they can key the cache of reduction_chain().
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, a, b, c=1, d=2):
+        if b == 0 or c == 0 or d < 2 or math.isqrt(d) ** 2 == d:
+            raise ValueError("(%d + %d * sqrt(%d)) / %d is not a quadratic irrational" % (a, b, d, c))
+
+        # a + b * sqrt(d) has the sign of whichever of a and b * sqrt(d) is larger in size
+        numerator_sign = (1 if b > 0 else -1) if a * a < b * b * d else (1 if a > 0 else -1)
+        if numerator_sign * c < 0:
+            raise ValueError("(%d + %d * sqrt(%d)) / %d is negative" % (a, b, d, c))
+
+        return super(QuadraticIrrational, cls).__new__(cls, a, b, c, d)
+
+    def floor_multiple(self, n):
+        """
+        :param n: a non-negative integer
+        :return: floor(n * alpha), exactly
+        """
+        return floor_quadratic(n * self.a, n * self.b, self.d, self.c)
+
+
+def floor_quadratic(p, q, d, r):
+    """
+    floor((p + q * sqrt(d)) / r) for integers p, q, d, r with r != 0 and d not a perfect square, exactly.
+
+    q * sqrt(d) is irrational for q != 0, so its floor is isqrt(q * q * d) for q > 0 and one less than minus that for
+    q < 0. Adding the integer p and dividing by r > 0 only needs that floor; for r < 0 the signs of all three are
+    flipped first.
+    """
+    if r < 0:
+        p, q, r = -p, -q, -r
+
+    root = math.isqrt(q * q * d)
+    if q < 0:
+        root = -root - 1
+
+    return (p + root) // r
+
+
+# The number of distinct alphas whose reduction chains are kept
+REDUCTION_CHAIN_CACHE_SIZE = 256
+
+
+class ReductionChain(object):
+    """
+    The steps beatty_sum() takes for one alpha, which do not depend on n.
+
+    Starting from alpha_0 = alpha, each step splits off the integer part k_i of alpha_i, leaving the fractional part
+    beta_i, and moves on to alpha_i+1 = 1 / beta_i, the ratio between the complementary sequences. These are the
+    steps of the continued fraction of alpha, and each alpha_i is kept as (P_i + sqrt(D)) / Q_i with Q_i dividing
+    D - P_i^2, so that the next one follows with integer arithmetic alone:
+
+        P_i+1 = k_i * Q_i - P_i,    Q_i+1 = (D - P_i+1^2) / Q_i
+
+    The continued fraction of a quadratic irrational is eventually periodic, so after a few steps a pair (P_i, Q_i)
+    comes round again and the whole infinite chain is known: level(i) wraps around the period for any i.
+    """
+
+    def __init__(self, alpha):
+        # (a + b * sqrt(d)) / c = (P + sqrt(D)) / Q with P = a, D = b^2 * d, Q = c (all negated if b < 0), and then
+        # P, D and Q multiplied by |Q| so that Q divides D - P^2
+        sign = 1 if alpha.b > 0 else -1
+        p, q = sign * alpha.a, sign * alpha.c
+        self.d = alpha.b * alpha.b * alpha.d * q * q
+        p *= abs(q)
+        q *= abs(q)
+
+        self.levels = []
+        seen = {}
+        while (p, q) not in seen:
+            seen[(p, q)] = len(self.levels)
+            k = floor_quadratic(p, 1, self.d, q)
+            self.levels.append((k, p - k * q, q))
+            p = k * q - p
+            q = (self.d - p * p) // q
+
+        self.period_start = seen[(p, q)]
+
+    def level(self, i):
+        """
+        :return: (k_i, A, Q_i), where beta_i = (A + sqrt(D)) / Q_i
+        """
+        if i >= len(self.levels):
+            i = self.period_start + (i - self.period_start) % (len(self.levels) - self.period_start)
+
+        return self.levels[i]
+
+
+@functools.lru_cache(maxsize=REDUCTION_CHAIN_CACHE_SIZE)
+def reduction_chain(alpha):
+    """
+    :param alpha: a QuadraticIrrational
+    :return: its ReductionChain, built once per alpha and shared by every later call
+    """
+    return ReductionChain(alpha)
+
+
+def beatty_sum(alpha, n):
+    """
+    The sum of floor(i * alpha) for i in 1 to n, for any alpha = (a + b * sqrt(d)) / c, exactly.
+
+    This is the recursion of beatty_sequence() for a general alpha. With k = floor(alpha), beta = alpha - k and
+    m = floor(n * beta), counting the lattice points under the line y = beta * x column by column and row by row gives
+
+        S(alpha, n) = k * n(n+1)/2 + n * m - S(1 / beta, m)
+
+    and n shrinks geometrically from one step to the next. Every floor is taken exactly with isqrt, and the chain of
+    alphas comes from the cached reduction_chain(), so repeated calls with the same alpha only do the arithmetic in n.
+    For sqrt(2) the work goes to beatty_sum_sqrt2(), which is faster for long n.
+
+    :param alpha: a QuadraticIrrational
+    :param n: defines the range 1 to n
+    :return: the sum of floor(i * alpha) for i in 1 to n
+    """
+    if alpha == SQRT2:
+        return beatty_sum_sqrt2(max(n, 0))
+
+    chain = reduction_chain(alpha)
+    total = 0
+    sign = 1
+    i = 0
+
+    while n >= 1:
+        k, p, q = chain.level(i)
+        m = floor_quadratic(n * p, n, chain.d, q)
+        total += sign * (k * (n * (n + 1) // 2) + n * m)
+        sign = -sign
+        n = m
+        i += 1
+
+    return total
+
+
+SQRT2 = QuadraticIrrational(0, 1, 1, 2)
+SQRT3 = QuadraticIrrational(0, 1, 1, 3)
+SQRT5 = QuadraticIrrational(0, 1, 1, 5)
+GOLDEN_RATIO = QuadraticIrrational(1, 1, 2, 5)
+
+
+# The number of n values beatty_sums() takes through the recursion together
+BEATTY_SUMS_CHUNK_SIZE = 1024
+
+# Fractional bits beatty_sums() keeps beyond the longest n of a level
+BEATTY_SUMS_GUARD_BITS = 64
+
+# beatty_sums() takes values of n for sqrt(2) from SQRT2_LEVEL_SUMS_MIN_BITS to SQRT2_LEVEL_SUMS_MAX_BITS long through
+# sqrt2_level_sums(). Shorter ones go to beatty_sum_sqrt2_direct(), which is faster below about 12 digits, and longer
+# ones to beatty_sum_sqrt2_ostrowski(), which is faster from about 300 digits
+SQRT2_LEVEL_SUMS_MIN_BITS = 40
+SQRT2_LEVEL_SUMS_MAX_BITS = 768
+
+# The levels sqrt2_level_sums() takes before it shortens its fixed-point theta to the n it has reached
+SQRT2_LEVEL_SUMS_RESCALE_LEVELS = 32
+
+
+def beatty_sums(ns, alpha=SQRT2, chunk_size=BEATTY_SUMS_CHUNK_SIZE):
+    """
+    beatty_sum(alpha, n) for many n, yielded in input order as they are worked out.
+
+    The n values are read chunk_size at a time, and each chunk goes through the recursion of beatty_sum() level by
+    level. The constants of a level are worked out once and shared by every n still in the chunk: k_i, and beta_i as
+    a fixed-point number B = floor(beta_i * 2^bits), with bits BEATTY_SUMS_GUARD_BITS more than the longest n. Then
+    n * B is within n of n * beta_i * 2^bits, so floor(n * beta_i) is (n * B) >> bits, one multiplication instead of
+    an isqrt, unless the fractional part is within n of 2^bits, which happens about once in 2^64 tries and is settled
+    exactly with floor_quadratic(). An n drops out when it reaches 0. When alpha is sqrt(2), each chunk goes to
+    sqrt2_level_sums() instead, apart from values of n shorter than SQRT2_LEVEL_SUMS_MIN_BITS or longer than
+    SQRT2_LEVEL_SUMS_MAX_BITS, which are passed to beatty_sum_sqrt2_direct() or beatty_sum_sqrt2_ostrowski() one at a
+    time.
+
+    :param ns: an iterable of non-negative integers, read lazily
+    :param alpha: a QuadraticIrrational
+    :param chunk_size: the number of n values taken through the recursion together
+    :return: a generator of sums of floor(i * alpha) for i in 1 to n
+    """
+    chain = reduction_chain(alpha)
+    iterator = iter(ns)
+
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+
+        if alpha == SQRT2:
+            yield from _sqrt2_sums(chunk)
+            continue
+
+        totals = [0] * len(chunk)
+        active = [(index, n) for index, n in enumerate(chunk) if n >= 1]
+
+        level = 0
+        while active:
+            k, p, q = chain.level(level)
+            bits = max(n.bit_length() for _, n in active) + BEATTY_SUMS_GUARD_BITS
+            one = 1 << bits
+            mask = one - 1
+            beta = floor_quadratic(p << bits, one, chain.d, q)
+            negative = level & 1
+            remaining = []
+
+            for index, n in active:
+                scaled = n * beta
+                m = scaled >> bits
+                if (scaled & mask) > one - n:
+                    m = floor_quadratic(n * p, n, chain.d, q)
+
+                term = k * (n * (n + 1) // 2) + n * m
+                totals[index] += -term if negative else term
+                if m:
+                    remaining.append((index, m))
+
+            active = remaining
+            level += 1
+
+        yield from totals
+
+
+def _sqrt2_sums(ns):
+    level_sums = iter(sqrt2_level_sums([n for n in ns
+                                        if SQRT2_LEVEL_SUMS_MIN_BITS <= n.bit_length() <= SQRT2_LEVEL_SUMS_MAX_BITS]))
+    sums = []
+
+    for n in ns:
+        if n.bit_length() < SQRT2_LEVEL_SUMS_MIN_BITS:
+            sums.append(beatty_sum_sqrt2_direct(n))
+        elif n.bit_length() > SQRT2_LEVEL_SUMS_MAX_BITS:
+            sums.append(beatty_sum_sqrt2_ostrowski(n))
+        else:
+            sums.append(next(level_sums))
+
+    return sums
+
+
+def sqrt2_level_sums(ns):
+    """
+    beatty_sum_sqrt2(n) for each of a list of n, sharing one fixed-point theta = sqrt(2) - 1 between them.
+
+    Every level of the recursion for sqrt(2) has the same beta, theta, so the chain of n_k+1 = floor(theta * n_k) for
+    each n costs one multiplication and a few shifts per level, by theta with 64 fractional bits more than n_k. The
+    same product gives the fractional part f_k = theta * n_k - n_k+1 to 64 bits, and the sum follows from the identity
+    in beatty_sum_sqrt2_ostrowski(),
+
+        S(n) = sqrt(2) * n(n+1)/2 - n/2 - sum((-1)^k * g(f_k)),    g(f) = f^2 / (2 * theta) - f / sqrt(2)
+
+    instead of from products of n_k with each other. Each f_k is within 2^-63 of its true value, so the sum of the
+    g(f_k) is off by far less than 1/2 for any n this is used for. Theta is worked out once for the longest n, shifted
+    down to the length of each n, and shortened again every SQRT2_LEVEL_SUMS_RESCALE_LEVELS levels as n_k shrinks. A
+    product too close to an integer to be sure of its floor is settled exactly with floor_sqrt2_minus_1().
+
+    This beats beatty_sum_sqrt2_ostrowski() up to about 300 digits, and the direct loop at every length, but the
+    multiplication per level grows with n, so beatty_sums() passes longer n to the Ostrowski method.
+
+    :param ns: a list of non-negative integers
+    :return: a list of sums of floor(i * sqrt(2)) for i in 1 to n
+    """
+    if not ns:
+        return []
+
+    longest = max(n.bit_length() for n in ns)
+    top_theta = math.isqrt(2 << (2 * (longest + 64))) - (1 << (longest + 64))
+    low = (1 << 64) - 1
+    wide = 192
+    sqrt2 = math.isqrt(2 << (2 * wide))
+    sums = []
+
+    for n in ns:
+        shift = n.bit_length()
+        theta = top_theta >> (longest - shift)
+        sum_f = [0, 0]  # sum(f_k) for even and for odd k, scaled by 2^64
+        sum_f_squared = [0, 0]  # the same for f_k^2, scaled by 2^128
+        x = n
+        level = 0
+
+        while x:
+            if level % SQRT2_LEVEL_SUMS_RESCALE_LEVELS == SQRT2_LEVEL_SUMS_RESCALE_LEVELS - 1:
+                theta >>= shift - x.bit_length()
+                shift = x.bit_length()
+
+            scaled = (x * theta) >> shift
+            f = scaled & low
+            if f == low:
+                # theta * x is within 2^-64 of an integer: the fixed-point floor may be one too small
+                x_next = floor_sqrt2_minus_1(x)
+                if x_next != scaled >> 64:
+                    f = 0
+            else:
+                x_next = scaled >> 64
+
+            sum_f[level & 1] += f
+            sum_f_squared[level & 1] += f * f
+            x = x_next
+            level += 1
+
+        alternating_f = sum_f[0] - sum_f[1]
+        alternating_f_squared = sum_f_squared[0] - sum_f_squared[1]
+        # scaled by 2^128, as in beatty_sum_sqrt2_ostrowski(); g(f) = (f^2 + sqrt(2) * f^2 - sqrt(2) * f) / 2
+        g_sum = (alternating_f_squared + ((alternating_f_squared * sqrt2) >> wide) -
+                 (((alternating_f * sqrt2) >> wide) << 64)) >> 1
+        total = _scaled_sqrt2_triangle(n, 64) - (n << 127) - g_sum
+        sums.append((total + (1 << 127)) >> 128)
+
+    return sums
+
+
+# int() and str() refuse to convert integers with more digits than this (sys.get_int_max_str_digits()), so longer ones
+# go through Decimal, which converts exactly and without a limit
+INT_STR_DIGITS = 4300
+
+
+def digits_to_int(s):
+    """
+    :param s: the decimal digits of a non-negative integer, of any length
+    :return: the integer
+    """
+    # isdigit() alone accepts other scripts' digits, and int() also takes signs, spaces and underscores
+    if not (s.isascii() and s.isdigit()):
+        raise ValueError("invalid literal for an integer: %r" % (s[:20] + "..." if len(s) > 20 else s,))
+
+    if len(s) < INT_STR_DIGITS:
+        return int(s)
+
+    return int(Decimal(s))
+
+
+def int_to_digits(n):
+    """
+    :param n: an integer, of any size
+    :return: its decimal digits
+    """
+    if n.bit_length() < 3 * INT_STR_DIGITS:  # 2^(3 * INT_STR_DIGITS) has fewer than INT_STR_DIGITS digits
+        return str(n)
+
+    return str(Decimal(n))
+
+
+def solution(s, mode="decimal"):
     """
     Given the string representation of an integer n, for every number i in the range 1 to n, add up all of
     the integer portions of i*sqrt(2).
 
     :param s: string representation of an integer n
+    :param mode: "decimal" evaluates beatty_sequence() with Decimal, so n may have at most 101 digits; "integer" uses
+                 beatty_sum_sqrt2(), which is exact for n of any length; both give the same results
     :return: the sum of (floor(1*sqrt(2)) + floor(2*sqrt(2)) + ... + floor(n*sqrt(2))) as a string
     """
+    if mode not in ("decimal", "integer"):
+        raise ValueError("unknown mode %r, expected 'decimal' or 'integer'" % (mode,))
+
     # check the input string is a valid length
     min_length = 1
     max_length = 101
 
-    if len(s) < min_length or len(s) > max_length:
+    if len(s) < min_length:
+        return ''
+
+    if mode == "integer":
+        return int_to_digits(beatty_sum_sqrt2(digits_to_int(s)))
+
+    if len(s) > max_length:
         return ''
 
-    # need to handle integers between 1 and 10^100, so up to 101 decimal places of precision
+    # need to handle integers between 1 and 10^100. (sqrt(2) - 1) * n has up to 101 digits before the decimal point, and
+    # it is never within 1 / (3 * n) of an integer, since |n * sqrt(2) - m| > 1 / (3 * n) for all integers m. So its
+    # floor is exact with 101 more digits after the point, plus a few guard digits.
     # The Python default is 28 significant figures
     # https://www.geeksforgeeks.org/setting-precision-in-python-using-decimal-module/
-    getcontext().prec = max_length
+    # The precision is set on a local copy of the context, so Decimal code elsewhere in the thread is not affected
+    with localcontext() as context:
+        context.prec = 2 * max_length + 10
 
-    n = int(s)
-    alpha = Decimal(2).sqrt()
-    sequence = beatty_sequence(alpha, n)
+        n = digits_to_int(s)
+        alpha = Decimal(2).sqrt()
+        sequence = beatty_sequence(alpha, n)
 
     return str(int(sequence))
 
 
+# The pools solution_batch() can spread its work over
+BATCH_EXECUTORS = {
+    "thread": concurrent.futures.ThreadPoolExecutor,
+    "process": concurrent.futures.ProcessPoolExecutor,
+}
+
+
+def solution_batch(strings, mode="decimal", executor="process", max_workers=None, chunk_size=64):
+    """
+    Solve a list of inputs concurrently, yielding the same values solution() would return, in input order.
+
+    solution() keeps no state between calls and does not touch the thread's Decimal context, so the inputs can be
+    spread over threads as well as processes. Threads suit callers that already run in a thread pool of their own;
+    processes make use of more than one CPU.
+
+    :param strings: an iterable of string representations of integers, as accepted by solution()
+    :param mode: passed on to solution()
+    :param executor: "thread" or "process", one of the keys of BATCH_EXECUTORS
+    :param max_workers: the number of workers; defaults to the executor's own default
+    :param chunk_size: the number of inputs sent to a worker process at a time
+    :return: a generator of sums as strings
+    """
+    # checked here rather than in the generator, so that a bad executor fails at the call
+    if executor not in BATCH_EXECUTORS:
+        raise ValueError("unknown executor %r, expected one of %s" % (executor, ", ".join(sorted(BATCH_EXECUTORS))))
+
+    return _solution_batch(BATCH_EXECUTORS[executor], strings, mode, max_workers, chunk_size)
+
+
+def _solution_batch(executor_class, strings, mode, max_workers, chunk_size):
+    with executor_class(max_workers=max_workers) as pool:
+        yield from pool.map(functools.partial(solution, mode=mode), strings, chunksize=chunk_size)
+
+
 class BeattySequenceTests(unittest.TestCase):
 
     def test_1(self):
@@ -124,3 +765,229 @@ class BeattySequenceTests(unittest.TestCase):
 
         sequence = solution(str_n)
         self.assertEqual(expected_sequence, sequence)
+
+
+class BeattySumSqrt2Tests(unittest.TestCase):
+    """
+    Verify that the integer engine matches a direct sum for small n, the Decimal engine up to 101 digits, and stays
+    exact far beyond them.
+    """
+
+    def test_matches_direct_sum(self):
+        total = 0
+        for n in range(1, 2000):
+            total += math.isqrt(2 * n * n)
+            self.assertEqual(total, beatty_sum_sqrt2(n))
+
+        self.assertEqual(0, beatty_sum_sqrt2(0))
+
+    def test_matches_decimal_engine(self):
+        generator = random.Random(41)
+
+        numbers = [generator.randrange(10 ** (digits - 1), 10 ** digits) for digits in range(1, 102)]
+        numbers += [generator.randrange(10 ** 99, 10 ** 101) for _ in range(200)]
+        for j in range(1, 300):
+            # n * sqrt(2) comes closest to an integer for the Pell denominators
+            q, _ = pell_pair(j)
+            if q < 10 ** 101:
+                numbers += [q - 1, q, q + 1]
+
+        for n in numbers:
+            self.assertEqual(str(beatty_sum_sqrt2(n)), solution(str(n)))
+            self.assertEqual(solution(str(n)), solution(str(n), mode="integer"))
+
+    def test_only_ascii_digits(self):
+        for s in ['\u0663', '\uff15', '+5', ' 5', '5_0', '-5', '5.0']:
+            self.assertRaises(ValueError, solution, s)
+            self.assertRaises(ValueError, solution, s, mode="integer")
+
+    def test_beyond_101_digits(self):
+        # the sum is about n^2 / sqrt(2): check it against the bounds n^2/sqrt(2) - n and n^2/sqrt(2) + n, which come
+        # from summing floor(i * sqrt(2)) > i * sqrt(2) - 1 and floor(i * sqrt(2)) < i * sqrt(2)
+        n = 10 ** 2000 + 12345
+        total = beatty_sum_sqrt2(n)
+        exact_square_sum = 2 * (n * (n + 1) // 2) ** 2  # (sqrt(2) * n(n+1)/2)^2
+
+        self.assertLess(total * total, exact_square_sum)
+        self.assertGreater((total + n) ** 2, exact_square_sum)
+        self.assertEqual(str(total), solution(str(n), mode="integer"))
+
+    def test_ostrowski_matches_direct_loop(self):
+        generator = random.Random(42)
+
+        numbers = [generator.getrandbits(bits) for bits in range(0, 2000, 17)]
+        for j in range(1, 400, 7):
+            # the denominators make the fractional parts come very close to 0 or 1, which needs the exact fallback
+            q, _ = pell_pair(j)
+            numbers += [q, q - 1, q + 1, 2 * q, 3 * q + 1]
+
+        for n in numbers:
+            self.assertEqual(beatty_sum_sqrt2_direct(n), beatty_sum_sqrt2_ostrowski(n))
+
+    def test_ostrowski_digits(self):
+        for n in range(1, 3000):
+            digits = ostrowski_digits(n)
+            q_previous, q = 0, 1
+            total = 0
+            for digit in digits:
+                total += digit * q
+                q_previous, q = q, 2 * q + q_previous
+
+            self.assertEqual(n, total)
+            self.assertLessEqual(digits[0], 1)
+            self.assertNotEqual(0, digits[-1])
+            for j in range(1, len(digits)):
+                if digits[j] == 2:
+                    self.assertEqual(0, digits[j - 1])
+
+    def test_floor_sqrt2_minus_1(self):
+        for x in range(-500, 500):
+            self.assertEqual(math.floor((math.sqrt(2) - 1) * x), floor_sqrt2_minus_1(x))
+
+    def test_longer_than_int_str_limit(self):
+        n = 10 ** 5000 - 1
+        digits = int_to_digits(n)
+
+        self.assertEqual("9" * 5000, digits)
+        self.assertEqual(n, digits_to_int(digits))
+        self.assertEqual(int_to_digits(beatty_sum_sqrt2(n)), solution(digits, mode="integer"))
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, solution, '5', mode="float")
+
+
+class ThreadSafetyTests(unittest.TestCase):
+    """
+    Verify that solution() leaves the Decimal context alone, and that the batch API returns results in input order.
+    """
+
+    inputs = ['77', '5', str(10 ** 100), '1', '0', '', '12345678901234567890']
+
+    def test_context_untouched(self):
+        precision = getcontext().prec
+
+        solution('77')
+        self.assertEqual(precision, getcontext().prec)
+
+    def test_interleaved_with_other_decimal_code(self):
+        errors = []
+
+        def service_thread():
+            # a request handler that uses its own Decimal precision between calls to solution()
+            getcontext().prec = 10
+            for _ in range(50):
+                if solution('77') != '4208' or str(Decimal(1) / Decimal(3)) != '0.3333333333':
+                    errors.append(getcontext().prec)
+
+        threads = [threading.Thread(target=service_thread) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+
+    def test_batch_in_order(self):
+        expected = [solution(s) for s in self.inputs]
+
+        self.assertEqual(['4208', '19'], expected[:2])
+        self.assertEqual(expected * 20, list(solution_batch(self.inputs * 20, executor="thread", max_workers=4)))
+        self.assertEqual(expected, list(solution_batch(self.inputs, executor="process", max_workers=2)))
+        self.assertEqual(expected, list(solution_batch(self.inputs, mode="integer", executor="thread")))
+        self.assertEqual([], list(solution_batch([])))
+        self.assertRaises(ValueError, solution_batch, self.inputs, executor="fiber")
+
+
+class GeneralBeattySumTests(unittest.TestCase):
+    """
+    Verify beatty_sum() against a direct sum for several alphas, and that each alpha's reduction chain is built once.
+    """
+
+    alphas = [SQRT2, SQRT3, SQRT5, GOLDEN_RATIO,
+              QuadraticIrrational(3, -1, 2, 7),  # (3 - sqrt(7)) / 2 < 1
+              QuadraticIrrational(7, 3, 3, 2),
+              QuadraticIrrational(1, -2, -3, 11),
+              QuadraticIrrational(0, 1, 7, 1000003)]  # a long period
+
+    def test_matches_direct_sum(self):
+        for alpha in self.alphas:
+            total = 0
+            for n in range(1, 600):
+                total += alpha.floor_multiple(n)
+                self.assertEqual(total, beatty_sum(alpha, n), alpha)
+
+            self.assertEqual(0, beatty_sum(alpha, 0))
+
+    def test_floor_multiple(self):
+        self.assertEqual([1, 3, 4, 6, 8], [GOLDEN_RATIO.floor_multiple(n) for n in range(1, 6)])
+        self.assertEqual([0, 0, 0, 0, 0, 1], [QuadraticIrrational(3, -1, 2, 7).floor_multiple(n) for n in range(1, 7)])
+
+    def test_sqrt2_matches_integer_engine(self):
+        alpha = QuadraticIrrational(0, 2, 2, 2)  # sqrt(2), written differently so it takes the general path
+        for n in [10 ** 50 + 7, 10 ** 100, 3 ** 400]:
+            self.assertEqual(beatty_sum_sqrt2(n), beatty_sum(alpha, n))
+            self.assertEqual(beatty_sum_sqrt2(n), beatty_sum(SQRT2, n))
+
+    def test_complementary_sequences(self):
+        # Rayleigh: floor(i * phi) and floor(j * phi^2) together cover every positive integer exactly once, so the
+        # two sums up to m = floor(n * phi) add up to m(m+1)/2
+        phi_squared = QuadraticIrrational(3, 1, 2, 5)
+        n = 10 ** 30 + 1
+        m = GOLDEN_RATIO.floor_multiple(n)
+        # floor(j * phi^2) <= m exactly when j < (m + 1) / phi^2 = (m + 1) * (3 - sqrt(5)) / 2
+        j = QuadraticIrrational(3, -1, 2, 5).floor_multiple(m + 1)
+        self.assertLessEqual(phi_squared.floor_multiple(j), m)
+        self.assertGreater(phi_squared.floor_multiple(j + 1), m)
+
+        self.assertEqual(m * (m + 1) // 2, beatty_sum(GOLDEN_RATIO, n) + beatty_sum(phi_squared, j))
+
+    def test_chain_cached(self):
+        alpha = QuadraticIrrational(2, 1, 3, 19)
+        misses = reduction_chain.cache_info().misses
+
+        for n in range(1, 50):
+            beatty_sum(alpha, 10 ** n)
+        self.assertEqual(misses + 1, reduction_chain.cache_info().misses)
+        self.assertIs(reduction_chain(alpha), reduction_chain(QuadraticIrrational(2, 1, 3, 19)))
+
+    def test_not_quadratic_irrational(self):
+        self.assertRaises(ValueError, QuadraticIrrational, 0, 1, 1, 4)
+        self.assertRaises(ValueError, QuadraticIrrational, 1, 0, 1, 2)
+        self.assertRaises(ValueError, QuadraticIrrational, 1, 1, 0, 2)
+        self.assertRaises(ValueError, QuadraticIrrational, 1, -1, 1, 2)
+
+
+class BeattySumsTests(unittest.TestCase):
+    """
+    Verify that the batch API matches beatty_sum() one n at a time, in input order, reading its input lazily.
+    """
+
+    def test_matches_single_sums(self):
+        generator = random.Random(44)
+        ns = [generator.getrandbits(generator.randrange(0, 400)) for _ in range(700)] + [0, 1, 2, 3]
+
+        for alpha in [SQRT2, SQRT3, GOLDEN_RATIO, QuadraticIrrational(3, -1, 2, 7)]:
+            self.assertEqual([beatty_sum(alpha, n) for n in ns], list(beatty_sums(ns, alpha, chunk_size=100)))
+
+    def test_exact_fallback(self):
+        # n = q_j for sqrt(2) puts n * (sqrt(2) - 1) within 1 / q_j of an integer, so the fixed-point floor is too close
+        # to call at the first level
+        ns = [pell_pair(j)[0] for j in range(60, 90)]
+
+        self.assertEqual([beatty_sum_sqrt2_direct(n) for n in ns], list(beatty_sums(ns, QuadraticIrrational(0, 2, 2, 2))))
+
+    def test_sqrt2_level_sums(self):
+        generator = random.Random(45)
+        ns = [generator.getrandbits(bits) for bits in range(0, 2 * SQRT2_LEVEL_SUMS_MAX_BITS, 7)]
+        # theta * q_j is within theta^(j + 1) of an integer, so these take the exact floor at their first levels
+        ns += [pell_pair(j)[0] for j in range(40, 90)] + [pell_pair(j)[0] + 1 for j in range(40, 90)]
+
+        self.assertEqual([beatty_sum_sqrt2_direct(n) for n in ns], sqrt2_level_sums(ns))
+        self.assertEqual([beatty_sum_sqrt2_direct(n) for n in ns], list(beatty_sums(ns, chunk_size=50)))
+        self.assertEqual([], sqrt2_level_sums([]))
+
+    def test_streams(self):
+        sums = beatty_sums(itertools.count(1), chunk_size=10)
+
+        self.assertEqual([1, 3, 7, 12, 19], list(itertools.islice(sums, 5)))
+        self.assertEqual([], list(beatty_sums([])))
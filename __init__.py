@@ -0,0 +1,2 @@
+# The solutions by problem name, loaded on first use; see registry.py
+from .registry import SOLUTION_PATHS, get_solver, load_module, problems
@@ -0,0 +1,553 @@
+"""
+Run a file of mixed jobs through the solutions on a pool of worker processes.
+
+Each line of the input is a JSON job naming a problem from registry.SOLUTION_PATHS and the arguments for its
+solution(), in the format workloads.py writes:
+
+    {"problem": "queue_to_do", "args": [17, 4]}
+    {"id": "b7", "problem": "dodge_the_lasers", "args": ["77"], "kwargs": {"mode": "integer"}}
+
+Each line of the output is {"result": ...}, or {"error": "..."} if the job could not be run, in input order and
+carrying the job's "id" if it had one:
+
+    python batch_runner.py jobs.jsonl --output results.jsonl --workers 4 --timeout 10
+
+The input is read a window of jobs at a time. The jobs in a window are grouped by problem into chunks, which run on
+the pool while the next window is read, so no more than two windows are ever held in memory. Problems with a batch API
+run a whole chunk through it (see BATCH_SOLVERS), and the rest are solved one job at a time. With --cache, the workers
+look each job up in a result_cache.ResultCache first, and store the results they solve in it. If a worker process
+dies, the pool is replaced and the chunks it lost are run once more on the new one.
+"""
+import argparse
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import contextlib
+import io
+import itertools
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+import unittest
+
+import registry
+import result_cache
+import workloads
+
+# The number of jobs sent to a worker at a time
+CHUNK_SIZE = 64
+
+
+class JobTimeout(Exception):
+    """
+    Raised inside a job that runs for longer than its timeout.
+    """
+
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def call_with_timeout(function, timeout, *args, **kwargs):
+    """
+    Call a function, raising JobTimeout if it runs for more than 'timeout' seconds.
+
+    The timeout is a SIGALRM timer, so it only works in the main thread, on platforms with signal.setitimer(), and
+    interrupts the call between two Python bytecodes: a single long call into C code (one huge multiplication, say)
+    finishes before the timeout takes effect.
+
+    :param timeout: seconds, or None for no limit
+    """
+    if not timeout or not hasattr(signal, "setitimer"):
+        return function(*args, **kwargs)
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _error(error):
+    if isinstance(error, JobTimeout):
+        return {"error": "timed out"}
+
+    return {"error": "%s: %s" % (type(error).__name__, error)}
+
+
+def _fuel_injection_batch(calls, results):
+    """
+    The same results as solution() for each call, with pellet counts below the table size answered from
+    operation_count_table(), as in solution_batch(), but without the process pool solution_batch() starts for larger
+    counts, since this already runs in a worker.
+    """
+    module = registry.load_module("fuel_injection_perfection")
+    table = module.operation_count_table()
+
+    for position, (args, kwargs) in enumerate(calls):
+        n = module.parse_pellet_count(args[0]) if len(args) == 1 and not kwargs else None
+        if n is None or n < 1:
+            results[position] = module.solution(*args, **kwargs)
+        elif n < len(table):
+            results[position] = table[n]
+        else:
+            results[position] = module.count_operations(n)
+
+
+def _dodge_the_lasers_batch(calls, results):
+    """
+    The same results as solution() for each call, with the calls in "integer" mode summed together by beatty_sums().
+    """
+    module = registry.load_module("dodge_the_lasers")
+    positions = []
+    ns = []
+
+    for position, (args, kwargs) in enumerate(calls):
+        s = args[0] if len(args) == 1 else None
+        if kwargs == {"mode": "integer"} and isinstance(s, str) and s.isascii() and s.isdigit():
+            positions.append(position)
+            ns.append(module.digits_to_int(s))
+        else:
+            results[position] = module.solution(*args, **kwargs)
+
+    for position, total in zip(positions, module.beatty_sums(ns)):
+        results[position] = module.int_to_digits(total)
+
+
+# Problems whose chunks go through a batch API. Each function takes a list of (args, kwargs) and a list as long, in
+# which it puts the result solution() would return for each call as soon as it has it, so that the results worked out
+# before a failure or a timeout are kept.
+BATCH_SOLVERS = {
+    "fuel_injection_perfection": _fuel_injection_batch,
+    "dodge_the_lasers": _dodge_the_lasers_batch,
+}
+
+
+def run_chunk(problem, calls, timeout=None, cache=None):
+    """
+    Solve a chunk of jobs for one problem. Runs in a worker process.
+
+    A batch API gets the whole chunk, with a timeout of 'timeout' per job; if it fails or runs out of time, the jobs
+    it had not solved yet are run again one at a time, so that only the jobs at fault are reported as errors.
+
+    :param problem: one of the keys of registry.SOLUTION_PATHS
+    :param calls: a list of (args, kwargs)
+    :param timeout: seconds per job, or None
+    :param cache: a result_cache.ResultCache to answer jobs from and store results in, or None
+    :return: a list of {"result": ...} or {"error": ...} dicts
+    """
+    if cache is None:
+        return _solve_chunk(problem, calls, timeout)
+
+    outputs = [None] * len(calls)
+    keys = [result_cache.cache_key(problem, args, kwargs) for args, kwargs in calls]
+    missing = []
+
+    for position, key in enumerate(keys):
+        result = cache.get(key) if key is not None else result_cache.MISSING
+        if result is result_cache.MISSING:
+            missing.append(position)
+        else:
+            outputs[position] = {"result": result}
+
+    solved = _solve_chunk(problem, [calls[position] for position in missing], timeout) if missing else []
+    for position, output in zip(missing, solved):
+        outputs[position] = output
+        if "result" in output and keys[position] is not None:
+            cache.put(keys[position], output["result"])
+
+    return outputs
+
+
+_UNSOLVED = object()
+
+
+def _solve_chunk(problem, calls, timeout):
+    batch_solver = BATCH_SOLVERS.get(problem)
+    results = [_UNSOLVED] * len(calls)
+
+    if batch_solver is not None and len(calls) > 1:
+        try:
+            call_with_timeout(batch_solver, timeout and timeout * len(calls), calls, results)
+        except Exception:
+            pass
+
+    outputs = [{"result": result} if result is not _UNSOLVED else None for result in results]
+    if all(outputs):
+        return outputs
+
+    try:
+        solver = registry.get_solver(problem)
+    except Exception as error:
+        return [output or _error(error) for output in outputs]
+
+    for position, (args, kwargs) in enumerate(calls):
+        if outputs[position] is not None:
+            continue
+        try:
+            outputs[position] = {"result": call_with_timeout(solver, timeout, *args, **kwargs)}
+        except Exception as error:
+            outputs[position] = _error(error)
+
+    return outputs
+
+
+_worker_cache = None
+
+
+def initialize_worker(cache):
+    """
+    The initializer of a worker process that runs chunks with run_worker_chunk().
+
+    :param cache: a result_cache.ResultCache for the worker's chunks, or None
+    """
+    global _worker_cache
+    _worker_cache = cache
+
+    # some solutions print as they go, which would end up in the results when they are written to stdout
+    sys.stdout = open(os.devnull, "w")
+
+
+def run_worker_chunk(problem, calls, timeout):
+    """
+    run_chunk() with the cache the worker was initialized with.
+    """
+    return run_chunk(problem, calls, timeout, _worker_cache)
+
+
+def parse_job(line):
+    """
+    :param line: one line of the input
+    :return: (problem, args, kwargs, job id), or an error dict if the line is not a valid job
+    """
+    try:
+        job = json.loads(line)
+    except ValueError as error:
+        return {"error": "invalid JSON: %s" % (error,)}
+
+    if not isinstance(job, dict):
+        return {"error": "a job must be a JSON object"}
+
+    problem = job.get("problem")
+    args = job.get("args", [])
+    kwargs = job.get("kwargs", {})
+    # a list or object would be unhashable, and fail the lookup with a TypeError
+    if not isinstance(problem, str) or problem not in registry.SOLUTION_PATHS:
+        return {"error": "unknown problem %r" % (problem,)}
+    if not isinstance(args, list) or not isinstance(kwargs, dict):
+        return {"error": "args must be a list and kwargs an object"}
+
+    return problem, args, kwargs, job.get("id")
+
+
+class _WorkerPool(object):
+    """
+    The process pool run_jobs() submits its chunks to, replaced by a new one when a worker process dies, since a
+    ProcessPoolExecutor that has lost a worker fails everything submitted to it.
+    """
+
+    def __init__(self, max_workers, cache):
+        self.max_workers = max_workers
+        self.cache = cache
+        self.executor = self._start_executor()
+
+    def _start_executor(self):
+        return concurrent.futures.ProcessPoolExecutor(self.max_workers, initializer=initialize_worker,
+                                                      initargs=(self.cache,))
+
+    def submit(self, problem, calls, timeout):
+        """
+        :return: (executor, future), the executor being the one to pass to replace() if the future fails with
+                 BrokenProcessPool
+        """
+        executor = self.executor
+        try:
+            return executor, executor.submit(run_worker_chunk, problem, calls, timeout)
+        except concurrent.futures.process.BrokenProcessPool:
+            self.replace(executor)
+            return self.executor, self.executor.submit(run_worker_chunk, problem, calls, timeout)
+
+    def replace(self, broken):
+        """
+        Start a new pool in place of a broken one, unless that was done already for the chunks of the same pool.
+        """
+        if self.executor is broken:
+            broken.shutdown(wait=False)
+            self.executor = self._start_executor()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def _submit_window(pool, lines, chunk_size, timeout):
+    """
+    :return: (outputs, ids, chunks), where outputs holds the errors found while parsing and None elsewhere, and chunks
+             is a list of (positions, problem, calls, executor, future) for the chunks submitted
+    """
+    outputs = [None] * len(lines)
+    ids = [None] * len(lines)
+    by_problem = collections.defaultdict(list)
+
+    for position, line in enumerate(lines):
+        job = parse_job(line)
+        if isinstance(job, dict):
+            outputs[position] = job
+        else:
+            problem, args, kwargs, ids[position] = job
+            by_problem[problem].append((position, (args, kwargs)))
+
+    chunks = []
+    for problem, jobs in by_problem.items():
+        for start in range(0, len(jobs), chunk_size):
+            chunk = jobs[start:start + chunk_size]
+            calls = [call for _, call in chunk]
+            chunks.append(([position for position, _ in chunk], problem, calls) + pool.submit(problem, calls, timeout))
+
+    return outputs, ids, chunks
+
+
+def _finish_window(pool, window, timeout):
+    outputs, ids, chunks = window
+
+    for positions, problem, calls, executor, future in chunks:
+        try:
+            try:
+                chunk_outputs = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                # a worker died, maybe running another chunk: run this one once more, on a new pool
+                pool.replace(executor)
+                chunk_outputs = pool.submit(problem, calls, timeout)[1].result()
+        except Exception as error:  # this chunk's worker died again, for instance
+            chunk_outputs = [_error(error)] * len(positions)
+
+        for position, output in zip(positions, chunk_outputs):
+            outputs[position] = output
+
+    for job_id, output in zip(ids, outputs):
+        if job_id is not None:
+            output = dict(id=job_id, **output)
+        yield output
+
+
+def run_jobs(lines, max_workers=None, chunk_size=CHUNK_SIZE, timeout=None, window_size=None, cache=None):
+    """
+    Solve a stream of jobs on a process pool, yielding one output per job in input order. Blank lines are skipped.
+
+    :param lines: an iterable of JSON job lines, read lazily
+    :param max_workers: the number of worker processes; defaults to the number of CPUs
+    :param chunk_size: the most jobs sent to a worker at a time
+    :param timeout: seconds allowed per job, or None for no limit
+    :param window_size: the number of jobs read at a time; defaults to four chunks per worker
+    :param cache: a result_cache.ResultCache shared by the workers, or None
+    :return: a generator of {"result": ...} or {"error": ...} dicts
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    window_size = window_size or 4 * chunk_size * max_workers
+    jobs = (line for line in lines if line.strip())
+    pending = collections.deque()
+    pool = _WorkerPool(max_workers, cache)
+
+    try:
+        while True:
+            window = list(itertools.islice(jobs, window_size))
+            if not window:
+                break
+
+            pending.append(_submit_window(pool, window, chunk_size, timeout))
+            if len(pending) > 1:
+                yield from _finish_window(pool, pending.popleft(), timeout)
+
+        while pending:
+            yield from _finish_window(pool, pending.popleft(), timeout)
+    finally:
+        pool.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of jobs through the challenge solutions.")
+    parser.add_argument("input", nargs="?", default="-", help="the JSONL jobs (default: stdin)")
+    parser.add_argument("--output", default="-", help="the file to write the results to (default: stdout)")
+    parser.add_argument("--workers", type=int, help="the number of worker processes (default: the number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="jobs sent to a worker at a time")
+    parser.add_argument("--timeout", type=float, help="seconds allowed per job (default: no limit)")
+    parser.add_argument("--cache", help="a result_cache.py database to reuse results from (default: none)")
+    parser.add_argument("--progress-interval", type=float, default=5.0,
+                        help="seconds between progress reports on stderr; 0 for none (default: 5)")
+    arguments = parser.parse_args(argv)
+
+    source = sys.stdin if arguments.input == "-" else open(arguments.input)
+    output = sys.stdout if arguments.output == "-" else open(arguments.output, "w")
+    cache = result_cache.ResultCache(arguments.cache) if arguments.cache else None
+    start = last_report = time.monotonic()
+    done = errors = 0
+
+    try:
+        for result in run_jobs(source, arguments.workers, arguments.chunk_size, arguments.timeout,
+                               cache=cache):
+            output.write(json.dumps(result, separators=(",", ":")) + "\n")
+            done += 1
+            errors += "error" in result
+
+            now = time.monotonic()
+            if arguments.progress_interval and now - last_report >= arguments.progress_interval:
+                print("%d jobs done, %d errors, %.0f jobs/s" % (done, errors, done / (now - start)), file=sys.stderr)
+                last_report = now
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    if arguments.progress_interval:
+        print("%d jobs done, %d errors in %.1fs" % (done, errors, time.monotonic() - start), file=sys.stderr)
+
+    return 0
+
+
+class BatchRunnerTests(unittest.TestCase):
+
+    def test_results_in_order(self):
+        jobs = list(workloads.jobs(300, problems=["queue_to_do", "grandest_staircase", "fuel_injection_perfection",
+                                                  "dodge_the_lasers", "distract_the_trainers"],
+                                   sizes={"grandest_staircase": 30, "distract_the_trainers": 10}, seed=48))
+        lines = [json.dumps(job) for job in jobs]
+
+        outputs = list(run_jobs(lines, max_workers=2, chunk_size=8, window_size=50))
+
+        expected = [registry.get_solver(job["problem"])(*job["args"]) for job in jobs]
+        self.assertEqual([{"result": result} for result in expected], outputs)
+
+    def test_batch_solvers_match_solution(self):
+        fuel = ["4", "15", "1", "0", "", "x", str(10 ** 300 + 7), str((1 << 20) + 3)]
+        calls = [([s], {}) for s in fuel] + [([4], {})]
+        solver = registry.get_solver("fuel_injection_perfection")
+        results = [None] * len(calls)
+        _fuel_injection_batch(calls, results)
+        self.assertEqual([solver(*args) for args, _ in calls], results)
+
+        lasers = [(["77"], {"mode": "integer"}), (["5"], {}), ([""], {"mode": "integer"}), (["1" * 150], {}),
+                  (["9" * 150], {"mode": "integer"}), (["123"], {"mode": "integer"}), (["0"], {"mode": "integer"})]
+        solver = registry.get_solver("dodge_the_lasers")
+        results = [None] * len(lasers)
+        _dodge_the_lasers_batch(lasers, results)
+        self.assertEqual([solver(*args, **kwargs) for args, kwargs in lasers], results)
+
+    def test_errors_and_ids(self):
+        lines = [
+            '{"id": 1, "problem": "queue_to_do", "args": [0, 3]}',
+            'not json',
+            '',
+            '{"problem": "no_such_problem", "args": []}',
+            '{"id": "x", "problem": "queue_to_do", "args": ["a", "b"]}',
+            '[1, 2]',
+            '{"problem": "queue_to_do", "args": 5}',
+            '{"problem": []}',
+            '{"id": 2, "problem": {"name": "queue_to_do"}}',
+        ]
+
+        outputs = list(run_jobs(lines, max_workers=1))
+
+        self.assertEqual(8, len(outputs))
+        self.assertEqual({"id": 1, "result": 2}, outputs[0])
+        self.assertTrue(outputs[1]["error"].startswith("invalid JSON"))
+        self.assertEqual({"error": "unknown problem 'no_such_problem'"}, outputs[2])
+        self.assertEqual("x", outputs[3]["id"])
+        self.assertTrue(outputs[3]["error"].startswith("TypeError"))
+        self.assertIn("error", outputs[4])
+        self.assertIn("error", outputs[5])
+        self.assertEqual({"error": "unknown problem []"}, outputs[6])
+        self.assertEqual({"error": "unknown problem {'name': 'queue_to_do'}"}, outputs[7])
+
+    def test_timeout(self):
+        # 44721 is the longest line, which takes a few hundredths of a second
+        calls = [([0, 3], {}), ([0, 44721], {})] * 3
+
+        outputs = run_chunk("queue_to_do", calls, timeout=1e-4)
+
+        self.assertEqual([{"result": 2}, {"error": "timed out"}] * 3, outputs)
+        self.assertRaises(JobTimeout, call_with_timeout, time.sleep, 0.01, 1)
+        self.assertEqual(2, call_with_timeout(max, None, 1, 2))
+
+    def test_batch_timeout_keeps_solved_jobs(self):
+        def slow_batch(calls, results):
+            results[0] = "from the batch"
+            time.sleep(1)
+
+        BATCH_SOLVERS["queue_to_do"] = slow_batch
+        try:
+            outputs = run_chunk("queue_to_do", [([0, 3], {}), ([17, 4], {}), (["a", "b"], {})], timeout=0.05)
+        finally:
+            del BATCH_SOLVERS["queue_to_do"]
+
+        # only the jobs the batch had not got to are run again
+        self.assertEqual([{"result": "from the batch"}, {"result": 14}], outputs[:2])
+        self.assertTrue(outputs[2]["error"].startswith("TypeError"))
+
+    def test_worker_killed(self):
+        lines = ['{"problem": "grandest_staircase", "args": [%d]}' % n for n in (200, 3, 5)]
+        pool = _WorkerPool(1, None)
+        try:
+            executor = pool.executor
+            pid = executor.submit(os.getpid).result()
+            # keeps the only worker busy, so that the chunks are still queued when it is killed
+            sleeping = executor.submit(time.sleep, 10)
+            window = _submit_window(pool, lines, 2, None)
+            os.kill(pid, signal.SIGKILL)
+
+            outputs = list(_finish_window(pool, window, None))
+
+            self.assertEqual([{"result": 487067745}, {"result": 1}, {"result": 2}], outputs)
+            self.assertIsNot(executor, pool.executor)
+            self.assertRaises(concurrent.futures.process.BrokenProcessPool, sleeping.result)
+
+            # a pool found broken when a chunk is submitted is replaced too
+            executor = pool.executor
+            os.kill(executor.submit(os.getpid).result(), signal.SIGKILL)
+            time.sleep(0.5)
+            self.assertEqual([{"result": 2}], list(_finish_window(pool, _submit_window(pool, lines[2:], 2, None),
+                                                                  None)))
+            self.assertIsNot(executor, pool.executor)
+        finally:
+            pool.shutdown()
+
+    def test_cache(self):
+        lines = ['{"problem": "grandest_staircase", "args": [%d]}' % n for n in (200, 3, 200, 5)]
+        lines.append('{"problem": "queue_to_do", "args": ["a", "b"]}')
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = result_cache.ResultCache(os.path.join(directory, "results.sqlite"))
+            first = list(run_jobs(lines, max_workers=1, cache=cache))
+            second = list(run_jobs(lines, max_workers=1, cache=cache))
+
+            self.assertEqual(first, second)
+            self.assertEqual([{"result": 487067745}, {"result": 1}, {"result": 487067745}, {"result": 2}], first[:4])
+            self.assertIn("error", first[4])
+            # three results are stored, and the error is not
+            self.assertEqual(3, cache.info().disk_entries)
+            self.assertEqual([{"result": 2}], run_chunk("grandest_staircase", [([5], {})], cache=cache))
+            self.assertEqual(1, cache.info().disk_hits)
+            cache.close()
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, "jobs.jsonl")
+            output_path = os.path.join(directory, "results.jsonl")
+            with open(input_path, "w") as input_file:
+                input_file.write('{"problem": "grandest_staircase", "args": [200]}\n' * 3)
+
+            errors = io.StringIO()
+            with contextlib.redirect_stderr(errors):
+                main([input_path, "--output", output_path, "--workers", "1"])
+
+            with open(output_path) as output_file:
+                self.assertEqual(['{"result":487067745}'] * 3, output_file.read().splitlines())
+            self.assertIn("3 jobs done, 0 errors", errors.getvalue())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,430 @@
+"""
+Benchmarks for the nine challenge solutions.
+
+Each challenge is run over a ladder of input sizes (message size, tree height, queue length, bricks, digit count,
+trainer count, graph size, ...). At each size, workloads.py generates a set of random inputs from a fixed seed, every
+input is timed individually over several repeats, and the timing percentiles and the peak memory allocated by one pass
+are reported. Some challenges also have ladders for their other modes and engines at larger sizes, named
+"<problem>/<mode>", such as the exact and anytime matchings for thousands of trainers, and Johnson's algorithm on
+sparse corridor maps with thousands of nodes. The report is written as JSON, and can be compared against an earlier
+report to catch regressions:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --baseline before.json
+
+The solutions are loaded by problem name through registry.py, since their packages start with digits
+(1_LanceAndJanice, ...) and can't be imported with an import statement.
+"""
+import argparse
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+import registry
+import workloads
+
+# The number of random inputs timed at each size of a ladder
+CALLS_PER_STEP = 16
+
+# The percentiles of the per-call times reported for each size
+PERCENTILES = (50, 90, 99)
+
+# How long the anytime matching may take for each roster, in seconds
+ANYTIME_BUDGET = 0.1
+
+# The average number of corridors leaving each node of the sparse maps for Johnson's algorithm
+CORRIDORS_PER_NODE = 4
+
+# The number of values of n in each batch of laser sums
+BEATTY_BATCH_SIZE = 1000
+
+
+class Challenge(object):
+    """
+    One solution to benchmark, the size parameter it scales with, and how to make an input of a given size.
+    """
+
+    def __init__(self, name, parameter, ladder, quick_ladder, make_input=None, problem=None, function="solution",
+                 kwargs=None, calls=CALLS_PER_STEP):
+        """
+        :param name: the name the results are reported under
+        :param parameter: the name of the size parameter
+        :param ladder: the sizes to run
+        :param quick_ladder: the sizes to run with --quick
+        :param make_input: make_input(generator, size) returns the arguments for one call; defaults to the problem's
+                           workload
+        :param problem: the problem's name in registry.SOLUTION_PATHS and workloads.PROBLEM_WORKLOADS; defaults to
+                        'name'
+        :param function: the name of the function to time in the problem's solution module, or a function to time
+        :param kwargs: keyword arguments passed on every call, such as the mode
+        :param calls: the number of random inputs timed at each size
+        """
+        if problem is None:
+            problem = name
+        if make_input is None:
+            make_input = functools.partial(workloads.make_arguments, problem)
+
+        self.name = name
+        self.parameter = parameter
+        self.ladder = ladder
+        self.quick_ladder = quick_ladder
+        self.make_input = make_input
+        self.problem = problem
+        self.function = function
+        self.kwargs = kwargs or {}
+        self.calls = calls
+
+    def solver(self):
+        """
+        :return: the function to time, loading the solution through the registry if needed
+        """
+        solver = self.function
+        if isinstance(solver, str):
+            solver = registry.get_solver(self.problem, solver)
+
+        return functools.partial(solver, **self.kwargs) if self.kwargs else solver
+
+
+def structured_banana_list(generator, trainers):
+    """
+    :return: the arguments for a roster in which some trainers share banana counts and many pairs stop wrestling, so
+             that the matching has work to do
+    """
+    return [workloads.banana_list(generator, trainers, duplicate_fraction=0.2, ending_fraction=0.5)]
+
+
+def anytime_matching(banana_list):
+    """
+    Run anytime_matching() with a deadline ANYTIME_BUDGET seconds from now.
+    """
+    matching = registry.get_solver("distract_the_trainers", "anytime_matching")
+
+    return matching(banana_list, time.monotonic() + ANYTIME_BUDGET)
+
+
+def sparse_corridor_map(generator, size):
+    """
+    :return: the arguments for johnson_all_pairs(): a corridor map with about CORRIDORS_PER_NODE corridors leaving
+             each node, as compressed sparse rows
+    """
+    edges = workloads.corridor_edges(generator, size, density=min(1.0, CORRIDORS_PER_NODE / size))
+
+    return list(workloads.corridor_csr(edges, size))
+
+
+def johnson_all_pairs(indptr, indices, weights):
+    """
+    Build a CSRGraph and find its shortest paths with johnson_shortest_paths(), in this process.
+    """
+    graph = registry.get_solver("running_with_bunnies", "CSRGraph")(indptr, indices, weights)
+
+    return registry.get_solver("running_with_bunnies", "johnson_shortest_paths")(graph, max_workers=1)
+
+
+def beatty_batch(generator, digits):
+    """
+    :return: the arguments for a batch of BEATTY_BATCH_SIZE values of n with that many digits each
+    """
+    return [[int(workloads.digit_string(generator, digits)) for _ in range(BEATTY_BATCH_SIZE)]]
+
+
+def beatty_sums_batched(ns):
+    """
+    Sum floor(i * sqrt(2)) for each n in the batch with beatty_sums().
+    """
+    return list(registry.get_solver("dodge_the_lasers", "beatty_sums")(ns))
+
+
+def beatty_sums_one_by_one(ns):
+    """
+    Sum floor(i * sqrt(2)) for each n in the batch with a call to beatty_sum_sqrt2() each, the baseline for
+    beatty_sums_batched().
+    """
+    beatty_sum_sqrt2 = registry.get_solver("dodge_the_lasers", "beatty_sum_sqrt2")
+
+    return [beatty_sum_sqrt2(n) for n in ns]
+
+
+CHALLENGES = [
+    Challenge("lance_and_janice", "message_size", [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6], [10, 10 ** 3]),
+    # the board is always 8x8, so there is only one size
+    Challenge("dont_get_volunteered", "board_size", [8], [8]),
+    Challenge("ion_flux_relabeling", "tree_height", [5, 10, 20, 30], [3, 5]),
+    Challenge("queue_to_do", "queue_length", [10 ** 2, 10 ** 3, 10 ** 4, 44721], [10, 10 ** 2]),
+    Challenge("grandest_staircase", "bricks", [50, 100, 150, 200], [3, 20]),
+    Challenge("fuel_injection_perfection", "digits", [10, 50, 100, 309], [1, 10]),
+    Challenge("distract_the_trainers", "trainers", [10, 25, 50, 100], [2, 10]),
+    # solution() takes at most 100 trainers unless max_trainers says otherwise
+    Challenge("distract_the_trainers/exact", "trainers", [100, 300, 1000, 3000], [10, 30], structured_banana_list,
+              "distract_the_trainers", kwargs={"mode": "exact", "max_trainers": sys.maxsize}, calls=4),
+    Challenge("distract_the_trainers/anytime", "trainers", [1000, 3000, 10000, 100000], [10, 30],
+              structured_banana_list, "distract_the_trainers", anytime_matching, calls=4),
+    Challenge("running_with_bunnies", "graph_size", [3, 4, 5, 6, 7], [3, 4]),
+    Challenge("running_with_bunnies/held_karp", "graph_size", [8, 10, 12, 14, 16], [4, 6],
+              problem="running_with_bunnies", kwargs={"mode": "held_karp"}),
+    # the branch-and-bound search already takes seconds on some maps with 14 nodes
+    Challenge("running_with_bunnies/branch_and_bound", "graph_size", [8, 10, 12, 14], [4, 6],
+              problem="running_with_bunnies", kwargs={"mode": "branch_and_bound"}, calls=4),
+    Challenge("running_with_bunnies/johnson", "graph_size", [250, 500, 1000, 2000], [10, 20], sparse_corridor_map,
+              "running_with_bunnies", johnson_all_pairs, calls=2),
+    Challenge("dodge_the_lasers", "digits", [1, 10, 50, 101], [1, 10]),
+    Challenge("dodge_the_lasers/integer", "digits", [101, 1000, 10000], [1, 10],
+              problem="dodge_the_lasers", kwargs={"mode": "integer"}),
+    Challenge("dodge_the_lasers/beatty_sums", "digits", [10, 101, 200], [1, 10], beatty_batch,
+              "dodge_the_lasers", beatty_sums_batched, calls=4),
+    Challenge("dodge_the_lasers/one_by_one", "digits", [10, 101, 200], [1, 10], beatty_batch,
+              "dodge_the_lasers", beatty_sums_one_by_one, calls=4),
+]
+
+
+def percentile(sorted_values, percent):
+    """
+    :param sorted_values: a non-empty list of numbers in ascending order
+    :param percent: 0 to 100
+    :return: the nearest-rank percentile
+    """
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+
+    return sorted_values[rank - 1]
+
+
+def run_step(solution, inputs, repeat):
+    """
+    Time solution() on each input 'repeat' times, then run every input once more under tracemalloc.
+
+    :return: a dict with the time statistics in seconds and the peak memory in bytes
+    """
+    times = []
+    for _ in range(repeat):
+        for arguments in inputs:
+            start = time.perf_counter()
+            solution(*arguments)
+            times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        for arguments in inputs:
+            solution(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times.sort()
+    seconds = {"min": times[0], "mean": sum(times) / len(times), "max": times[-1]}
+    for percent in PERCENTILES:
+        seconds["p%d" % percent] = percentile(times, percent)
+
+    return {"calls": len(times), "seconds": seconds, "peak_memory_bytes": peak}
+
+
+def run_challenge(challenge, repeat=5, quick=False, seed=0):
+    """
+    Run one challenge over its ladder. A size whose solution() raises is reported with the error instead of times,
+    and the rest of the ladder still runs.
+
+    :return: a dict describing the challenge and a list of results, one per size
+    """
+    steps = []
+    solution = challenge.solver()
+
+    for size in challenge.quick_ladder if quick else challenge.ladder:
+        generator = random.Random("%s/%s/%d" % (challenge.name, size, seed))
+        inputs = [challenge.make_input(generator, size) for _ in range(challenge.calls)]
+        step = {"size": size}
+
+        try:
+            # some solutions print as they go
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                step.update(run_step(solution, inputs, repeat))
+        except Exception as error:
+            step["error"] = "%s: %s" % (type(error).__name__, error)
+
+        steps.append(step)
+
+    function = challenge.function if isinstance(challenge.function, str) else challenge.function.__name__
+
+    return {"path": registry.SOLUTION_PATHS[challenge.problem], "function": function, "kwargs": challenge.kwargs,
+            "parameter": challenge.parameter, "steps": steps}
+
+
+def run_benchmarks(names=None, repeat=5, quick=False, seed=0, progress=None):
+    """
+    :param names: the challenges to run; defaults to all of them
+    :param progress: called with each challenge's name before it runs
+    :return: the report, ready to be written as JSON
+    """
+    unknown = set(names or ()) - set(challenge.name for challenge in CHALLENGES)
+    if unknown:
+        raise ValueError("unknown challenges: %s" % ", ".join(sorted(unknown)))
+
+    results = {}
+    for challenge in CHALLENGES:
+        if names and challenge.name not in names:
+            continue
+        if progress is not None:
+            progress(challenge.name)
+        results[challenge.name] = run_challenge(challenge, repeat, quick, seed)
+
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "quick": quick,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare_reports(baseline, current, tolerance=0.25, statistic="p50"):
+    """
+    Find the sizes that got slower between two reports.
+
+    :param baseline: an earlier report
+    :param current: a later report
+    :param tolerance: the fraction by which a time may grow before it counts as a regression
+    :param statistic: the time statistic to compare
+    :return: a list of (name, size, baseline seconds, current seconds), for each regression
+    """
+    regressions = []
+
+    for name, result in current["results"].items():
+        before = dict((step["size"], step) for step in baseline["results"].get(name, {}).get("steps", ()))
+
+        for step in result["steps"]:
+            old = before.get(step["size"])
+            if old is None or "seconds" not in old or "seconds" not in step:
+                continue
+
+            old_time = old["seconds"][statistic]
+            new_time = step["seconds"][statistic]
+            if new_time > old_time * (1 + tolerance):
+                regressions.append((name, step["size"], old_time, new_time))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the challenge solutions.")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="the challenges to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of each input (default: 5)")
+    parser.add_argument("--quick", action="store_true", help="run the short ladders")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random inputs (default: 0)")
+    parser.add_argument("--output", default="-", help="file to write the JSON report to (default: stdout)")
+    parser.add_argument("--baseline", help="an earlier report to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="fraction a median time may grow before it is a regression (default: 0.25)")
+    arguments = parser.parse_args(argv)
+
+    def progress(name):
+        print("running %s" % name, file=sys.stderr)
+
+    report = run_benchmarks(arguments.only, arguments.repeat, arguments.quick, arguments.seed, progress)
+
+    text = json.dumps(report, indent=2)
+    if arguments.output == "-":
+        print(text)
+    else:
+        with open(arguments.output, "w") as output:
+            output.write(text + "\n")
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            regressions = compare_reports(json.load(baseline_file), report, arguments.tolerance)
+
+        for name, size, old_time, new_time in regressions:
+            print("regression: %s at %s: %.6fs -> %.6fs" % (name, size, old_time, new_time), file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+class BenchmarkTests(unittest.TestCase):
+    """
+    Check the benchmark machinery on the short ladders, with one repeat.
+    """
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(1, percentile(values, 0))
+        self.assertEqual(7, percentile([7], 90))
+
+    def test_inputs_are_reproducible(self):
+        for challenge in CHALLENGES:
+            size = challenge.quick_ladder[-1]
+            first = challenge.make_input(random.Random(1), size)
+            self.assertEqual(first, challenge.make_input(random.Random(1), size), challenge.name)
+
+    def test_quick_run(self):
+        report = run_benchmarks(["queue_to_do", "grandest_staircase"], repeat=1, quick=True)
+        steps = report["results"]["queue_to_do"]["steps"]
+
+        self.assertEqual([10, 100], [step["size"] for step in steps])
+        self.assertEqual(CALLS_PER_STEP, steps[0]["calls"])
+        seconds = steps[0]["seconds"]
+        self.assertTrue(seconds["min"] <= seconds["p50"] <= seconds["p90"] <= seconds["p99"] <= seconds["max"])
+        self.assertGreater(steps[-1]["peak_memory_bytes"], 0)
+        json.dumps(report)
+
+        self.assertRaises(ValueError, run_benchmarks, ["no_such_challenge"])
+
+    def test_modes_and_engines(self):
+        names = ["distract_the_trainers/exact", "distract_the_trainers/anytime", "running_with_bunnies/held_karp",
+                 "running_with_bunnies/branch_and_bound", "running_with_bunnies/johnson", "dodge_the_lasers/integer",
+                 "dodge_the_lasers/beatty_sums", "dodge_the_lasers/one_by_one"]
+        report = run_benchmarks(names, repeat=1, quick=True)
+
+        for name in names:
+            result = report["results"][name]
+            self.assertEqual(registry.SOLUTION_PATHS[name.split("/")[0]], result["path"])
+            for step in result["steps"]:
+                self.assertNotIn("error", step, name)
+
+        self.assertEqual({"mode": "held_karp"}, report["results"]["running_with_bunnies/held_karp"]["kwargs"])
+        self.assertEqual("johnson_all_pairs", report["results"]["running_with_bunnies/johnson"]["function"])
+        self.assertEqual(4, report["results"]["distract_the_trainers/exact"]["steps"][0]["calls"])
+        json.dumps(report)
+
+    def test_errors_are_reported(self):
+        challenge = Challenge("queue_to_do", "size", [1], [1], lambda generator, size: ("not", "numbers"))
+
+        self.assertIn("TypeError", run_challenge(challenge, repeat=1)["steps"][0]["error"])
+
+    def test_compare_reports(self):
+        def report(p50):
+            return {"results": {"queue_to_do": {"steps": [{"size": 10, "seconds": {"p50": p50}},
+                                                          {"size": 100, "error": "TypeError"}]}}}
+
+        self.assertEqual([], compare_reports(report(1.0), report(1.2)))
+        self.assertEqual([("queue_to_do", 10, 1.0, 1.5)], compare_reports(report(1.0), report(1.5)))
+        self.assertEqual([], compare_reports({"results": {}}, report(1.5)))
+
+    def test_main_writes_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertEqual(0, main(["--only", "queue_to_do", "--quick", "--repeat", "1", "--output", path]))
+                self.assertEqual(0, main(["--only", "queue_to_do", "--quick", "--repeat", "1", "--output", path,
+                                          "--baseline", path, "--tolerance", "1000"]))
+
+            with open(path) as report_file:
+                self.assertEqual(["queue_to_do"], list(json.load(report_file)["results"]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
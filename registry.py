@@ -0,0 +1,236 @@
+"""
+A registry of the nine solutions by problem name, loading each one the first time it is used.
+
+The solution packages start with digits (1_LanceAndJanice, ...), so they can't be imported with an import statement.
+Instead, each problem has a name in SOLUTION_PATHS:
+
+    solver = get_solver("queue_to_do")
+    solver(0, 3)
+
+loads Level_3/4_QueueToDo/solution.py on the first call and returns its solution(). A loaded solution is also an
+ordinary module, registry.queue_to_do (or <package>.registry.queue_to_do when the repository is imported as a
+package), so functions from it can be pickled and sent to worker processes like any others.
+
+Only the solving code is loaded. The unittest import, the TestCase classes, all_tests(), the __main__ block and the
+imports only they use are dropped from the source with strip_tests() before it is compiled, and the compiled code is
+cached in __pycache__ next to the source, the way Python caches its own bytecode, so a worker that needs one solver
+only pays for that one.
+"""
+import importlib
+import importlib.util
+import marshal
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SOLUTION_PATHS = {
+    "lance_and_janice": "Level_1/1_LanceAndJanice/solution.py",
+    "dont_get_volunteered": "Level_2/2_DontGetVolunteered/solution.py",
+    "ion_flux_relabeling": "Level_2/3_IonFluxRelabeling/solution.py",
+    "queue_to_do": "Level_3/4_QueueToDo/solution.py",
+    "grandest_staircase": "Level_3/5_TheGrandestStaircase/solution.py",
+    "fuel_injection_perfection": "Level_3/6_FuelInjectionPerfection/solution.py",
+    "distract_the_trainers": "Level_4/7_DistractTheTrainers/solution.py",
+    "running_with_bunnies": "Level_4/8_RunningWithBunnies/solution.py",
+    "dodge_the_lasers": "Level_5/9_DodgeTheLasers/solution.py",
+}
+
+# The "optimization" tag of the cached code, which keeps it apart from the bytecode Python caches for the full source
+CACHE_TAG = "registry"
+
+# Stored with the source's modification time and size, and raised whenever strip_tests() changes what it removes, so
+# that code cached by an older registry is compiled again
+CACHE_VERSION = 2
+
+TEST_MODULES = frozenset(["unittest"])
+TEST_BASES = frozenset(["TestCase", "unittest.TestCase"])
+TEST_FUNCTIONS = frozenset(["all_tests"])
+
+
+def problems():
+    """
+    :return: the problem names, sorted
+    """
+    return sorted(SOLUTION_PATHS)
+
+
+def load_module(problem):
+    """
+    :param problem: one of the keys of SOLUTION_PATHS
+    :return: the problem's solution module, loaded on the first call and shared by later ones
+    """
+    if problem not in SOLUTION_PATHS:
+        raise ValueError("unknown problem %r, expected one of %s" % (problem, ", ".join(problems())))
+
+    return importlib.import_module("%s.%s" % (__name__, problem))
+
+
+def get_solver(problem, name="solution"):
+    """
+    :param problem: one of the keys of SOLUTION_PATHS
+    :param name: the function to return; solution() unless a problem's batch API or another entry point is wanted
+    :return: the function from the problem's solution module
+    """
+    return getattr(load_module(problem), name)
+
+
+def strip_tests(tree):
+    """
+    Remove the test code from a solution module's syntax tree: imports of unittest, classes derived from TestCase
+    (or from classes removed before them), the functions in TEST_FUNCTIONS and 'if __name__ == "__main__":' blocks.
+    Then remove the imports that only the removed code used, such as the random module the tests draw inputs from.
+
+    :param tree: an ast.Module, which is changed in place
+    :return: the same tree
+    """
+    import ast
+
+    removed_classes = set()
+    removed = []
+    body = []
+
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            node.names = [alias for alias in node.names if alias.name.split(".")[0] not in TEST_MODULES]
+            if not node.names:
+                continue
+        elif isinstance(node, ast.ImportFrom):
+            if node.module and node.module.split(".")[0] in TEST_MODULES:
+                continue
+        elif isinstance(node, ast.ClassDef):
+            bases = set(ast.unparse(base) for base in node.bases)
+            if bases & TEST_BASES or bases & removed_classes:
+                removed_classes.add(node.name)
+                removed.append(node)
+                continue
+        elif isinstance(node, ast.FunctionDef):
+            if node.name in TEST_FUNCTIONS:
+                removed.append(node)
+                continue
+        elif isinstance(node, ast.If):
+            if ast.unparse(node.test).replace("'", '"') == '__name__ == "__main__"':
+                removed.append(node)
+                continue
+
+        body.append(node)
+
+    # an import that nothing uses at all is left alone; it may be there for its side effects
+    test_names = _names_used(removed) - _names_used(node for node in body
+                                                    if not isinstance(node, (ast.Import, ast.ImportFrom)))
+    tree.body = []
+
+    for node in body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            node.names = [alias for alias in node.names if _bound_name(node, alias) not in test_names]
+            if not node.names:
+                continue
+        tree.body.append(node)
+
+    return tree
+
+
+def _names_used(nodes):
+    import ast
+
+    return set(name.id for node in nodes for name in ast.walk(node) if isinstance(name, ast.Name))
+
+
+def _bound_name(node, alias):
+    import ast
+
+    if alias.asname:
+        return alias.asname
+
+    return alias.name.split(".")[0] if isinstance(node, ast.Import) else alias.name
+
+
+class SolutionLoader(object):
+    """
+    Loads a solution.py file without its tests, through a cache of the compiled code. It implements the loader
+    protocol without deriving from importlib.abc.Loader, which would import importlib.resources as well.
+
+    The cache file holds importlib's magic number, then the source's modification time and size, CACHE_VERSION and the
+    code object, marshalled. It is rebuilt whenever the source, the Python version or CACHE_VERSION changes, and simply
+    not written if the directory is read-only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        exec(self.get_code(), module.__dict__)
+
+    def get_code(self):
+        status = os.stat(self.path)
+        stamp = (status.st_mtime_ns, status.st_size, CACHE_VERSION)
+        cache_path = importlib.util.cache_from_source(self.path, optimization=CACHE_TAG)
+
+        try:
+            with open(cache_path, "rb") as cache_file:
+                data = cache_file.read()
+            if data.startswith(importlib.util.MAGIC_NUMBER):
+                cached_stamp, code = marshal.loads(data[len(importlib.util.MAGIC_NUMBER):])
+                if tuple(cached_stamp) == stamp:
+                    return code
+        except (OSError, ValueError, EOFError, TypeError):
+            pass
+
+        # ast is only needed when the cache is out of date, so it isn't imported up front
+        import ast
+
+        with open(self.path, "rb") as source_file:
+            tree = ast.parse(source_file.read(), self.path)
+        code = compile(strip_tests(tree), self.path, "exec", dont_inherit=True)
+
+        if not sys.dont_write_bytecode:
+            self._write_cache(cache_path, stamp, code)
+
+        return code
+
+    @staticmethod
+    def _write_cache(cache_path, stamp, code):
+        partial_path = "%s.%d" % (cache_path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(partial_path, "wb") as cache_file:
+                cache_file.write(importlib.util.MAGIC_NUMBER + marshal.dumps((stamp, code)))
+            os.replace(partial_path, cache_path)  # so that other processes never read half a file
+        except OSError:
+            pass
+
+
+class SolutionFinder(object):
+    """
+    Finds <this module>.<problem> for the problems in SOLUTION_PATHS, which makes them importable by name, in this
+    process and in any worker process that unpickles a function from one of them.
+    """
+
+    def find_spec(self, fullname, path=None, target=None):
+        package, _, problem = fullname.rpartition(".")
+        if package != __name__ or problem not in SOLUTION_PATHS:
+            return None
+
+        location = os.path.join(ROOT, SOLUTION_PATHS[problem])
+
+        return importlib.util.spec_from_file_location(fullname, location, loader=SolutionLoader(location))
+
+
+def __getattr__(name):
+    # registry.queue_to_do loads the module the first time it is looked up
+    if name in SOLUTION_PATHS:
+        return load_module(name)
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+# load_module() needs this module's name to resolve as a package for the import system
+__path__ = []
+
+# once per module name, even if this module is reloaded
+if not any(type(finder).__module__ == __name__ and type(finder).__name__ == "SolutionFinder"
+           for finder in sys.meta_path):
+    sys.meta_path.append(SolutionFinder())
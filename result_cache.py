@@ -0,0 +1,418 @@
+"""
+A cache of solution() results, kept on disk and shared by every process that opens the same file.
+
+Every solution is a pure function of its arguments, so a result can be stored once and reused by any later call with
+the same arguments, in this process or another one:
+
+    cache = ResultCache("results.sqlite")
+    solver = cache.solver("grandest_staircase")
+    solver(200)  # solved, then stored
+    solver(200)  # read back
+
+Lookups go through two layers. A per-process LRU holds the most recently used results, and behind it a SQLite
+database holds everything, for all the processes using the file. Both layers are limited in bytes and evict the
+least recently used results first. Results are stored as JSON, so each hit gets a new copy that the caller is free to
+change.
+
+A result's key is a digest of the problem, the solution's source and a canonical JSON encoding of the arguments. So the
+same knight move, staircase or times matrix always finds the same entry, and editing a solution leaves its old results
+behind, to be evicted. Arguments or results that JSON can't represent exactly are never cached.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import registry
+
+# The default size limits of the two layers, in bytes of keys and JSON results
+DISK_BYTES = 1 << 30
+MEMORY_BYTES = 64 << 20
+
+# Eviction from disk goes down to this fraction of the limit, so it doesn't run on every store once the file is full
+EVICTION_TARGET = 0.9
+
+# The number of rows deleted per statement while evicting
+EVICTION_BATCH = 256
+
+# How long a process waits for another one's write to finish, in seconds
+BUSY_TIMEOUT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results
+    BEGIN UPDATE totals SET bytes = bytes + new.size; END;
+CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results
+    BEGIN UPDATE totals SET bytes = bytes + new.size - old.size; END;
+CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results
+    BEGIN UPDATE totals SET bytes = bytes - old.size; END;
+"""
+
+CacheInfo = collections.namedtuple("CacheInfo", [
+    "memory_hits", "disk_hits", "misses", "uncached", "memory_entries", "memory_bytes", "disk_entries", "disk_bytes"])
+
+# What get() returns for a key the cache doesn't hold, since None is a possible result
+MISSING = object()
+
+_source_digests = {}
+
+
+def source_digest(problem):
+    """
+    :param problem: one of the keys of registry.SOLUTION_PATHS
+    :return: a digest of the problem's solution.py, read once per process
+    """
+    digest = _source_digests.get(problem)
+
+    if digest is None:
+        if problem not in registry.SOLUTION_PATHS:
+            raise ValueError("unknown problem %r, expected one of %s" % (problem, ", ".join(registry.problems())))
+        with open(os.path.join(registry.ROOT, registry.SOLUTION_PATHS[problem]), "rb") as source_file:
+            digest = hashlib.blake2b(source_file.read(), digest_size=16).digest()
+        _source_digests[problem] = digest
+
+    return digest
+
+
+def encode(value):
+    """
+    :return: the canonical JSON text of a value, or None if JSON can't represent it exactly (tuples, sets, non-string
+             keys, NaN, ...)
+    """
+    try:
+        text = json.dumps(value, sort_keys=True, separators=(",", ":"), allow_nan=False)
+    except (TypeError, ValueError):
+        return None
+
+    # a tuple is written as a list, and a dict key as a string, which would come back as a different value
+    decoded = json.loads(text)
+    if decoded != value or not _same_types(decoded, value):
+        return None
+
+    return text
+
+
+def _same_types(decoded, value):
+    if type(decoded) is not type(value):
+        return False
+    if isinstance(value, list):
+        return all(_same_types(x, y) for x, y in zip(decoded, value))
+    if isinstance(value, dict):
+        return all(_same_types(decoded[key], value[key]) for key in value)
+
+    return True
+
+
+def cache_key(problem, args, kwargs=None):
+    """
+    :return: the key of a call to the problem's solution(), or None if its arguments can't be encoded
+    """
+    arguments = encode([list(args), kwargs or {}]) if isinstance(args, (list, tuple)) else None
+    if arguments is None:
+        # a tuple of arguments is fine, but a tuple inside one is not
+        return None
+
+    digest = hashlib.blake2b(source_digest(problem), digest_size=16)
+    digest.update(problem.encode())
+    digest.update(b"\0")
+    digest.update(arguments.encode())
+
+    return digest.digest()
+
+
+class ResultCache(object):
+    """
+    A two-layer cache of solution() results. One object serves one thread; other threads and processes open their
+    own on the same file. A pickled ResultCache opens the same file, with empty counters and memory, where it is
+    unpickled, so it can be passed to worker processes.
+    """
+
+    def __init__(self, path, disk_bytes=DISK_BYTES, memory_bytes=MEMORY_BYTES):
+        """
+        :param path: the SQLite database file, created if it doesn't exist
+        :param disk_bytes: the size limit of the database's results
+        :param memory_bytes: the size limit of this process's LRU
+        """
+        self.path = path
+        self.disk_bytes = disk_bytes
+        self.memory_bytes = memory_bytes
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+        self._connection = None
+        self._pid = None
+        self.memory_hits = self.disk_hits = self.misses = self.uncached = 0
+
+    def __getstate__(self):
+        return {"path": self.path, "disk_bytes": self.disk_bytes, "memory_bytes": self.memory_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _database(self):
+        # a connection can't be shared with a forked child, so each process opens its own
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+
+        return self._connection
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = self._pid = None
+
+    def get(self, key):
+        """
+        :param key: a key from cache_key()
+        :return: the stored result, or MISSING
+        """
+        text = self._memory.get(key)
+        if text is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return json.loads(text)
+
+        database = self._database()
+        row = database.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISSING
+
+        database.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        self._remember(key, row[0])
+        self.disk_hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """
+        Store a result in both layers, unless JSON can't represent it exactly.
+
+        :return: True if the result was stored
+        """
+        text = encode(value)
+        if text is None:
+            return False
+
+        database = self._database()
+        size = len(key) + len(text)
+        database.execute("BEGIN IMMEDIATE")
+        try:
+            database.execute("INSERT INTO results VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                             "value = excluded.value, size = excluded.size, used = excluded.used",
+                             (key, text, size, time.time()))
+            self._evict(database)
+            database.execute("COMMIT")
+        except BaseException:
+            database.execute("ROLLBACK")
+            raise
+
+        self._remember(key, text)
+
+        return True
+
+    def _evict(self, database):
+        total = database.execute("SELECT bytes FROM totals").fetchone()[0]
+        if total <= self.disk_bytes:
+            return
+
+        target = self.disk_bytes * EVICTION_TARGET
+        while total > target:
+            database.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)",
+                             (EVICTION_BATCH,))
+            total = database.execute("SELECT bytes FROM totals").fetchone()[0]
+
+    def _remember(self, key, text):
+        size = len(key) + len(text)
+        if size > self.memory_bytes:
+            return
+
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(key) + len(previous)
+
+        self._memory[key] = text
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            old_key, old_text = self._memory.popitem(last=False)
+            self._memory_size -= len(old_key) + len(old_text)
+
+    def call(self, problem, *args, **kwargs):
+        """
+        :return: the problem's solution(*args, **kwargs), from the cache if it holds it
+        """
+        key = cache_key(problem, args, kwargs)
+        if key is None:
+            self.uncached += 1
+            return registry.get_solver(problem)(*args, **kwargs)
+
+        result = self.get(key)
+        if result is MISSING:
+            result = registry.get_solver(problem)(*args, **kwargs)
+            self.put(key, result)
+
+        return result
+
+    def solver(self, problem):
+        """
+        :param problem: one of the keys of registry.SOLUTION_PATHS
+        :return: a callable taking the same arguments as the problem's solution(), answered through the cache
+        """
+        source_digest(problem)
+
+        return CachedSolver(self, problem)
+
+    def info(self):
+        """
+        :return: a CacheInfo with this process's counters and memory use, and the database's size
+        """
+        entries, total = self._database().execute(
+            "SELECT (SELECT COUNT(*) FROM results), (SELECT bytes FROM totals)").fetchone()
+
+        return CacheInfo(self.memory_hits, self.disk_hits, self.misses, self.uncached, len(self._memory),
+                         self._memory_size, entries, total)
+
+    def clear(self):
+        """
+        Remove every result, from this process's memory and from the database.
+        """
+        self._memory.clear()
+        self._memory_size = 0
+        self._database().execute("DELETE FROM results")
+
+
+class CachedSolver(object):
+    """
+    A problem's solution() answered through a ResultCache. It pickles along with its cache.
+    """
+
+    def __init__(self, cache, problem):
+        self.cache = cache
+        self.problem = problem
+
+    def __call__(self, *args, **kwargs):
+        return self.cache.call(self.problem, *args, **kwargs)
+
+
+def _cached_staircase(cache, n):
+    # runs in a worker process in the tests below
+    solver = cache.solver("grandest_staircase")
+    return solver(n), cache.info()
+
+
+class ResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "results.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_hits_and_misses(self):
+        cache = ResultCache(self.path)
+        solver = cache.solver("grandest_staircase")
+
+        self.assertEqual(487067745, solver(200))
+        self.assertEqual(487067745, solver(200))
+        self.assertEqual(1, solver(3))
+        info = cache.info()
+        self.assertEqual((1, 0, 2, 0), (info.memory_hits, info.disk_hits, info.misses, info.uncached))
+        self.assertEqual((2, 2), (info.memory_entries, info.disk_entries))
+
+        # a second cache on the same file finds the results on disk, then in memory
+        other = ResultCache(self.path)
+        self.assertEqual(487067745, other.call("grandest_staircase", 200))
+        self.assertEqual(487067745, other.call("grandest_staircase", 200))
+        self.assertEqual((1, 1, 0), other.info()[:3])
+        cache.close()
+        other.close()
+
+    def test_results_are_copies(self):
+        cache = ResultCache(self.path)
+        times = [[0, 2, 2, 2, -1], [9, 0, 2, 2, -1], [9, 3, 0, 2, -1], [9, 3, 2, 0, -1], [9, 3, 2, 2, 0]]
+
+        first = cache.call("running_with_bunnies", times, 1)
+        first.append(99)
+
+        self.assertEqual([1, 2], cache.call("running_with_bunnies", times, 1))
+        self.assertEqual(1, cache.info().memory_hits)
+        cache.close()
+
+    def test_keys(self):
+        key = cache_key("queue_to_do", (0, 3))
+
+        self.assertEqual(key, cache_key("queue_to_do", [0, 3], {}))
+        self.assertEqual(16, len(key))
+        self.assertNotEqual(key, cache_key("queue_to_do", (3, 0)))
+        self.assertNotEqual(key, cache_key("queue_to_do", (0.0, 3)))
+        self.assertNotEqual(key, cache_key("queue_to_do", (False, 3)))
+        self.assertNotEqual(key, cache_key("grandest_staircase", (0, 3)))
+        self.assertEqual(cache_key("dodge_the_lasers", ["7"], {"mode": "integer", "x": 1}),
+                         cache_key("dodge_the_lasers", ["7"], {"x": 1, "mode": "integer"}))
+        self.assertIsNone(cache_key("queue_to_do", ((0, 3),)))
+        self.assertIsNone(cache_key("queue_to_do", (float("nan"), 3)))
+        self.assertRaises(ValueError, cache_key, "no_such_problem", ())
+
+    def test_uncached(self):
+        cache = ResultCache(self.path)
+
+        # the labels as a tuple can't be encoded, so the call goes straight to solution()
+        self.assertEqual([-1, 7], cache.call("ion_flux_relabeling", 3, (7, 3)))
+        self.assertFalse(cache.put(b"k", (1, 2)))
+        self.assertEqual((0, 0, 0, 1), cache.info()[:4])
+        cache.close()
+
+    def test_size_limits(self):
+        cache = ResultCache(self.path, disk_bytes=1000, memory_bytes=200)
+
+        for n in range(3, 103):
+            cache.put(cache_key("grandest_staircase", (n,)), n)
+
+        info = cache.info()
+        self.assertLessEqual(info.memory_bytes, 200)
+        self.assertLessEqual(info.disk_bytes, 1000)
+        self.assertGreater(info.disk_entries, info.memory_entries)
+        # the most recent results stay, the oldest go
+        self.assertEqual(102, cache.get(cache_key("grandest_staircase", (102,))))
+        self.assertIs(MISSING, cache.get(cache_key("grandest_staircase", (3,))))
+
+        cache.clear()
+        self.assertEqual((0, 0, 0, 0), cache.info()[4:])
+        cache.close()
+
+    def test_shared_by_worker_processes(self):
+        cache = ResultCache(self.path)
+        self.assertEqual(self.path, pickle.loads(pickle.dumps(cache.solver("queue_to_do"))).cache.path)
+
+        with concurrent.futures.ProcessPoolExecutor(1) as executor:
+            self.assertEqual(2, executor.submit(_cached_staircase, cache, 5).result()[0])
+            self.assertEqual((0, 0, 1), executor.submit(_cached_staircase, cache, 6).result()[1][:3])
+
+        self.assertEqual(2, cache.solver("grandest_staircase")(5))
+        self.assertEqual((0, 1, 0), cache.info()[:3])
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
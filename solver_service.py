@@ -0,0 +1,402 @@
+"""
+A local service answering solution() requests over a socket, for callers that would otherwise start a process per
+request.
+
+The protocol is the job format of batch_runner.py, one JSON object per line, over a Unix socket or TCP:
+
+    python solver_service.py --unix /tmp/solvers.sock
+    python solver_service.py --port 8765 --workers 4 --batch-window 0.005
+
+    -> {"id": 1, "problem": "queue_to_do", "args": [17, 4]}
+    <- {"id": 1, "result": 14}
+
+A connection may send any number of requests without waiting for the answers, which come back in request order.
+
+Each problem has a queue of requests. Requests for the same problem arriving within the batch window of each other are
+sent to the process pool together as one chunk, which runs through batch_runner.run_chunk(), so one trip to a worker
+covers many requests and the problems with a batch API get to use it. The queues and the number of chunks in flight are
+bounded: once the workers fall behind, the service stops reading from the connections, and the clients' writes block
+until there is room again. If a worker dies, the pool is replaced, and the batches it broke are run again once.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import concurrent.futures.process
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import unittest
+
+import batch_runner
+import registry
+import result_cache
+
+# The longest time a request waits for others to batch it with, in seconds
+BATCH_WINDOW = 0.002
+
+# The most requests sent to a worker at a time
+MAX_BATCH = batch_runner.CHUNK_SIZE
+
+# The most requests waiting for a batch, per problem
+QUEUE_SIZE = 1024
+
+# The most requests read ahead of their answers, per connection
+CONNECTION_PENDING = 256
+
+# The longest request line accepted, in bytes
+MAX_REQUEST_BYTES = 16 << 20
+
+
+class SolverService(object):
+    """
+    Gathers solution() requests into batches per problem and runs them on a process pool.
+    """
+
+    def __init__(self, max_workers=None, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH, queue_size=QUEUE_SIZE,
+                 timeout=None, cache=None):
+        """
+        :param max_workers: the number of worker processes; defaults to the number of CPUs
+        :param batch_window: the longest time a request waits for others to batch it with, in seconds
+        :param max_batch: the most requests in a batch
+        :param queue_size: the most requests waiting for a batch, per problem
+        :param timeout: seconds allowed per request, or None for no limit
+        :param cache: a result_cache.ResultCache shared by the workers, or None
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.cache = cache
+        self.requests = self.batches = 0
+        self._executor = None
+        self._queues = {}
+        self._collectors = []
+        self._running = set()
+        self._slots = None
+        self._replacing = None
+
+    async def _start_executor(self):
+        # Workers forked straight from this process would keep a copy of every socket open at the time, and a client
+        # would never see its connection closed. Workers from a fork server are forked from a clean process instead,
+        # which matters when a broken pool is replaced while connections are open. Where there is no fork server, the
+        # first pool is at least started before any connection is accepted.
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+        else:
+            context = None
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            self.max_workers, mp_context=context, initializer=batch_runner.initialize_worker, initargs=(self.cache,))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(executor, os.getpid) for _ in range(self.max_workers)])
+
+        return executor
+
+    async def _replace_executor(self, broken):
+        # every batch in flight finds the pool broken at once, and only the first of them replaces it
+        async with self._replacing:
+            if self._executor is broken:
+                broken.shutdown(wait=False)
+                self._executor = await self._start_executor()
+
+    async def start(self):
+        self._replacing = asyncio.Lock()
+        self._executor = await self._start_executor()
+
+        # two batches per worker keep the workers busy while the next ones are collected
+        self._slots = asyncio.Semaphore(2 * self.max_workers)
+
+        for problem in registry.problems():
+            self._queues[problem] = asyncio.Queue(self.queue_size)
+            self._collectors.append(asyncio.create_task(self._collect(problem, self._queues[problem])))
+
+    async def close(self):
+        for collector in self._collectors:
+            collector.cancel()
+        await asyncio.gather(*self._collectors, return_exceptions=True)
+        await asyncio.gather(*self._running, return_exceptions=True)
+        self._collectors = []
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def submit(self, problem, args, kwargs=None):
+        """
+        Queue a request, waiting for room in the problem's queue if it is full.
+
+        :return: a future of the request's {"result": ...} or {"error": ...} dict
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queues[problem].put(((args, kwargs or {}), future))
+        self.requests += 1
+
+        return future
+
+    async def solve(self, problem, *args, **kwargs):
+        """
+        :return: the {"result": ...} or {"error": ...} dict for the problem's solution(*args, **kwargs)
+        """
+        return await (await self.submit(problem, list(args), kwargs))
+
+    async def _collect(self, problem, queue):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.batch_window
+
+            while len(batch) < self.max_batch:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(problem, batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, problem, batch):
+        loop = asyncio.get_running_loop()
+        calls = [call for call, _ in batch]
+        self.batches += 1
+
+        try:
+            # a batch is run again once on a new pool if a worker died, since the batch that killed the worker may
+            # have been another one; if the pool breaks again, the batch is reported as failed
+            for attempt in range(2):
+                executor = self._executor
+                try:
+                    outputs = await loop.run_in_executor(executor, batch_runner.run_worker_chunk, problem, calls,
+                                                         self.timeout)
+                    break
+                except concurrent.futures.process.BrokenProcessPool:
+                    await self._replace_executor(executor)
+                    if attempt:
+                        raise
+        except Exception as error:
+            outputs = [{"error": "%s: %s" % (type(error).__name__, error)}] * len(batch)
+        finally:
+            self._slots.release()
+
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Answer the requests on one connection, in order, until the client closes it.
+        """
+        responses = asyncio.Queue(CONNECTION_PENDING)
+        responder = asyncio.create_task(self._respond(responses, writer))
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):  # a line over the limit, or a reset
+                    await responses.put((_resolved({"error": "request too long or connection lost"}), None))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                job = batch_runner.parse_job(line)
+                if isinstance(job, dict):
+                    await responses.put((_resolved(job), None))
+                else:
+                    problem, args, kwargs, job_id = job
+                    await responses.put((await self.submit(problem, args, kwargs), job_id))
+        finally:
+            await responses.put(None)
+            await responder
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _respond(responses, writer):
+        connected = True
+
+        while True:
+            response = await responses.get()
+            if response is None:
+                return
+
+            future, job_id = response
+            output = await future
+            if job_id is not None:
+                output = dict(id=job_id, **output)
+
+            # once the client has gone, the answers still due are awaited, so that the reader is never blocked
+            if connected:
+                try:
+                    writer.write(json.dumps(output, separators=(",", ":")).encode() + b"\n")
+                    await writer.drain()
+                except ConnectionError:
+                    connected = False
+
+
+def _resolved(output):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(output)
+    return future
+
+
+async def serve(service, host="127.0.0.1", port=None, unix_path=None, ready=None):
+    """
+    Run a service on a Unix socket or a TCP port until the task is cancelled.
+
+    :param ready: called with the listening server once it accepts connections
+    """
+    async with service:
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(service.handle_connection, unix_path, limit=MAX_REQUEST_BYTES)
+        else:
+            server = await asyncio.start_server(service.handle_connection, host, port, limit=MAX_REQUEST_BYTES)
+
+        async with server:
+            if ready is not None:
+                ready(server)
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the challenge solutions over a socket.")
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument("--unix", metavar="PATH", help="the Unix socket to listen on")
+    address.add_argument("--port", type=int, help="the TCP port to listen on")
+    parser.add_argument("--host", default="127.0.0.1", help="the TCP address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--workers", type=int, help="the number of worker processes (default: the number of CPUs)")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW,
+                        help="seconds a request waits for others to batch it with (default: %s)" % BATCH_WINDOW)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="the most requests in a batch")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="the most requests queued per problem")
+    parser.add_argument("--timeout", type=float, help="seconds allowed per request (default: no limit)")
+    parser.add_argument("--cache", help="a result_cache.py database to reuse results from (default: none)")
+    arguments = parser.parse_args(argv)
+
+    cache = result_cache.ResultCache(arguments.cache) if arguments.cache else None
+    service = SolverService(arguments.workers, arguments.batch_window, arguments.max_batch, arguments.queue_size,
+                            arguments.timeout, cache)
+
+    def ready(server):
+        print("listening on %s" % (arguments.unix or "%s:%d" % (arguments.host, arguments.port)), file=sys.stderr)
+
+    async def run():
+        task = asyncio.create_task(serve(service, arguments.host, arguments.port, arguments.unix, ready))
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if arguments.unix and os.path.exists(arguments.unix):
+            os.unlink(arguments.unix)
+
+    print("stopped after %d requests in %d batches" % (service.requests, service.batches), file=sys.stderr)
+
+    return 0
+
+
+class SolverServiceTests(unittest.TestCase):
+
+    def test_solve_and_batch(self):
+        async def run():
+            async with SolverService(max_workers=1, batch_window=0.05) as service:
+                results = await asyncio.gather(*[service.solve("grandest_staircase", n) for n in range(3, 43)])
+                single = await service.solve("queue_to_do", 0, 3)
+                failed = await service.solve("queue_to_do", "a", "b")
+                return results, single, failed, service.batches
+
+        results, single, failed, batches = asyncio.run(run())
+
+        solver = registry.get_solver("grandest_staircase")
+        self.assertEqual([{"result": solver(n)} for n in range(3, 43)], results)
+        self.assertEqual({"result": 2}, single)
+        self.assertTrue(failed["error"].startswith("TypeError"))
+        # the forty staircases arrived together, so they went in one batch
+        self.assertEqual(3, batches)
+
+    def test_worker_killed(self):
+        async def run():
+            async with SolverService(max_workers=1) as service:
+                loop = asyncio.get_running_loop()
+                broken = service._executor
+                os.kill(await loop.run_in_executor(broken, os.getpid), signal.SIGKILL)
+
+                answers = [await service.solve("queue_to_do", 0, 3) for _ in range(3)]
+                return answers, service._executor is not broken
+
+        answers, replaced = asyncio.run(run())
+
+        self.assertEqual([{"result": 2}] * 3, answers)
+        self.assertTrue(replaced)
+
+    def test_connections(self):
+        async def client(path, lines):
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write("".join(line + "\n" for line in lines).encode())
+            await writer.drain()
+            writer.write_eof()
+            answers = [json.loads(line) for line in (await reader.read()).splitlines()]
+            writer.close()
+            return answers
+
+        async def run(path):
+            ready = asyncio.Event()
+            service = SolverService(max_workers=2, queue_size=4)
+            server = asyncio.create_task(serve(service, unix_path=path, ready=lambda server: ready.set()))
+            await ready.wait()
+
+            lines = ['{"id": %d, "problem": "fuel_injection_perfection", "args": ["%d"]}' % (n, n) for n in range(200)]
+            answers = await asyncio.gather(
+                client(path, lines),
+                client(path, ['{"problem": "queue_to_do", "args": [0, 3]}', 'not json', '', '{"problem": []}',
+                              '{"id": "b", "problem": "dodge_the_lasers", "args": ["77"]}']))
+
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+            return answers, service.batches
+
+        with tempfile.TemporaryDirectory() as directory:
+            (fuel, mixed), batches = asyncio.run(run(os.path.join(directory, "solvers.sock")))
+
+        solver = registry.get_solver("fuel_injection_perfection")
+        self.assertEqual([{"id": n, "result": solver(str(n))} for n in range(200)], fuel)
+        self.assertEqual({"result": 2}, mixed[0])
+        self.assertTrue(mixed[1]["error"].startswith("invalid JSON"))
+        self.assertEqual({"error": "unknown problem []"}, mixed[2])
+        self.assertEqual({"id": "b", "result": "4208"}, mixed[3])
+        self.assertLess(batches, 200)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
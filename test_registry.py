@@ -0,0 +1,143 @@
+"""
+Tests for registry.py. They live in a module of their own, since the point of the registry is that importing it
+doesn't import unittest.
+"""
+import importlib.util
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import registry
+
+
+class RegistryTests(unittest.TestCase):
+
+    def test_every_problem_solves(self):
+        self.assertEqual(9, len(registry.problems()))
+        self.assertEqual("did you see", registry.get_solver("lance_and_janice")("wrw blf hvv"))
+        self.assertEqual(2, registry.get_solver("queue_to_do")(0, 3))
+        self.assertEqual(487067745, registry.get_solver("grandest_staircase")(200))
+        self.assertEqual(2, registry.get_solver("fuel_injection_perfection")("4"))
+        self.assertEqual(0, registry.get_solver("distract_the_trainers")([1, 7, 3, 21, 13, 19]))
+        self.assertEqual([1, 2], registry.get_solver("running_with_bunnies")(
+            [[0, 2, 2, 2, -1], [9, 0, 2, 2, -1], [9, 3, 0, 2, -1], [9, 3, 2, 0, -1], [9, 3, 2, 2, 0]], 1))
+        self.assertEqual("4208", registry.get_solver("dodge_the_lasers")("77"))
+        self.assertTrue(callable(registry.get_solver("ion_flux_relabeling")))
+        self.assertTrue(callable(registry.get_solver("dont_get_volunteered")))
+
+    def test_tests_left_out(self):
+        for problem in registry.problems():
+            module = registry.load_module(problem)
+
+            self.assertFalse(hasattr(module, "unittest"), problem)
+            self.assertFalse(hasattr(module, "all_tests"), problem)
+            self.assertEqual([], [name for name in vars(module) if name.endswith("Tests")], problem)
+
+        # helpers the tests use, but which are not tests themselves, stay; the modules only the tests use don't
+        self.assertTrue(callable(registry.load_module("running_with_bunnies").brute_force_rescue))
+        self.assertFalse(hasattr(registry.load_module("dodge_the_lasers"), "random"))
+        self.assertFalse(hasattr(registry.load_module("dodge_the_lasers"), "getcontext"))
+        self.assertTrue(hasattr(registry.load_module("running_with_bunnies"), "threading"))
+
+    def test_loaded_once(self):
+        module = registry.load_module("queue_to_do")
+
+        self.assertIs(module, registry.load_module("queue_to_do"))
+        self.assertIs(module, registry.queue_to_do)
+        self.assertEqual("registry.queue_to_do", module.__name__)
+        self.assertTrue(module.__file__.endswith(os.path.join("4_QueueToDo", "solution.py")))
+        self.assertRaises(ValueError, registry.load_module, "no_such_problem")
+        self.assertRaises(AttributeError, getattr, registry, "no_such_problem")
+
+    def test_picklable(self):
+        solver = registry.get_solver("queue_to_do")
+
+        self.assertIs(solver, pickle.loads(pickle.dumps(solver)))
+
+    def test_fresh_process(self):
+        # a new interpreter neither imports unittest nor loads the solutions it doesn't use, and can unpickle a solver
+        script = ("import pickle, sys, registry; solver = pickle.loads(%r); "
+                  "print(solver(0, 3), 'unittest' in sys.modules, sorted(m for m in sys.modules if m.startswith("
+                  "'registry.')))" % pickle.dumps(registry.get_solver("queue_to_do")))
+        output = subprocess.run([sys.executable, "-c", script], cwd=registry.ROOT, capture_output=True, text=True,
+                                check=True).stdout
+
+        self.assertEqual("2 False ['registry.queue_to_do']", output.strip())
+
+    def test_strip_tests(self):
+        import ast
+        source = '\n'.join([
+            "import os, unittest",
+            "import itertools, random",
+            "from unittest import mock",
+            "from decimal import Decimal, getcontext",
+            "def solution(n):",
+            "    return Decimal(n) + next(itertools.count())",
+            "def all_tests():",
+            "    pass",
+            "class Helper(object):",
+            "    pass",
+            "class SolutionTests(unittest.TestCase):",
+            "    def test_random(self):",
+            "        self.assertEqual(getcontext().prec, solution(random.Random(1).randint(1, 1)) + 27)",
+            "class MoreTests(SolutionTests):",
+            "    pass",
+            "class OtherTests(TestCase):",
+            "    pass",
+            "if __name__ == '__main__':",
+            "    unittest.main()",
+        ])
+
+        stripped = ast.unparse(registry.strip_tests(ast.parse(source)))
+
+        # os is left although nothing uses it; random and getcontext only served the tests
+        self.assertEqual("import os\nimport itertools\nfrom decimal import Decimal\n\ndef solution(n):\n"
+                         "    return Decimal(n) + next(itertools.count())\n\nclass Helper(object):\n    pass", stripped)
+
+    def test_code_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "solution.py")
+            with open(path, "w") as source_file:
+                source_file.write("import unittest\nANSWER = 1\n")
+
+            loader = registry.SolutionLoader(path)
+            namespace = {}
+            dont_write_bytecode = sys.dont_write_bytecode
+            sys.dont_write_bytecode = False
+            try:
+                exec(loader.get_code(), namespace)
+            finally:
+                sys.dont_write_bytecode = dont_write_bytecode
+            self.assertEqual(1, namespace["ANSWER"])
+            self.assertNotIn("unittest", namespace)
+
+            cache_path = importlib.util.cache_from_source(path, optimization=registry.CACHE_TAG)
+            self.assertTrue(os.path.exists(cache_path))
+            self.assertEqual(compile("ANSWER = 1\n", path, "exec").co_consts, loader.get_code().co_consts)
+
+            # a change to the source is picked up, whatever the cache holds
+            with open(path, "w") as source_file:
+                source_file.write("ANSWER = 22\n")
+            os.utime(path, ns=(1, 1))
+            namespace = {}
+            exec(loader.get_code(), namespace)
+            self.assertEqual(22, namespace["ANSWER"])
+
+    def test_root_package(self):
+        # the repository imported as a package offers the same registry
+        spec = importlib.util.spec_from_file_location("foobar_root", os.path.join(registry.ROOT, "__init__.py"),
+                                                      submodule_search_locations=[registry.ROOT])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules["foobar_root"] = package
+        try:
+            spec.loader.exec_module(package)
+            solver = package.get_solver("queue_to_do")
+
+            self.assertEqual(2, solver(0, 3))
+            self.assertEqual("foobar_root.registry.queue_to_do", solver.__module__)
+        finally:
+            for name in [name for name in sys.modules if name.split(".")[0] == "foobar_root"]:
+                del sys.modules[name]
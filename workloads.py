@@ -0,0 +1,500 @@
+"""
+Seeded workload generators for the nine challenges, for load tests and benchmarks.
+
+Every generator takes a seed and yields its inputs lazily, so a workload of any size costs only the memory of the
+input being generated. The same seed always gives the same inputs. Long texts (cipher text, digit strings) come in
+chunks, drawn with Random.randbytes() and translated to the right alphabet in C, so they are made at over a hundred
+megabytes per second.
+
+    python workloads.py cipher --size 2000000000 --output cipher.txt
+    python workloads.py digits --size 100000 --output n.txt
+    python workloads.py jobs --count 100000 --output jobs.jsonl
+
+The jobs are JSON lines of the form {"problem": "queue_to_do", "args": [17, 4]}, with the arguments to pass to that
+problem's solution().
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+# The size of each chunk of the long texts
+CHUNK_SIZE = 1 << 20
+
+LOWERCASE = b"abcdefghijklmnopqrstuvwxyz"
+
+# Mostly lowercase letters, which are the ones the cipher changes, with some of everything else
+CIPHER_ALPHABET = LOWERCASE * 6 + b"ABCDEFGHIJKLMNOPQRSTUVWXYZ !?'.,"
+
+DIGITS = b"0123456789"
+
+# The largest values the problem statements allow
+MAX_SQUARE = 63
+MAX_WORKER_ID = 2000000000
+MAX_BRICKS = 200
+MAX_BANANAS = (1 << 30) - 1
+MAX_TIME_LIMIT = 999
+
+# The time given to corridors left out of a sparse corridor map, when it is written as a dense times matrix
+MISSING_CORRIDOR_TIME = 10 ** 6
+
+
+def _translation_table(alphabet):
+    """
+    A bytes.translate() table that maps every byte to a character of the alphabet, nearly uniformly.
+    """
+    return bytes(alphabet[byte % len(alphabet)] for byte in range(256))
+
+
+_CIPHER_TABLE = _translation_table(CIPHER_ALPHABET)
+_DIGIT_TABLE = _translation_table(DIGITS)
+_NONZERO_DIGIT_TABLE = _translation_table(DIGITS[1:])
+
+
+def cipher_text(generator, size):
+    """
+    :param generator: a random.Random
+    :param size: the number of characters
+    :return: a random message for Lance and Janice
+    """
+    return generator.randbytes(size).translate(_CIPHER_TABLE).decode("ascii")
+
+
+def cipher_text_chunks(size, seed=0, chunk_size=CHUNK_SIZE):
+    """
+    :param size: the total number of characters
+    :return: a generator of chunks of one random message, each at most chunk_size long
+    """
+    generator = random.Random("cipher/%s" % (seed,))
+
+    for start in range(0, size, chunk_size):
+        yield cipher_text(generator, min(chunk_size, size - start))
+
+
+def digit_string(generator, digits):
+    """
+    :param generator: a random.Random
+    :param digits: the number of digits, at least 1
+    :return: the decimal digits of a random positive integer with exactly that many digits
+    """
+    first = generator.randbytes(1).translate(_NONZERO_DIGIT_TABLE)
+
+    return (first + generator.randbytes(digits - 1).translate(_DIGIT_TABLE)).decode("ascii")
+
+
+def digit_chunks(digits, seed=0, chunk_size=CHUNK_SIZE):
+    """
+    :param digits: the total number of digits, at least 1
+    :return: a generator of chunks of the digits of one random positive integer
+    """
+    generator = random.Random("digits/%s" % (seed,))
+
+    yield digit_string(generator, min(chunk_size, digits))
+    for start in range(chunk_size, digits, chunk_size):
+        yield generator.randbytes(min(chunk_size, digits - start)).translate(_DIGIT_TABLE).decode("ascii")
+
+
+def digit_strings(count, digits, seed=0):
+    """
+    Pellet counts for the fuel injection problem, or n for the lasers.
+
+    :return: a generator of 'count' random digit strings, each 'digits' long
+    """
+    generator = random.Random("digit strings/%s" % (seed,))
+
+    for _ in range(count):
+        yield digit_string(generator, digits)
+
+
+def knight_move(generator, squares=MAX_SQUARE + 1):
+    """
+    :return: a random (src, dest) pair of squares
+    """
+    return generator.randrange(squares), generator.randrange(squares)
+
+
+def knight_moves(count, seed=0):
+    """
+    :return: a generator of 'count' random (src, dest) pairs
+    """
+    generator = random.Random("knight/%s" % (seed,))
+
+    for _ in range(count):
+        yield knight_move(generator)
+
+
+def flux_query(generator, height, labels=10000):
+    """
+    :param height: the height h of the tree of converters
+    :param labels: the number of labels to look up, at most the number of converters in the tree
+    :return: (h, q) with q a list of distinct random labels
+    """
+    converters = (1 << height) - 1
+
+    return height, generator.sample(range(1, converters + 1), min(labels, converters))
+
+
+def flux_queries(count, height=30, labels=10000, seed=0):
+    """
+    :return: a generator of 'count' random (h, q) label batches
+    """
+    generator = random.Random("flux/%s" % (seed,))
+
+    for _ in range(count):
+        yield flux_query(generator, height, labels)
+
+
+def checkpoint_line(generator, length):
+    """
+    :return: a random (start, length), with start + length^2 within the largest worker ID
+    """
+    return generator.randrange(MAX_WORKER_ID - length * length + 1), length
+
+
+def checkpoint_lines(count, max_length=44721, seed=0):
+    """
+    :return: a generator of 'count' random (start, length) queries, with lengths from 1 to max_length
+    """
+    generator = random.Random("checkpoint/%s" % (seed,))
+
+    for _ in range(count):
+        yield checkpoint_line(generator, generator.randint(1, max_length))
+
+
+def brick_counts(count, low=3, high=MAX_BRICKS, seed=0):
+    """
+    :return: a generator of 'count' random numbers of bricks from low to high
+    """
+    generator = random.Random("bricks/%s" % (seed,))
+
+    for _ in range(count):
+        yield generator.randint(low, high)
+
+
+def banana_list(generator, trainers, duplicate_fraction=0.0, ending_fraction=0.0, common_factor=1,
+                max_bananas=MAX_BANANAS):
+    """
+    A random list of banana counts, with some control over the structure that decides which trainers can be paired.
+
+    Two trainers wrestle forever unless (a + b) / gcd(a, b) is a power of two. A fraction of the trainers are made in
+    pairs for which it is, from a = s * x and b = s * (2^k - x) with x odd, and a fraction are copies of earlier
+    counts. Every count is a multiple of common_factor.
+
+    :param generator: a random.Random
+    :param trainers: the length of the list
+    :param duplicate_fraction: the fraction of counts copied from earlier in the list
+    :param ending_fraction: the fraction of counts made in pairs whose thumb wrestling ends
+    :param common_factor: a factor shared by every count
+    :param max_bananas: the largest count
+    :return: the list, in random order
+    """
+    top = max_bananas // common_factor
+    bananas = []
+
+    while len(bananas) < trainers:
+        roll = generator.random()
+
+        if bananas and roll < duplicate_fraction:
+            bananas.append(generator.choice(bananas))
+        elif roll < duplicate_fraction + ending_fraction and trainers - len(bananas) >= 2 and top >= 2:
+            power = 1 << generator.randrange(1, top.bit_length())
+            x = generator.randrange(1, power, 2)
+            scale = common_factor * generator.randint(1, top // power)
+            bananas += [scale * x, scale * (power - x)]
+        else:
+            bananas.append(common_factor * generator.randint(1, top))
+
+    generator.shuffle(bananas)
+
+    return bananas
+
+
+def banana_lists(count, trainers, seed=0, **options):
+    """
+    :param options: passed on to banana_list()
+    :return: a generator of 'count' random banana lists
+    """
+    generator = random.Random("bananas/%s" % (seed,))
+
+    for _ in range(count):
+        yield banana_list(generator, trainers, **options)
+
+
+def corridor_edges(generator, size, density=1.0, negative_cycle=False):
+    """
+    A random corridor map with size - 2 bunnies, as a list of (source, target, time) corridors.
+
+    Each time is a non-negative base time plus p(source) - p(target), for a random potential p on the nodes, so some
+    times are negative but every cycle takes the sum of its base times, which is never negative. With negative_cycle,
+    one pair of corridors is then changed to make a loop that takes less than no time.
+
+    :param generator: a random.Random
+    :param size: the number of nodes, the start and the bulkhead included
+    :param density: the chance that each corridor exists
+    :param negative_cycle: whether the map should have a negative cycle
+    :return: the list of corridors
+    """
+    potentials = [generator.randrange(6) for _ in range(size)]
+    edges = {}
+
+    for source in range(size):
+        for target in range(size):
+            if source != target and generator.random() < density:
+                edges[source, target] = generator.randrange(10) + potentials[source] - potentials[target]
+
+    if negative_cycle and size >= 2:
+        source, target = generator.sample(range(size), 2)
+        time = edges.setdefault((source, target), generator.randrange(10))
+        edges[target, source] = -time - 1
+
+    return [(source, target, time) for (source, target), time in sorted(edges.items())]
+
+
+def corridor_times(edges, size):
+    """
+    :return: the corridors from corridor_edges() as a dense times matrix, with MISSING_CORRIDOR_TIME for those that
+             are left out
+    """
+    times = [[0 if row == column else MISSING_CORRIDOR_TIME for column in range(size)] for row in range(size)]
+
+    for source, target, time in edges:
+        times[source][target] = time
+
+    return times
+
+
+def corridor_csr(edges, size):
+    """
+    :return: the corridors from corridor_edges() as compressed sparse rows (indptr, indices, weights), ready for
+             CSRGraph in RunningWithBunnies
+    """
+    indptr = [0] * (size + 1)
+    for source, _, _ in edges:
+        indptr[source + 1] += 1
+    for node in range(size):
+        indptr[node + 1] += indptr[node]
+
+    # corridor_edges() returns the corridors sorted by source
+    return indptr, [target for _, target, _ in edges], [time for _, _, time in edges]
+
+
+def rescue_inputs(count, size, density=1.0, negative_cycle_fraction=0.0, sparse=False, seed=0):
+    """
+    :param sparse: yield the maps as (indptr, indices, weights) rather than times matrices
+    :return: a generator of 'count' random (corridor map, time_limit) pairs
+    """
+    generator = random.Random("corridors/%s" % (seed,))
+
+    for _ in range(count):
+        edges = corridor_edges(generator, size, density, generator.random() < negative_cycle_fraction)
+        corridors = corridor_csr(edges, size) if sparse else corridor_times(edges, size)
+        yield corridors, generator.randint(0, MAX_TIME_LIMIT)
+
+
+def _rescue_arguments(generator, size):
+    return [corridor_times(corridor_edges(generator, size), size), generator.randrange(20)]
+
+
+# For each problem, a function of (generator, size) that returns the arguments for one call to its solution(), and
+# the default size
+PROBLEM_WORKLOADS = {
+    "lance_and_janice": (lambda generator, size: [cipher_text(generator, size)], 1000),
+    "dont_get_volunteered": (lambda generator, size: list(knight_move(generator, size * size)), 8),
+    "ion_flux_relabeling": (lambda generator, size: list(flux_query(generator, size, 1000)), 30),
+    "queue_to_do": (lambda generator, size: list(checkpoint_line(generator, size)), 1000),
+    "grandest_staircase": (lambda generator, size: [size], MAX_BRICKS),
+    "fuel_injection_perfection": (lambda generator, size: [digit_string(generator, size)], 309),
+    "distract_the_trainers": (lambda generator, size: [banana_list(generator, size)], 100),
+    "running_with_bunnies": (_rescue_arguments, 7),
+    "dodge_the_lasers": (lambda generator, size: [digit_string(generator, size)], 101),
+}
+
+
+def make_arguments(problem, generator, size=None):
+    """
+    :param problem: one of the keys of PROBLEM_WORKLOADS
+    :param generator: a random.Random
+    :param size: the size of the input; defaults to the largest the problem statement allows
+    :return: a list of arguments for one call to the problem's solution()
+    """
+    if problem not in PROBLEM_WORKLOADS:
+        raise ValueError("unknown problem %r, expected one of %s" % (problem, ", ".join(sorted(PROBLEM_WORKLOADS))))
+
+    make, default_size = PROBLEM_WORKLOADS[problem]
+
+    return make(generator, default_size if size is None else size)
+
+
+def jobs(count, problems=None, sizes=None, seed=0):
+    """
+    A mixed stream of jobs, each naming a problem and the arguments for its solution().
+
+    :param count: the number of jobs
+    :param problems: the problems to draw from, at random; defaults to all of them
+    :param sizes: a dict of input sizes by problem, for the problems that should not use the default size
+    :return: a generator of {"problem": name, "args": [...]} dicts
+    """
+    generator = random.Random("jobs/%s" % (seed,))
+    problems = sorted(problems or PROBLEM_WORKLOADS)
+    sizes = sizes or {}
+
+    for _ in range(count):
+        problem = generator.choice(problems)
+        yield {"problem": problem, "args": make_arguments(problem, generator, sizes.get(problem))}
+
+
+def write_chunks(output, chunks):
+    """
+    Write chunks of text to an open file as they are generated.
+
+    :return: the number of characters written
+    """
+    written = 0
+    for chunk in chunks:
+        output.write(chunk)
+        written += len(chunk)
+
+    return written
+
+
+def write_jsonl(output, records):
+    """
+    Write records to an open file as JSON lines, as they are generated.
+
+    :return: the number of records written
+    """
+    written = 0
+    for record in records:
+        output.write(json.dumps(record, separators=(",", ":")))
+        output.write("\n")
+        written += 1
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write seeded workloads for the challenge solutions.")
+    parser.add_argument("kind", choices=["cipher", "digits", "jobs"])
+    parser.add_argument("--size", type=int, default=CHUNK_SIZE, help="characters of cipher text, or digits")
+    parser.add_argument("--count", type=int, default=1000, help="the number of jobs")
+    parser.add_argument("--problem", action="append", dest="problems", help="a problem to make jobs for; repeatable")
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--output", default="-", help="the file to write to (default: stdout)")
+    arguments = parser.parse_args(argv)
+
+    output = sys.stdout if arguments.output == "-" else open(arguments.output, "w")
+    try:
+        if arguments.kind == "cipher":
+            write_chunks(output, cipher_text_chunks(arguments.size, arguments.seed))
+        elif arguments.kind == "digits":
+            write_chunks(output, digit_chunks(arguments.size, arguments.seed))
+        else:
+            write_jsonl(output, jobs(arguments.count, arguments.problems, seed=arguments.seed))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    return 0
+
+
+class WorkloadTests(unittest.TestCase):
+    """
+    Check that the workloads are reproducible and within the limits of each problem.
+    """
+
+    def test_reproducible(self):
+        self.assertEqual(list(jobs(50, seed=3)), list(jobs(50, seed=3)))
+        self.assertNotEqual(list(jobs(50, seed=3)), list(jobs(50, seed=4)))
+        self.assertEqual("".join(cipher_text_chunks(1000, seed=1, chunk_size=64)),
+                         "".join(cipher_text_chunks(1000, seed=1, chunk_size=64)))
+
+    def test_lazy(self):
+        # a stream far too long to hold in memory is fine as long as only the start of it is read
+        chunks = cipher_text_chunks(1 << 50, chunk_size=100)
+
+        self.assertEqual(100, len(next(chunks)))
+        self.assertEqual(7, len(list(digit_strings(7, 5))))
+
+    def test_chunks(self):
+        text = "".join(cipher_text_chunks(1000, chunk_size=64))
+        digits = "".join(digit_chunks(1000, chunk_size=64))
+
+        self.assertEqual(1000, len(text))
+        self.assertTrue(set(text) <= set(CIPHER_ALPHABET.decode()))
+        self.assertEqual(1000, len(digits))
+        self.assertTrue(digits.isdigit())
+        self.assertNotEqual("0", digits[0])
+
+    def test_limits(self):
+        generator = random.Random(0)
+
+        for start, length in checkpoint_lines(200, seed=1):
+            self.assertLessEqual(start + length * length, MAX_WORKER_ID)
+        for height, labels in flux_queries(3, height=10, labels=2000):
+            self.assertEqual(1023, len(set(labels)))
+            self.assertTrue(all(1 <= label <= 1023 for label in labels))
+        for src, dest in knight_moves(100):
+            self.assertTrue(0 <= src <= MAX_SQUARE and 0 <= dest <= MAX_SQUARE)
+        self.assertTrue(all(3 <= bricks <= MAX_BRICKS for bricks in brick_counts(100)))
+        self.assertEqual(309, len(make_arguments("fuel_injection_perfection", generator)[0]))
+
+    def test_banana_structure(self):
+        generator = random.Random(5)
+
+        bananas = banana_list(generator, 1000, duplicate_fraction=0.5, common_factor=6)
+        self.assertEqual(1000, len(bananas))
+        self.assertTrue(all(count % 6 == 0 and 0 < count <= MAX_BANANAS for count in bananas))
+        self.assertLess(len(set(bananas)), 700)
+
+        # made only in ending pairs, so every count has a partner it doesn't loop forever with
+        bananas = banana_list(generator, 200, ending_fraction=1.0)
+        for i, a in enumerate(bananas):
+            ratios = [(a + b) // math.gcd(a, b) for j, b in enumerate(bananas) if j != i]
+            self.assertTrue(any(ratio & (ratio - 1) == 0 for ratio in ratios))
+
+    def test_corridors(self):
+        generator = random.Random(7)
+
+        for negative_cycle in (False, True):
+            for _ in range(50):
+                edges = corridor_edges(generator, 6, density=0.5, negative_cycle=negative_cycle)
+                times = corridor_times(edges, 6)
+
+                # Floyd-Warshall, to look for a negative cycle on the diagonal
+                for k in range(6):
+                    for i in range(6):
+                        for j in range(6):
+                            times[i][j] = min(times[i][j], times[i][k] + times[k][j])
+                self.assertEqual(negative_cycle, any(times[i][i] < 0 for i in range(6)))
+
+        indptr, indices, weights = corridor_csr([(0, 1, 5), (0, 2, -1), (2, 0, 3)], 3)
+        self.assertEqual(([0, 2, 2, 3], [1, 2, 0], [5, -1, 3]), (indptr, indices, weights))
+
+        (indptr, _, _), time_limit = next(rescue_inputs(1, 5, density=0.3, sparse=True))
+        self.assertEqual(6, len(indptr))
+        self.assertTrue(0 <= time_limit <= MAX_TIME_LIMIT)
+
+    def test_jobs(self):
+        records = list(jobs(200, problems=["queue_to_do", "grandest_staircase"], sizes={"grandest_staircase": 50}))
+
+        self.assertEqual({"queue_to_do", "grandest_staircase"}, set(record["problem"] for record in records))
+        self.assertTrue(all(record["args"] == [50] for record in records if record["problem"] == "grandest_staircase"))
+        self.assertRaises(ValueError, make_arguments, "no_such_problem", random.Random())
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.jsonl")
+            main(["jobs", "--count", "20", "--problem", "queue_to_do", "--output", path])
+
+            with open(path) as jobs_file:
+                lines = [json.loads(line) for line in jobs_file]
+        self.assertEqual(20, len(lines))
+        self.assertEqual("queue_to_do", lines[0]["problem"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())